@@ -0,0 +1,228 @@
+'''
+Módulo agregaciones
+Motor de agregación en una sola pasada. Cada agregación se describe con una
+tupla Agregacion(inicial, paso, final): inicial crea el estado vacío, paso lo
+actualiza con un avistamiento y final convierte el estado en el resultado.
+La función agrega recorre los avistamientos una sola vez y actualiza todas las
+agregaciones registradas a la vez.
+'''
+from collections import namedtuple, Counter, defaultdict
+from heapq import heappush, heapreplace
+from itertools import count
+
+## Definición de tipos
+Agregacion = namedtuple('Agregacion', 'inicial, paso, final')
+
+
+def _identidad(estado):
+    return estado
+
+
+## Motor
+def agrega(avistamientos, agregaciones):
+    '''
+    Calcula varias agregaciones recorriendo los avistamientos una sola vez.
+
+    @param avistamientos: avistamientos sobre los que se calculan las agregaciones
+    @type avistamientos: iterable de Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+    @param agregaciones: diccionario cuyas claves son nombres y cuyos valores son agregaciones
+    @type agregaciones: {str: Agregacion}
+    @return: diccionario con el resultado de cada agregación, con los mismos nombres
+    @rtype: {str: object}
+    '''
+    nombres = list(agregaciones)
+    estados = [agregaciones[nombre].inicial() for nombre in nombres]
+    pasos = [(agregaciones[nombre].paso, estado) for nombre, estado in zip(nombres, estados)]
+    for a in avistamientos:
+        for paso, estado in pasos:
+            paso(estado, a)
+    return {nombre: agregaciones[nombre].final(estado)
+            for nombre, estado in zip(nombres, estados)}
+
+
+def agrega_una(avistamientos, agregacion):
+    '''
+    Calcula una sola agregación sobre los avistamientos.
+
+    @param avistamientos: avistamientos sobre los que se calcula la agregación
+    @type avistamientos: iterable de Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+    @param agregacion: agregación a calcular
+    @type agregacion: Agregacion
+    @return: resultado de la agregación
+    '''
+    return agrega(avistamientos, {'res': agregacion})['res']
+
+
+## Tipos de agregaciones
+# En todas ellas, clave, valor y orden son funciones que reciben un avistamiento,
+# y filtro (opcional) es una función que indica si el avistamiento se tiene en cuenta.
+def cuenta_por(clave, filtro=None):
+    '''
+    Agregación que cuenta los avistamientos por clave.
+
+    @param clave: función que devuelve la clave de un avistamiento
+    @type clave: función
+    @param filtro: función que indica si el avistamiento se cuenta
+    @type filtro: función, optional
+    @return: agregación cuyo resultado es un Counter {clave: número de avistamientos}
+    @rtype: Agregacion
+    '''
+    if filtro is None:
+        def paso(estado, a):
+            estado[clave(a)] += 1
+    else:
+        def paso(estado, a):
+            if filtro(a):
+                estado[clave(a)] += 1
+    return Agregacion(Counter, paso, _identidad)
+
+
+def suma_por(clave, valor, filtro=None):
+    '''
+    Agregación que suma un valor de los avistamientos por clave.
+
+    @param clave: función que devuelve la clave de un avistamiento
+    @type clave: función
+    @param valor: función que devuelve el valor a sumar de un avistamiento
+    @type valor: función
+    @param filtro: función que indica si el avistamiento se tiene en cuenta
+    @type filtro: función, optional
+    @return: agregación cuyo resultado es un diccionario {clave: suma}
+    @rtype: Agregacion
+    '''
+    def paso(estado, a):
+        if filtro is None or filtro(a):
+            estado[clave(a)] += valor(a)
+    return Agregacion(lambda: defaultdict(int), paso, dict)
+
+
+def clave_mas_frecuente(clave, filtro=None):
+    '''
+    Agregación que devuelve la clave con más avistamientos (si hay empate,
+    la que apareció antes).
+
+    @param clave: función que devuelve la clave de un avistamiento
+    @type clave: función
+    @param filtro: función que indica si el avistamiento se cuenta
+    @type filtro: función, optional
+    @return: agregación cuyo resultado es la clave más frecuente
+    @rtype: Agregacion
+    '''
+    contador = cuenta_por(clave, filtro)
+    return contador._replace(final=lambda c: max(c.items(), key=lambda t: t[1])[0])
+
+
+def distintos_por(clave, valor, filtro=None):
+    '''
+    Agregación que agrupa, por clave, el conjunto de valores distintos.
+
+    @param clave: función que devuelve la clave de un avistamiento
+    @type clave: función
+    @param valor: función que devuelve el valor a agrupar de un avistamiento
+    @type valor: función
+    @param filtro: función que indica si el avistamiento se tiene en cuenta
+    @type filtro: función, optional
+    @return: agregación cuyo resultado es un defaultdict {clave: {valor}}
+    @rtype: Agregacion
+    '''
+    def paso(estado, a):
+        if filtro is None or filtro(a):
+            estado[clave(a)].add(valor(a))
+    return Agregacion(lambda: defaultdict(set), paso, _identidad)
+
+
+def agrupa_por(clave, filtro=None):
+    '''
+    Agregación que agrupa los avistamientos por clave, en conjuntos.
+
+    @param clave: función que devuelve la clave de un avistamiento
+    @type clave: función
+    @param filtro: función que indica si el avistamiento se tiene en cuenta
+    @type filtro: función, optional
+    @return: agregación cuyo resultado es un defaultdict {clave: {Avistamiento}}
+    @rtype: Agregacion
+    '''
+    return distintos_por(clave, _identidad, filtro)
+
+
+def media_por(clave, valor, filtro=None):
+    '''
+    Agregación que calcula, por clave, la media de un valor. Solo guarda
+    la suma y el número de valores de cada clave.
+
+    @param clave: función que devuelve la clave de un avistamiento
+    @type clave: función
+    @param valor: función que devuelve el valor numérico de un avistamiento
+    @type valor: función
+    @param filtro: función que indica si el avistamiento se tiene en cuenta
+    @type filtro: función, optional
+    @return: agregación cuyo resultado es un diccionario {clave: media}
+    @rtype: Agregacion
+    '''
+    def paso(estado, a):
+        if filtro is None or filtro(a):
+            k = clave(a)
+            estado[0][k] += valor(a)
+            estado[1][k] += 1
+
+    def final(estado):
+        sumas, cuentas = estado
+        return {k: suma / cuentas[k] for k, suma in sumas.items()}
+    return Agregacion(lambda: (defaultdict(int), defaultdict(int)), paso, final)
+
+
+def maximo(orden, filtro=None):
+    '''
+    Agregación que devuelve el avistamiento con mayor valor de orden (si hay
+    empate, el que apareció antes), o None si no hay ninguno.
+
+    @param orden: función que devuelve el valor por el que se compara un avistamiento
+    @type orden: función
+    @param filtro: función que indica si el avistamiento se tiene en cuenta
+    @type filtro: función, optional
+    @return: agregación cuyo resultado es el avistamiento máximo
+    @rtype: Agregacion
+    '''
+    def paso(estado, a):
+        if filtro is None or filtro(a):
+            v = orden(a)
+            if not estado or v > estado[0]:
+                estado[:] = [v, a]
+    return Agregacion(list, paso, lambda estado: estado[1] if estado else None)
+
+
+def top_n_por(clave, n, orden, filtro=None):
+    '''
+    Agregación que guarda, por clave, los n avistamientos con mayor valor de
+    orden, usando un montículo de tamaño n como mucho por clave. Si hay empates
+    se prefieren los avistamientos que aparecieron antes (igual que al ordenar
+    con sorted(..., reverse=True) y quedarse con los n primeros).
+
+    @param clave: función que devuelve la clave de un avistamiento
+    @type clave: función
+    @param n: número de avistamientos a guardar por clave
+    @type n: int
+    @param orden: función que devuelve el valor por el que se ordenan los avistamientos
+    @type orden: función
+    @param filtro: función que indica si el avistamiento se tiene en cuenta
+    @type filtro: función, optional
+    @return: agregación cuyo resultado es un diccionario {clave: [avistamientos]}
+         con las listas ordenadas de mayor a menor valor de orden
+    @rtype: Agregacion
+    '''
+    def paso(estado, a):
+        if filtro is None or filtro(a):
+            monticulos, contador = estado
+            monticulo = monticulos[clave(a)]
+            v = orden(a)
+            if len(monticulo) < n:
+                heappush(monticulo, (v, -next(contador), a))
+            # Con el montículo lleno, un avistamiento posterior solo entra si supera
+            # estrictamente al menor (en caso de empate gana el que llegó antes)
+            elif monticulo and v > monticulo[0][0]:
+                heapreplace(monticulo, (v, -next(contador), a))
+
+    def final(estado):
+        return {k: [e[2] for e in sorted(monticulo, key=lambda e: e[:2], reverse=True)]
+                for k, monticulo in estado[0].items()}
+    return Agregacion(lambda: (defaultdict(list), count()), paso, final)
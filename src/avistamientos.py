@@ -2,61 +2,135 @@
 Módulo avistamientos
 Adaptación del notebook a proyecto: Toñi Reina
 '''
-import csv
-from datetime import datetime
-import math
 from collections import namedtuple, Counter, defaultdict
 from coordenadas import Coordenadas, distancia_haversine, redondear
-from parsers import parse_datetime
-import statistics
-import locale
+from parsers import parse_datetime, parse_fecha_hora_mdy_memo
+from itertools import islice
+import heapq
+import agregaciones
+from sys import intern
+from instrumentacion import instrumentado
+import importacion_perezosa
+
+# Módulos que solo usan algunas funciones (la lectura del csv, o las consultas
+# con índice o con cubo): se cargan la primera vez que se usan
+csv = importacion_perezosa.importa('csv')
+indice_espacial = importacion_perezosa.importa('indice_espacial')
+indice_fechas = importacion_perezosa.importa('indice_fechas')
+indice_comentarios = importacion_perezosa.importa('indice_comentarios')
+indice_categorias = importacion_perezosa.importa('indice_categorias')
+cubo_avistamientos = importacion_perezosa.importa('cubo_avistamientos')
+intervalos = importacion_perezosa.importa('intervalos')
 
 ## Definición de tipos
 Avistamiento = namedtuple('Avistamiento',
     'fechahora, ciudad, estado, forma, duracion, comentarios, coordenadas')
 
+MESES = ["Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio", "Agosto", "Septiembre",
+         "Octubre", "Noviembre", "Diciembre"]
+
 ## 1. Operaciones de carga de datos
 ### 1.1 Función de lectura de datos
 # Función de lectura que crea una lista de avistamientos
+@instrumentado(filas='salida')
 def lee_avistamientos(fichero):
     '''
-    Lee un fichero de entrada y devuelve una lista de tuplas. 
-    Para convertir la cadena con la fecha y la hora al tipo datetime, usar
-        datetime.strptime(fecha_hora,'%m/%d/%Y %H:%M')    
-    
+    Lee un fichero de entrada y devuelve una lista de tuplas.
+    La cadena con la fecha y la hora se convierte al tipo datetime con
+        parse_fecha_hora_mdy_memo, equivalente a datetime.strptime(fecha_hora,'%m/%d/%Y %H:%M')
+
     @param fichero: ruta del fichero csv que contiene los datos en codificación utf-8 
     @type fichero: str
     @return: lista de tuplas con la información de los avistamientos 
     @rtype: [Avistamiento(datetime, str, str, str, str, int, str, Coordenadas(float, float))]   
     '''
     avistamientos = []
-    with open(fichero, encoding='utf-8') as f:       
+    for bloque in lee_avistamientos_por_bloques(fichero):
+        avistamientos.extend(bloque)
+    return avistamientos  
+
+### 1.2 Lectura por bloques
+@instrumentado(filas='llamada')
+def parse_fecha_strptime(cadena_fecha):
+    '''Conversión de la fecha con strptime, sin atajos. Se mantiene para poder
+    comparar la velocidad de carga con y sin parse_fecha_hora_mdy_memo.'''
+    return parse_datetime(cadena_fecha, '%m/%d/%Y %H:%M')
+
+@instrumentado(filas=None)
+def lee_avistamientos_por_bloques(fichero, tam_bloque=100000,
+                                  parser_fecha=parse_fecha_hora_mdy_memo):
+    '''
+    Lee un fichero de avistamientos en bloques grandes y devuelve un generador
+    de listas de avistamientos, cada una con tam_bloque avistamientos como mucho.
+
+    @param fichero: ruta del fichero csv que contiene los datos en codificación utf-8
+    @type fichero: str
+    @param tam_bloque: número máximo de avistamientos de cada bloque
+    @type tam_bloque: int
+    @param parser_fecha: función que convierte la cadena de la fecha en un datetime
+    @type parser_fecha: función str -> datetime.datetime, optional
+    @return: generador de listas de avistamientos, en el orden del fichero
+    @rtype: generador de [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
+    '''
+    avistamientos = itera_avistamientos(fichero, parser_fecha)
+    while True:
+        bloque = list(islice(avistamientos, tam_bloque))
+        if not bloque:
+            break
+        yield bloque
+
+### 1.3 Lectura perezosa
+@instrumentado(filas='salida')
+def itera_avistamientos(fichero, parser_fecha=parse_fecha_hora_mdy_memo):
+    '''
+    Lee un fichero de avistamientos y devuelve un generador que produce los
+    avistamientos de uno en uno, sin cargar el fichero completo en memoria.
+
+    Todas las funciones de las secciones 2, 3 y 4 aceptan este generador en lugar
+    de la lista de avistamientos. Las que recorren los datos una sola vez lo hacen
+    con memoria constante; las que necesitan tenerlos todos (para ordenarlos o
+    para devolverlos) lo indican en su documentación.
+
+    @param fichero: ruta del fichero csv que contiene los datos en codificación utf-8
+    @type fichero: str
+    @param parser_fecha: función que convierte la cadena de la fecha en un datetime
+    @type parser_fecha: función str -> datetime.datetime, optional
+    @return: generador de avistamientos, en el orden del fichero
+    @rtype: generador de Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+    '''
+    with open(fichero, encoding='utf-8', buffering=1 << 20) as f:
         lector = csv.reader(f)
         next(lector)
         for cadena_fecha, city, state, shape, duration, comments, latitude, longitude \
                 in lector:
-            fecha = parse_datetime(cadena_fecha,'%m/%d/%Y %H:%M')
-            duration = int(duration)
-            coordenadas=Coordenadas(float(latitude), float(longitude))
-            avistamientos.append(Avistamiento(fecha, city, state, shape, duration, \
-                                comments, coordenadas))
-    return avistamientos  
+            # Las cadenas de ciudad, estado y forma se repiten mucho: al internarlas
+            # todos los avistamientos comparten el mismo objeto para cada valor
+            yield Avistamiento(parser_fecha(cadena_fecha), intern(city), intern(state),
+                               intern(shape), int(duration), comments,
+                               Coordenadas(float(latitude), float(longitude)))
 
 ### 2.1 Número de avistamientos producidos en una fecha
-def numero_avistamientos_fecha(avistamientos, fecha):
+@instrumentado
+def numero_avistamientos_fecha(avistamientos, fecha, indice=None):
     ''' Avistamientos que se han producido en una fecha
     
     Toma como entrada una lista de avistamientos y una fecha.
     Devuelve el número de avistamientos que se han producido en esa fecha.
+    Si se pasa un índice por fecha construido sobre los avistamientos, la consulta
+    se hace con el índice y el parámetro avistamientos no se recorre.
 
     @param avistamientos: lista de avistamientos
     @type avistamientos: [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
     @param fecha: fecha del avistamiento 
     @type fecha: datetime.date
+    @param indice: índice por fecha de los avistamientos (ver indice_fechas.crea_indice_fechas)
+    @type indice: IndiceFechas, optional
     @return:  Número de avistamientos producidos en la fecha 
     @rtype: int
     
     '''
+    if indice is not None:
+        return indice_fechas.numero_avistamientos_fecha(indice, fecha)
     cont = 0
     for av in avistamientos:
         if av.fechahora.date() == fecha:
@@ -65,75 +139,98 @@ def numero_avistamientos_fecha(avistamientos, fecha):
 
 
 # Por comprensión
+@instrumentado
 def numero_avistamientos_fecha2(avistamientos, fecha):
     return sum(1 for av in avistamientos if av.fechahora.date() == fecha)
 
 ### 2.2 Número de formas observadas en un conjunto de estados
-def formas_estados(avistamientos, estados):
+@instrumentado
+def formas_estados(avistamientos, estados, indice=None):
     ''' 
     Devuelve el número de formas distintas observadas en avistamientos 
     producidos en alguno de los estados especificados.
+    Si se pasa un índice de categorías, se calcula con sus mapas de bits.
     @param avistamientos: lista de tuplas con la información de los avistamientos
     @type avistamientos: [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float)))]
     @param estados: conjunto de estados para los que se quiere hacer el cálculo 
     @type estados: {str}
+    @param indice: índice de categorías de los avistamientos (ver indice_categorias.crea_indice_categorias)
+    @type indice: IndiceCategorias, optional
     @return: Número de formas distintas observadas en los avistamientos producidos
          en alguno de los estados indicados por el parámetro "estados"
     @rtype: int
     '''
+    if indice is not None:
+        return indice_categorias.formas_estados(indice, estados)
     conjunto_formas = set()
     for a in avistamientos:
         if a.estado in estados:
             conjunto_formas.add(a.forma)
     return len(conjunto_formas)
 
+@instrumentado
 def formas_estados2(avistamientos, estados):
     # Por comprensión
     return len({a.forma for a in avistamientos if a.estado in estados})
     
 ### 2.3 Duración total de los avistamientos en un estado
-def duracion_total(avistamientos, estado):
+@instrumentado
+def duracion_total(avistamientos, estado, indice=None):
     ''' 
     Devuelve la duración total de los avistamientos de un estado. 
+    Si se pasa un índice de categorías, solo se suman las duraciones de su estado.
     
     @param avistamientos: lista de tuplas con la información de los avistamientos 
     @type avistamientos: [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float)))]
     @param estado: estado para el que se quiere hacer el cálculo
     @type estado: str
+    @param indice: índice de categorías de los avistamientos (ver indice_categorias.crea_indice_categorias)
+    @type indice: IndiceCategorias, optional
     @return: duración total en segundos de todos los avistamientos del estado 
     @rtype: int
     '''
+    if indice is not None:
+        return indice_categorias.duracion_total(indice, estado)
     duracion = 0
     for a in avistamientos:
         if a.estado == estado:
             duracion += a.duracion
     return duracion
 
+@instrumentado
 def duracion_total2(avistamientos, estado):
     ## Por compresión
     return sum(a.duracion for a in avistamientos if a.estado == estado)
 
 
 ### 2.4 Avistamientos cercanos a una ubicación
-def avistamientos_cercanos_ubicacion(avistamientos, ubicacion, radio):
+@instrumentado
+def avistamientos_cercanos_ubicacion(avistamientos, ubicacion, radio, indice=None):
     ''' 
     Devuelve el conjunto de avistamientos cercanos a una ubicación.
+    Si se pasa un índice espacial construido sobre los avistamientos, la búsqueda
+    se hace con el índice y el parámetro avistamientos no se recorre.
     @param avistamientos: lista de tuplas con la información de los avistamientos
     @type avistamientos: [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float)))]
     @param ubicacion: coordenadas de la ubicación para la cual queremos encontrar avistamientos cercanos 
     @type ubicacion: Coordenadas (float, float)
     @param radio: radio de distancia
     @param radio: float
+    @param indice: índice espacial de los avistamientos (ver indice_espacial.crea_indice_espacial)
+    @type indice: IndiceEspacial, optional
     @return:Conjunto de avistamientos que se encuentran a una distancia
          inferior al valor "radio" de la ubicación dada por el parámetro "ubicacion" 
     @rtype: {Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))}
     '''
+    if indice is not None:
+        return set(indice_espacial.cercanos(indice, ubicacion, radio))
     conjunto_avistamientos = set()
     for a in avistamientos:
         if distancia_haversine(a.coordenadas, ubicacion) < radio:
             conjunto_avistamientos.add(a)
     return conjunto_avistamientos
 
+@instrumentado
 def avistamientos_cercanos_ubicacion2(avistamientos, ubicacion, radio):
     ## Por compresión
     # TODO: Para casa
@@ -143,17 +240,23 @@ def avistamientos_cercanos_ubicacion2(avistamientos, ubicacion, radio):
 ## Operaciones con máximos y mínimos
 ### 3.1 Avistamiento de una forma con mayor duración
 
-def avistamiento_mayor_duracion(avistamientos, forma):
+@instrumentado
+def avistamiento_mayor_duracion(avistamientos, forma, indice=None):
     '''
     Devuelve el avistamiento de mayor duración de entre todos los
     avistamientos de una forma dada.
+    Si se pasa un índice de categorías, solo se miran los avistamientos de su forma.
     @param avistamientos: lista de tuplas con la información de los avistamientos 
     @type [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
     @param forma: forma del avistamiento 
     @type forma: str
+    @param indice: índice de categorías de los avistamientos (ver indice_categorias.crea_indice_categorias)
+    @type indice: IndiceCategorias, optional
     @return:  avistamiento más largo de la forma dada
     @rtype: Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
     '''
+    if indice is not None:
+        return indice_categorias.avistamiento_mayor_duracion(indice, forma)
     lista_av_forma = []
     for a in avistamientos:
         if a.forma == forma:
@@ -161,6 +264,7 @@ def avistamiento_mayor_duracion(avistamientos, forma):
     return max(lista_av_forma, key = lambda av:av.duracion) 
     
 
+@instrumentado
 def avistamiento_mayor_duracion2(avistamientos, forma):
     # Por comprension
     # Si uso una expresión por comprensión como primer parámetro de una función
@@ -170,12 +274,15 @@ def avistamiento_mayor_duracion2(avistamientos, forma):
                key = lambda av:av.duracion)
 
 ### 3.2 Avistamiento cercano a un punto con mayor duración
-def avistamiento_cercano_mayor_duracion(avistamientos, coordenadas, radio=0.5):
+@instrumentado
+def avistamiento_cercano_mayor_duracion(avistamientos, coordenadas, radio=0.5, indice=None):
     '''
     Devuelve la duración y los comentarios del avistamiento que más 
     tiempo ha durado de aquellos situados en el entorno de las
     coordenadas que se pasan como parámetro de entrada.
     El resultado debe ser una tupla de la forma (duración, comentarios)
+    Si se pasa un índice espacial construido sobre los avistamientos, la búsqueda
+    se hace con el índice y el parámetro avistamientos no se recorre.
     
     @param avistamientos: lista de tuplas con la información de los avistamientos 
     @type [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
@@ -183,9 +290,14 @@ def avistamiento_cercano_mayor_duracion(avistamientos, coordenadas, radio=0.5):
     @type coordenadas: Coordenadas (float, float)
     @param radio: radio de búsqueda
     @type radio: float
+    @param indice: índice espacial de los avistamientos (ver indice_espacial.crea_indice_espacial)
+    @type indice: IndiceEspacial, optional
     @return: duración y comentarios del avistamiento más largo en el entorno de las coordenadas comentarios del avistamiento más largo
     @rtype: int, str
     '''
+    if indice is not None:
+        return max((a.duracion, a.comentarios)
+                   for a in indice_espacial.cercanos(indice, coordenadas, radio))
     avistamientos_cercanos = []
     for a in avistamientos:
         if distancia_haversine(a.coordenadas, coordenadas) < radio:
@@ -198,6 +310,7 @@ def avistamiento_cercano_mayor_duracion(avistamientos, coordenadas, radio=0.5):
     # avistamiento_mas_largo = max(avistamientos_cercanos, key= lambda a:a.duracion)
     # return (avistamiento_mas_largo.duracion, avistamiento_mas_largo.comentario)
 
+@instrumentado
 def avistamiento_cercano_mayor_duracion2(avistamientos, coordenadas, radio=0.5):
     # Por comprensión
     return max((a.duracion, a.comentarios) 
@@ -207,7 +320,8 @@ def avistamiento_cercano_mayor_duracion2(avistamientos, coordenadas, radio=0.5):
 
 ### 3.3 Avistamientos producidos entre dos fechas
 
-def avistamientos_fechas(avistamientos, fecha_inicial=None, fecha_final=None):
+@instrumentado
+def avistamientos_fechas(avistamientos, fecha_inicial=None, fecha_final=None, indice=None):
     '''
     Devuelve una lista con los avistamientos que han tenido lugar
     entre fecha_inicial y fecha_final (ambas inclusive). La lista devuelta
@@ -222,15 +336,26 @@ def avistamientos_fechas(avistamientos, fecha_inicial=None, fecha_final=None):
     
     Usar el método date() para obtener la fecha de un objeto datetime.
     
+    Si avistamientos es un generador, los avistamientos filtrados se guardan
+    todos en memoria, porque hay que ordenarlos.
+    
+    Si se pasa un índice por fecha construido sobre los avistamientos, la consulta
+    se hace con el índice, ya en el orden pedido, y el parámetro avistamientos
+    no se recorre.
+    
     @param avistamientos: lista de tuplas con la información de los avistamientos 
     @type [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
     @param fecha_inicial: fecha a partir de la cual se devuelven los avistamientos
     @type fecha_inicial:datetime.date
     @param fecha_final: fecha hasta la cual se devuelven los avistamientos
     @type fecha_final: datetime.date
+    @param indice: índice por fecha de los avistamientos (ver indice_fechas.crea_indice_fechas)
+    @type indice: IndiceFechas, optional
     @return: lista de tuplas con la información de los avistamientos en el rango de fechas
     @rtype: [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
     '''
+    if indice is not None:
+        return indice_fechas.avistamientos_entre(indice, fecha_inicial, fecha_final)
     # Vamos a hacerlo directamente por comprensión
     filtrado = [a  for a in avistamientos
                 if (fecha_inicial == None or a.fechahora.date() >= fecha_inicial) and 
@@ -241,11 +366,14 @@ def avistamientos_fechas(avistamientos, fecha_inicial=None, fecha_final=None):
     return filtrado
     
 ### 3.4 Avistamiento de un año con el comentario más largo
-def comentario_mas_largo(avistamientos, anyo, palabra):
+@instrumentado
+def comentario_mas_largo(avistamientos, anyo, palabra, indice=None):
     ''' 
     Devuelve el avistamiento cuyo comentario es el más largo, de entre
     los avistamientos observados en el año dado por el parámetro "anyo"
     y cuyo comentario incluya la palabra recibida en el parámetro "palabra".
+    Si se pasa un índice de comentarios construido sobre los avistamientos, la
+    búsqueda se hace con el índice y el parámetro avistamientos no se recorre.
     
     @param avistamientos: lista de tuplas con la información de los avistamientos 
     @type [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
@@ -253,13 +381,18 @@ def comentario_mas_largo(avistamientos, anyo, palabra):
     @type anyo: int
     @param palabra: palabra que debe incluir el comentario del avistamiento buscado 
     @type palabra: str
+    @param indice: índice de comentarios (ver indice_comentarios.crea_indice_comentarios)
+    @type indice: IndiceComentarios, optional
     @return: avistamiento con el comentario más largo
     @rtype: Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
     '''    
+    if indice is not None:
+        return indice_comentarios.comentario_mas_largo(indice, anyo, palabra)
     filtrado = [a for a in avistamientos 
                 if a.fechahora.year == anyo and palabra in a.comentarios]
     return max(filtrado, key = lambda a:len(a.comentarios))
     
+@instrumentado
 def comentario_mas_largo2(avistamientos, anyo, palabra):
     # Por comprensión
     return max(
@@ -269,49 +402,62 @@ def comentario_mas_largo2(avistamientos, anyo, palabra):
 
 
 ### 3.5 Media de días entre avistamientos consecutivos
-def media_dias_entre_avistamientos(avistamientos, anyo=None):
+@instrumentado
+def media_dias_entre_avistamientos(avistamientos, anyo=None, cronologia=None):
     ''' 
     Devuelve la media de días transcurridos entre dos avistamientos consecutivos.
     Si año es distinto de None, solo se contemplarán los avistamientos del año
-    especificado para hacer el cálculo.
+    especificado para hacer el cálculo. Si se pasa la cronología de los avistamientos,
+    la media se calcula con ella y el parámetro avistamientos no se recorre.
     
     @param avistamientos: lista de tuplas con la información de los avistamientos 
     @type [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
     @param anyo: año para el que se hará la búsqueda 
     @type anyo: int
+    @param cronologia: cronología de los avistamientos (ver intervalos.crea_cronologia)
+    @type cronologia: Cronologia, optional
     @return: media de días transcurridos entre avistamientos. Si no se puede realizar el
     cálculo, devuelve None 
+    
+    Solo se ordenan los ordinales de las fechas, no los avistamientos. Como los
+    intervalos entre días consecutivos suman la diferencia entre el último y el
+    primer día, no hace falta calcularlos.
     @rtype:-float
     '''    
-    # Intenta primero dividir el problema en subproblemas
-    # Para calcular los días entre dos fechas, abre un terminal,
-    # prueba a restar dos fechas de tipo date y observa el tipo
-    # que obtienes.
-    
+    if cronologia is not None:
+        return intervalos.media_dias_entre_avistamientos(cronologia, anyo)
     if anyo != None:
-        avistamientos = [a for a in avistamientos if a.fechahora.year == anyo]
+        avistamientos = (a for a in avistamientos if a.fechahora.year == anyo)
 
-    dias = calcula_dias_entre_avistamientos(avistamientos)
+    dias = sorted(a.fechahora.toordinal() for a in avistamientos)
 
-    if len(dias) == 0:
+    if len(dias) < 2:
         return None
-    return sum(dias)/len(dias)
+    return (dias[-1] - dias[0]) / (len(dias) - 1)
 
+@instrumentado
 def calcula_dias_entre_avistamientos(avistamientos):
     '''Devuelve una lista de enteros con los días que transcurren
-    entre cada dos avistamientos consecutivos en el tiempo.'''
-    avistamientos = sorted(avistamientos)
-
-    res = []
-    for a1, a2 in zip(avistamientos, avistamientos[1:]):
-        res.append(
-            (a2.fechahora.date() - a1.fechahora.date()).days
-        )
-    return res
+    entre cada dos avistamientos consecutivos en el tiempo.
+    Ordena los ordinales de las fechas de los avistamientos (enteros), no los avistamientos.'''
+    dias = sorted(a.fechahora.toordinal() for a in avistamientos)
+    return list(intervalos.intervalos(dias))
         
 ## 4 Operaciones con diccionarios
+# Varias de estas funciones se calculan con el motor de agregaciones
+# (módulo agregaciones). Estas son sus definiciones, que también usa
+# resumen_avistamientos para calcularlas todas en una sola pasada.
+FORMAS_POR_MES = agregaciones.distintos_por(lambda a: MESES[a.fechahora.month - 1],
+                                            lambda a: a.forma)
+NUMERO_POR_AÑO = agregaciones.cuenta_por(lambda a: a.fechahora.year)
+NUMERO_POR_MES = agregaciones.cuenta_por(lambda a: MESES[a.fechahora.month - 1])
+COORDENADAS_MAS_AVISTAMIENTOS = agregaciones.clave_mas_frecuente(lambda a: redondear(a.coordenadas))
+HORA_MAS_AVISTAMIENTOS = agregaciones.clave_mas_frecuente(lambda a: a.fechahora.hour)
+LONGITUD_MEDIA_COMENTARIOS_POR_ESTADO = agregaciones.media_por(lambda a: a.estado,
+                                                               lambda a: len(a.comentarios))
 
 ### 4.1 Avistamientos por fecha
+@instrumentado
 def avistamientos_por_fecha(avistamientos):
     ''' 
     Devuelve un diccionario que indexa los avistamientos por fechas
@@ -321,6 +467,9 @@ def avistamientos_por_fecha(avistamientos):
     @return diccionario en el que las claves son las fechas de los avistamientos 
          y los valores son conjuntos con los avistamientos observados en esa fecha
     @rtype {datetime.date: {Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))}}
+    
+    El diccionario devuelto contiene todos los avistamientos, así que
+    si avistamientos es un generador se guardan todos en memoria.
     '''
     res = defaultdict(set)
     for a in avistamientos:
@@ -329,94 +478,120 @@ def avistamientos_por_fecha(avistamientos):
 
 
 ### 4.2 Formas de avistamientos por mes
-def formas_por_mes(avistamientos):
+@instrumentado
+def formas_por_mes(avistamientos, cubo=None):
     ''' 
     Devuelve un diccionario que indexa las distintas formas de avistamientos
     por los nombres de los meses en que se observan.
     Por ejemplo, para el mes "Enero" se asociará un conjunto con todas las
     formas distintas observadas en dicho mes.
+    Si se pasa un cubo de los avistamientos, se consulta el cubo y el
+    parámetro avistamientos no se recorre.
     
     
     @param avistamientos: lista de tuplas con la información de los avistamientos 
     @type [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
+    @param cubo: cubo de los avistamientos (ver cubo_avistamientos.crea_cubo)
+    @type cubo: CuboAvistamientos, optional
     @return: diccionario en el que las claves son los nombres de los meses 
          y los valores son conjuntos con las formas observadas en cada mes
     @rtype {str: {str}}
     '''
-    meses = ["Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio", "Agosto", "Septiembre",
-             "Octubre", "Noviembre", "Diciembre"]
-    res = defaultdict(set)
-    for a in avistamientos:
-        mes = meses[a.fechahora.month - 1]
-        res[mes].add(a.forma)
-    return res
+    if cubo is not None:
+        res = defaultdict(set)
+        for mes, forma in cubo_avistamientos.agrega(cubo, ('mes', 'forma')):
+            res[MESES[mes - 1]].add(forma)
+        return res
+    return agregaciones.agrega_una(avistamientos, FORMAS_POR_MES)
 
 
 ### 4.3 Número de avistamientos por año
-def numero_avistamientos_por_año(avistamientos):
+@instrumentado
+def numero_avistamientos_por_año(avistamientos, cubo=None):
     '''
     Devuelve el número de avistamientos observados en cada año.
+    Si se pasa un cubo de los avistamientos, se consulta el cubo y el
+    parámetro avistamientos no se recorre.
              
     @param avistamientos: lista de tuplas con la información de los avistamientos 
     @type [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
+    @param cubo: cubo de los avistamientos (ver cubo_avistamientos.crea_cubo)
+    @type cubo: CuboAvistamientos, optional
     @return: diccionario en el que las claves son los años
          y los valores son el número de avistamientos observados en ese año
     @rtype: {int: int}
     '''
-    return Counter(a.fechahora.year for a in avistamientos)
+    if cubo is not None:
+        return Counter(cubo_avistamientos.agrega(cubo, ('año',)))
+    return agregaciones.agrega_una(avistamientos, NUMERO_POR_AÑO)
 
 
 ### 4.4 Número de avistamientos por mes del año
-def num_avistamientos_por_mes(avistamientos):
+@instrumentado
+def num_avistamientos_por_mes(avistamientos, cubo=None):
     '''
     Devuelve el número de avistamientos observados en cada mes del año.
     Usar como claves los nombres de los doce meses con la inicial en mayúsculas.
+    Si se pasa un cubo de los avistamientos, se consulta el cubo y el
+    parámetro avistamientos no se recorre.
 
     @param avistamientos: lista de tuplas con la información de los avistamientos 
     @type [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
+    @param cubo: cubo de los avistamientos (ver cubo_avistamientos.crea_cubo)
+    @type cubo: CuboAvistamientos, optional
     @return:diccionario en el que las claves son los nombres de los meses y 
          los valores son el número de avistamientos observados en ese mes
     @rtype: {str: int}
     '''
-    meses = ["Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio", "Agosto", "Septiembre",
-             "Octubre", "Noviembre", "Diciembre"]
-    return Counter(meses[a.fechahora.month-1] for a in avistamientos)
+    if cubo is not None:
+        return Counter({MESES[mes - 1]: n for mes, n in cubo_avistamientos.agrega(cubo, ('mes',)).items()})
+    return agregaciones.agrega_una(avistamientos, NUMERO_POR_MES)
 
 
 ### 4.5 Coordenadas con mayor número de avistamientos
 
-def coordenadas_mas_avistamientos(avistamientos): 
+@instrumentado
+def coordenadas_mas_avistamientos(avistamientos, mapa=None): 
     '''
     Devuelve las coordenadas enteras que se corresponden con 
     la zona donde más avistamientos se han observado.
 
     Usa la función de coordenadas.py "redondear" para obtener
-    la parte entera de las coordenadas.
+    la parte entera de las coordenadas. Si se pasa un mapa de densidad con
+    celdas de 1° construido sobre los avistamientos, se consulta el mapa y
+    el parámetro avistamientos no se recorre.
     
     @param avistamientos: lista de tuplas con la información de los avistamientos 
     @type [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
+    @param mapa: mapa de densidad de los avistamientos (ver mapa_densidad.MapaDensidad)
+    @type mapa: MapaDensidad, optional
 
     @return: Coordenadas (sin decimales) que acumulan más avistamientos
     @rtype: Coordenadas(float, float)
-    '''   
-    avistamientos_por_coordenadas = Counter(redondear(a.coordenadas) for a in avistamientos)
-    # most_common devuelve una LISTA de las tuplas (clave, valor), por lo que para quedarnos
-    # con la clave (el elemento más frecuente), debemos acceder primero al primer elemento
-    # de esa lista, y después al primer elemento de la tupla (la clave)
-    return avistamientos_por_coordenadas.most_common(1)[0][0]
-
-    # Como Counter es un diccionario, también podemos buscar el máximo de los items
-    # pidiéndole a max que se fije en los conteos (Segundo elemento de los items)
-    return max(avistamientos_por_coordenadas.items(), key = lambda t:t[1])[0]
+    @raise ValueError: si no hay avistamientos, o si el mapa no tiene celdas de 1 grado
+    '''
+    if mapa is not None:
+        if mapa.tam_celda != 1:
+            raise ValueError("El mapa de densidad debe tener celdas de 1 grado")
+        calientes = mapa.puntos_calientes(1)
+        if not calientes:
+            raise ValueError("El mapa de densidad no tiene avistamientos")
+        return calientes[0][0]
+    return agregaciones.agrega_una(avistamientos, COORDENADAS_MAS_AVISTAMIENTOS)
 
 
 ### 4.6 Hora del día con mayor número de avistamientos
-def hora_mas_avistamientos(avistamientos):
+@instrumentado
+def hora_mas_avistamientos(avistamientos, cubo=None):
     ''' 
-    Devuelve la hora del día (de 0 a 23) con mayor número de avistamientos
+    Devuelve la hora del día (de 0 a 23) con mayor número de avistamientos.
+    Si se pasa un cubo de los avistamientos, se consulta el cubo y el
+    parámetro avistamientos no se recorre.
     
     @param avistamientos: lista de tuplas con la información de los avistamientos 
     @type [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
+    @param cubo: cubo de los avistamientos (ver cubo_avistamientos.crea_cubo)
+    @type cubo: CuboAvistamientos, optional
     @return: hora del día en la que se producen más avistamientos
     @rtype: int
        
@@ -426,13 +601,13 @@ def hora_mas_avistamientos(avistamientos):
     Después obtendremos el máximo de los elementos del diccionario según el valor
     del elemento.
     '''
-    #  TODO: Para casa
-    avistamientos_por_hora = Counter(a.fechahora.hour for a in avistamientos)
-    return max(avistamientos_por_hora.items(), key = lambda t:t[1])[0]
-    return avistamientos_por_hora.most_common(1)[0][0]
+    if cubo is not None:
+        return cubo_avistamientos.valor_mas_avistamientos(cubo, 'hora')
+    return agregaciones.agrega_una(avistamientos, HORA_MAS_AVISTAMIENTOS)
 
 ### 4.7 Longitud media de los comentarios por estado
 
+@instrumentado
 def longitud_media_comentarios_por_estado(avistamientos):
     '''
     Devuelve un diccionario en el que las claves son los estados donde se
@@ -445,23 +620,11 @@ def longitud_media_comentarios_por_estado(avistamientos):
          por estado (claves)
     @rtype: {str: float}
     '''
-    # Intenta primero descomponer el problema en subproblemas
-    # Agrupar los comentarios por estado
-    comentarios_por_estado = defaultdict(list)
-    for a in avistamientos:
-        comentarios_por_estado[a.estado].append(len(a.comentarios))
-    
-    # Diccionario que voy a devolver
-    res = {}
-    # Recorrer el diccionario anterior
-    for estado, lista_tam_comentarios in comentarios_por_estado.items():
-        # Calcular la media del tamaño de los comentarios
-        # en lista_comentarios
-        res[estado] = sum(lista_tam_comentarios) / len(lista_tam_comentarios)
-    return res
+    return agregaciones.agrega_una(avistamientos, LONGITUD_MEDIA_COMENTARIOS_POR_ESTADO)
 
 
 ### 4.8 Porcentaje de avistamientos por forma
+@instrumentado
 def porc_avistamientos_por_forma(avistamientos):  
     '''
     Devuelve un diccionario en el que las claves son las formas de los
@@ -485,6 +648,7 @@ def porc_avistamientos_por_forma(avistamientos):
 
 
 ### 4.9 Avistamientos de mayor duración por estado
+@instrumentado
 def avistamientos_mayor_duracion_por_estado(avistamientos, n=3):
     '''
     Devuelve un diccionario que almacena los n avistamientos de mayor duración 
@@ -498,21 +662,29 @@ def avistamientos_mayor_duracion_por_estado(avistamientos, n=3):
          con los "n" avistamientos de mayor duración de cada estado,
          ordenados de mayor a menor duración
             -> {str: [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]}
+
+    Se recorren los avistamientos una sola vez guardando, para cada estado, un
+    montículo (heapq) con los n avistamientos más largos vistos hasta el momento,
+    así que la memoria usada es proporcional a estados × n y no al número de
+    avistamientos. Funciona igual con una lista que con un generador.
     '''
-    # Intenta primero descomponer el problema en subproblemas
-    # (y si los pasos se implementan en funciones auxiliares, puedes reutilizarlos...)
-    pass
+    return agregaciones.agrega_una(avistamientos,
+        agregaciones.top_n_por(lambda a: a.estado, n, lambda a: a.duracion))
 
 ### 4.10 Año con más avistamientos de una forma
-def año_mas_avistamientos_forma(avistamientos, forma):
+@instrumentado
+def año_mas_avistamientos_forma(avistamientos, forma, indice=None):
     '''
     Devuelve el año en el que se han observado más avistamientos
     de una forma dada.
+    Si se pasa un índice de categorías, se cuenta con sus mapas de bits.
     
     @param avistamientos: lista de tuplas con la información de los avistamientos 
     @type avistamientos: [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
     @param forma: forma del avistamiento 
     @type: str
+    @param indice: índice de categorías de los avistamientos (ver indice_categorias.crea_indice_categorias)
+    @type indice: IndiceCategorias, optional
     @return: año con mayor número de avistamientos de la forma dada
     @rtype: int
             
@@ -522,11 +694,14 @@ def año_mas_avistamientos_forma(avistamientos, forma):
     utilizando la función ya definida numero_avistamientos_por_año.
     Luego, se calcula el máximo del diccionario según los valores.
     '''
-    #  TODO: Para casa
-    pass
+    if indice is not None:
+        return indice_categorias.año_mas_avistamientos_forma(indice, forma)
+    avistamientos_por_año = numero_avistamientos_por_año(a for a in avistamientos if a.forma == forma)
+    return max(avistamientos_por_año, key=avistamientos_por_año.get)
 
 
 ### 4.11 Estados con mayor número de avistamientos
+@instrumentado
 def estados_mas_avistamientos(avistamientos, n=5):
     '''
     Devuelve una lista con los estados en los que se han observado
@@ -541,21 +716,32 @@ def estados_mas_avistamientos(avistamientos, n=5):
          junto con el número de avistamientos, en orden decreciente
          del número de avistamientos y con un máximo de "limite" estados.
     @rtype: [(str, int)]
+
+    Se cuentan los avistamientos por estado en una sola pasada y se eligen los
+    n estados con heapq.nlargest, sin ordenar todos los estados. Funciona igual
+    con una lista que con un generador.
     '''
-    # TODO: Para casa
-    pass
+    avistamientos_por_estado = Counter(a.estado for a in avistamientos)
+    return heapq.nlargest(n, avistamientos_por_estado.items(), key=lambda t: t[1])
 
       
 ### 4.12 Duración total de los avistamientos de cada año en un estado dado
-def duracion_total_avistamientos_año(avistamientos, estado):
+@instrumentado
+def duracion_total_avistamientos_año(avistamientos, estado, indice=None, cubo=None):
     '''
     Devuelve un diccionario que almacena la duración total de los avistamientos 
     en cada año, para un estado dado.
+    Si se pasa un índice de categorías, solo se recorren los avistamientos del estado;
+    si se pasa un cubo, no se recorre ningún avistamiento.
     
     @param avistamientos: lista de tuplas con la información de los avistamientos 
     @type avistamientos: [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
     @param estado: nombre del estado
     @type estado: str
+    @param indice: índice de categorías de los avistamientos (ver indice_categorias.crea_indice_categorias)
+    @type indice: IndiceCategorias, optional
+    @param cubo: cubo de los avistamientos (ver cubo_avistamientos.crea_cubo)
+    @type cubo: CuboAvistamientos, optional
     @return: diccionario en el que las claves son los años y los valores son números 
          con la suma de las duraciones de los avistamientos observados ese año
          en el estado dado
@@ -565,11 +751,17 @@ def duracion_total_avistamientos_año(avistamientos, estado):
     y cuyos valores sean la suma de las duraciones de todos los avistamientos
     observados en ese año.
     '''
-    # TODO: para casa
-    pass
+    if cubo is not None:
+        return cubo_avistamientos.agrega(cubo, ('año',), 'duracion', estado=estado)
+    if indice is not None:
+        return indice_categorias.duracion_total_avistamientos_año(indice, estado)
+    return agregaciones.agrega_una(avistamientos,
+        agregaciones.suma_por(lambda a: a.fechahora.year, lambda a: a.duracion,
+                              filtro=lambda a: a.estado == estado))
 
 
 ### 4.13 Fecha del avistamiento más reciente de cada estado
+@instrumentado
 def avistamiento_mas_reciente_por_estado(avistamientos):
     '''
     Devuelve un diccionario que almacena la fecha del último avistamiento
@@ -589,3 +781,28 @@ def avistamiento_mas_reciente_por_estado(avistamientos):
     '''
     # TODO: para casa
     pass
+
+
+### 4.14 Resumen de varias operaciones en una sola pasada
+@instrumentado
+def resumen_avistamientos(avistamientos):
+    '''
+    Calcula a la vez, recorriendo los avistamientos una sola vez, los resultados de
+    numero_avistamientos_por_año, num_avistamientos_por_mes, formas_por_mes,
+    hora_mas_avistamientos, longitud_media_comentarios_por_estado y
+    coordenadas_mas_avistamientos.
+
+    @param avistamientos: lista de tuplas con la información de los avistamientos
+    @type avistamientos: [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
+    @return: diccionario en el que las claves son los nombres de las funciones
+         y los valores son sus resultados
+    @rtype: {str: object}
+    '''
+    return agregaciones.agrega(avistamientos, {
+        'numero_avistamientos_por_año': NUMERO_POR_AÑO,
+        'num_avistamientos_por_mes': NUMERO_POR_MES,
+        'formas_por_mes': FORMAS_POR_MES,
+        'hora_mas_avistamientos': HORA_MAS_AVISTAMIENTOS,
+        'longitud_media_comentarios_por_estado': LONGITUD_MEDIA_COMENTARIOS_POR_ESTADO,
+        'coordenadas_mas_avistamientos': COORDENADAS_MAS_AVISTAMIENTOS,
+    })
@@ -0,0 +1,553 @@
+'''
+Módulo avistamientos_columnar
+Almacén columnar de avistamientos: en lugar de una lista de tuplas, cada
+campo se guarda en un array tipado (fechas como segundos desde 1970 en int64,
+coordenadas en float64, duración en int32) y los campos categóricos
+(estado, forma, ciudad) se codifican con un diccionario de cadenas.
+
+Tiene una versión sobre columnas de cada función de consulta de avistamientos.py
+(de los apartados 2, 3 y 4), que devuelve lo mismo que la original, con los
+mismos empates. Quedan fuera resumen_avistamientos, que solo combina varias de
+ellas; avistamientos_por_fecha, que devuelve todos los avistamientos y no gana
+nada con las columnas (para eso se reconstruyen con la función avistamientos);
+y las que en avistamientos.py están sin implementar (porc_avistamientos_por_forma
+y avistamiento_mas_reciente_por_estado).
+'''
+import heapq
+from array import array
+from collections import namedtuple, Counter, defaultdict
+from datetime import datetime, timedelta
+from itertools import compress, repeat
+from operator import floordiv, mod, eq, itemgetter
+from avistamientos import Avistamiento, lee_avistamientos, MESES
+from coordenadas import Coordenadas, distancias_haversine
+
+## Definición de tipos
+# Cada columna es un array tipado; las columnas categóricas guardan códigos
+# que indexan las listas estados, formas y ciudades.
+AvistamientosColumnar = namedtuple('AvistamientosColumnar',
+    'fechahora, ciudad, estado, forma, duracion, comentarios, latitud, longitud, '
+    'ciudades, estados, formas')
+
+EPOCA = datetime(1970, 1, 1)
+UN_SEGUNDO = timedelta(seconds=1)
+SEGUNDOS_DIA = 86400
+
+
+def a_epoca(fechahora):
+    '''Convierte un datetime en segundos transcurridos desde el 1/1/1970
+
+    @param fechahora: fecha y hora
+    @type fechahora: datetime.datetime
+    @return: segundos desde 1970
+    @rtype: int
+    '''
+    return (fechahora - EPOCA) // UN_SEGUNDO
+
+
+def de_epoca(segundos):
+    '''Convierte los segundos transcurridos desde el 1/1/1970 en un datetime
+
+    @param segundos: segundos desde 1970
+    @type segundos: int
+    @return: fecha y hora
+    @rtype: datetime.datetime
+    '''
+    return EPOCA + timedelta(seconds=segundos)
+
+
+def _codifica(valor, codigos, valores):
+    codigo = codigos.get(valor)
+    if codigo is None:
+        codigo = codigos[valor] = len(valores)
+        valores.append(valor)
+    return codigo
+
+
+## 1. Construcción del almacén
+def crea_columnar(avistamientos):
+    '''
+    Construye un almacén columnar a partir de cualquier iterable de avistamientos.
+
+    @param avistamientos: avistamientos que se quieren almacenar
+    @type avistamientos: iterable de Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+    @return: almacén columnar con los avistamientos, en el mismo orden
+    @rtype: AvistamientosColumnar
+    '''
+    fechahora = array('q')
+    ciudad, estado, forma = array('i'), array('H'), array('H')
+    duracion = array('i')
+    latitud, longitud = array('d'), array('d')
+    comentarios = []
+    ciudades, estados, formas = [], [], []
+    cod_ciudades, cod_estados, cod_formas = {}, {}, {}
+    for a in avistamientos:
+        fechahora.append(a_epoca(a.fechahora))
+        ciudad.append(_codifica(a.ciudad, cod_ciudades, ciudades))
+        estado.append(_codifica(a.estado, cod_estados, estados))
+        forma.append(_codifica(a.forma, cod_formas, formas))
+        duracion.append(a.duracion)
+        comentarios.append(a.comentarios)
+        latitud.append(a.coordenadas.latitud)
+        longitud.append(a.coordenadas.longitud)
+    return AvistamientosColumnar(fechahora, ciudad, estado, forma, duracion,
+                                 comentarios, latitud, longitud,
+                                 ciudades, estados, formas)
+
+
+def lee_avistamientos_columnar(fichero):
+    '''
+    Lee un fichero de avistamientos y devuelve un almacén columnar.
+
+    @param fichero: ruta del fichero csv que contiene los datos en codificación utf-8
+    @type fichero: str
+    @return: almacén columnar con los avistamientos del fichero
+    @rtype: AvistamientosColumnar
+    '''
+    return crea_columnar(lee_avistamientos(fichero))
+
+
+def numero_filas(columnas):
+    '''Devuelve el número de avistamientos del almacén'''
+    return len(columnas.fechahora)
+
+
+def avistamiento(columnas, i):
+    '''
+    Reconstruye el avistamiento de la fila i del almacén.
+
+    @param columnas: almacén columnar
+    @type columnas: AvistamientosColumnar
+    @param i: posición del avistamiento
+    @type i: int
+    @return: avistamiento de la fila i
+    @rtype: Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+    '''
+    return Avistamiento(de_epoca(columnas.fechahora[i]),
+                        columnas.ciudades[columnas.ciudad[i]],
+                        columnas.estados[columnas.estado[i]],
+                        columnas.formas[columnas.forma[i]],
+                        columnas.duracion[i],
+                        columnas.comentarios[i],
+                        Coordenadas(columnas.latitud[i], columnas.longitud[i]))
+
+
+def avistamientos(columnas, filas=None):
+    '''
+    Genera los avistamientos del almacén (o solo los de las filas indicadas).
+
+    @param columnas: almacén columnar
+    @type columnas: AvistamientosColumnar
+    @param filas: posiciones de los avistamientos a generar. Si es None, se generan todos
+    @type filas: iterable de int, optional
+    @return: generador de avistamientos
+    @rtype: generador de Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+    '''
+    if filas is None:
+        filas = range(numero_filas(columnas))
+    for i in filas:
+        yield avistamiento(columnas, i)
+
+
+## Funciones auxiliares sobre columnas
+# Las funciones siguientes trabajan siempre con map/compress/Counter sobre
+# los arrays, de modo que el recorrido se hace en C y no fila a fila.
+def _mascara(columna, codigos):
+    '''Devuelve un iterable de booleanos que indica qué filas tienen un código
+    incluido en el conjunto codigos'''
+    if len(codigos) == 1:
+        return map(eq, columna, repeat(next(iter(codigos))))
+    return map(codigos.__contains__, columna)
+
+
+def _codigos(valores, categorias):
+    '''Devuelve el conjunto de códigos de los valores que aparecen en categorias'''
+    return {i for i, c in enumerate(categorias) if c in valores}
+
+
+def _conteo_por_dia(fechahora):
+    '''Counter de días (desde 1970) a número de avistamientos, a partir de
+    los segundos de cada avistamiento'''
+    return Counter(map(floordiv, fechahora, repeat(SEGUNDOS_DIA)))
+
+
+def _fecha_de_dia(dia):
+    return (EPOCA + timedelta(days=dia)).date()
+
+
+def _por_año(por_dia):
+    '''Suma los valores de un diccionario {día: valor} por año, conservando
+    el orden en que aparece cada año'''
+    res = Counter()
+    for dia, n in por_dia.items():
+        res[_fecha_de_dia(dia).year] += n
+    return res
+
+
+def _segundos_año(anyo):
+    '''Rango de segundos desde 1970 de un año'''
+    return range(a_epoca(datetime(anyo, 1, 1)), a_epoca(datetime(anyo + 1, 1, 1)))
+
+
+def _filas(columnas, mascara):
+    return compress(range(numero_filas(columnas)), mascara)
+
+
+## 2. Operaciones con filtrado
+def numero_avistamientos_fecha(columnas, fecha):
+    '''
+    Devuelve el número de avistamientos que se han producido en una fecha.
+
+    @param columnas: almacén columnar
+    @type columnas: AvistamientosColumnar
+    @param fecha: fecha del avistamiento
+    @type fecha: datetime.date
+    @return: número de avistamientos producidos en la fecha
+    @rtype: int
+    '''
+    dia = (fecha - EPOCA.date()).days
+    return sum(map(eq, map(floordiv, columnas.fechahora, repeat(SEGUNDOS_DIA)),
+                   repeat(dia)))
+
+
+def formas_estados(columnas, estados):
+    '''
+    Devuelve el número de formas distintas observadas en avistamientos
+    producidos en alguno de los estados especificados.
+
+    @param columnas: almacén columnar
+    @type columnas: AvistamientosColumnar
+    @param estados: conjunto de estados para los que se quiere hacer el cálculo
+    @type estados: {str}
+    @return: número de formas distintas
+    @rtype: int
+    '''
+    codigos = _codigos(estados, columnas.estados)
+    return len(set(compress(columnas.forma, _mascara(columnas.estado, codigos))))
+
+
+def duracion_total(columnas, estado):
+    '''
+    Devuelve la duración total de los avistamientos de un estado.
+
+    @param columnas: almacén columnar
+    @type columnas: AvistamientosColumnar
+    @param estado: estado para el que se quiere hacer el cálculo
+    @type estado: str
+    @return: duración total en segundos de todos los avistamientos del estado
+    @rtype: int
+    '''
+    codigos = _codigos({estado}, columnas.estados)
+    return sum(compress(columnas.duracion, _mascara(columnas.estado, codigos)))
+
+
+def filas_cercanas(columnas, ubicacion, radio):
+    '''Devuelve las posiciones de los avistamientos a una distancia inferior
+    a radio de la ubicación dada'''
+    distancias = distancias_haversine(ubicacion, columnas.latitud, columnas.longitud)
+    return list(compress(range(len(distancias)), map(float.__lt__, distancias, repeat(radio))))
+
+
+def avistamientos_cercanos_ubicacion(columnas, ubicacion, radio):
+    '''
+    Devuelve el conjunto de avistamientos cercanos a una ubicación.
+
+    @param columnas: almacén columnar
+    @type columnas: AvistamientosColumnar
+    @param ubicacion: coordenadas de la ubicación
+    @type ubicacion: Coordenadas(float, float)
+    @param radio: radio de distancia
+    @type radio: float
+    @return: conjunto de avistamientos a una distancia inferior a radio
+    @rtype: {Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))}
+    '''
+    return set(avistamientos(columnas, filas_cercanas(columnas, ubicacion, radio)))
+
+
+## 3. Operaciones con máximos y mínimos
+def avistamiento_mayor_duracion(columnas, forma):
+    '''
+    Devuelve el avistamiento de mayor duración de entre todos los
+    avistamientos de una forma dada.
+
+    @param columnas: almacén columnar
+    @type columnas: AvistamientosColumnar
+    @param forma: forma del avistamiento
+    @type forma: str
+    @return: avistamiento más largo de la forma dada
+    @rtype: Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+    '''
+    codigos = _codigos({forma}, columnas.formas)
+    filas = _filas(columnas, _mascara(columnas.forma, codigos))
+    return avistamiento(columnas, max(filas, key=columnas.duracion.__getitem__))
+
+
+def avistamiento_cercano_mayor_duracion(columnas, coordenadas, radio=0.5):
+    '''
+    Devuelve la duración y los comentarios del avistamiento que más tiempo
+    ha durado de aquellos situados en el entorno de las coordenadas.
+
+    @param columnas: almacén columnar
+    @type columnas: AvistamientosColumnar
+    @param coordenadas: tupla con latitud y longitud
+    @type coordenadas: Coordenadas(float, float)
+    @param radio: radio de búsqueda
+    @type radio: float, optional
+    @return: duración y comentarios del avistamiento más largo en el entorno de las coordenadas
+    @rtype: int, str
+    '''
+    filas = filas_cercanas(columnas, coordenadas, radio)
+    return max(zip(map(columnas.duracion.__getitem__, filas),
+                   map(columnas.comentarios.__getitem__, filas)))
+
+
+def avistamientos_fechas(columnas, fecha_inicial=None, fecha_final=None):
+    '''
+    Devuelve una lista con los avistamientos que han tenido lugar entre
+    fecha_inicial y fecha_final (ambas inclusive), de los más recientes a los
+    más antiguos. Si alguna de las fechas es None, el rango no está limitado
+    por ese extremo.
+
+    @param columnas: almacén columnar
+    @type columnas: AvistamientosColumnar
+    @param fecha_inicial: fecha a partir de la cual se devuelven los avistamientos
+    @type fecha_inicial: datetime.date, optional
+    @param fecha_final: fecha hasta la cual se devuelven los avistamientos
+    @type fecha_final: datetime.date, optional
+    @return: lista de avistamientos en el rango de fechas
+    @rtype: [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
+    '''
+    if not columnas.fechahora:
+        return []
+    desde = (min(columnas.fechahora) if fecha_inicial is None
+             else (fecha_inicial - EPOCA.date()).days * SEGUNDOS_DIA)
+    hasta = (max(columnas.fechahora) + 1 if fecha_final is None
+             else ((fecha_final - EPOCA.date()).days + 1) * SEGUNDOS_DIA)
+    filas = _filas(columnas, map(range(desde, hasta).__contains__, columnas.fechahora))
+    # Se ordenan los avistamientos completos, como en avistamientos.py, para
+    # desempatar igual los de la misma fecha y hora
+    return sorted(avistamientos(columnas, filas), reverse=True)
+
+
+def comentario_mas_largo(columnas, anyo, palabra):
+    '''
+    Devuelve el avistamiento cuyo comentario es el más largo, de entre los
+    avistamientos observados en el año dado cuyo comentario incluye la palabra.
+
+    @param columnas: almacén columnar
+    @type columnas: AvistamientosColumnar
+    @param anyo: año para el que se hará la búsqueda
+    @type anyo: int
+    @param palabra: palabra que debe incluir el comentario del avistamiento buscado
+    @type palabra: str
+    @return: avistamiento con el comentario más largo
+    @rtype: Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+    '''
+    filas = list(_filas(columnas, map(_segundos_año(anyo).__contains__, columnas.fechahora)))
+    comentarios = list(map(columnas.comentarios.__getitem__, filas))
+    filas = compress(filas, map(str.__contains__, comentarios, repeat(palabra)))
+    return avistamiento(columnas, max(filas, key=lambda i: len(columnas.comentarios[i])))
+
+
+def media_dias_entre_avistamientos(columnas, anyo=None):
+    '''
+    Devuelve la media de días transcurridos entre dos avistamientos consecutivos.
+    Si anyo es distinto de None, solo se contemplan los avistamientos de ese año.
+    Como los intervalos entre días consecutivos suman la diferencia entre el
+    último y el primer día, no hace falta ordenar los días.
+
+    @param columnas: almacén columnar
+    @type columnas: AvistamientosColumnar
+    @param anyo: año para el que se hará el cálculo
+    @type anyo: int, optional
+    @return: media de días transcurridos entre avistamientos, o None si hay menos de dos
+    @rtype: float
+    '''
+    fechahora = columnas.fechahora
+    if anyo is not None:
+        fechahora = compress(fechahora, map(_segundos_año(anyo).__contains__, fechahora))
+    dias = array('q', map(floordiv, fechahora, repeat(SEGUNDOS_DIA)))
+    if len(dias) < 2:
+        return None
+    return (max(dias) - min(dias)) / (len(dias) - 1)
+
+
+## 4. Operaciones con diccionarios
+def numero_avistamientos_por_año(columnas):
+    '''
+    Devuelve el número de avistamientos observados en cada año.
+
+    @param columnas: almacén columnar
+    @type columnas: AvistamientosColumnar
+    @return: diccionario en el que las claves son los años y los valores
+         el número de avistamientos observados en ese año
+    @rtype: {int: int}
+    '''
+    return _por_año(_conteo_por_dia(columnas.fechahora))
+
+
+def num_avistamientos_por_mes(columnas):
+    '''
+    Devuelve el número de avistamientos observados en cada mes del año.
+
+    @param columnas: almacén columnar
+    @type columnas: AvistamientosColumnar
+    @return: diccionario en el que las claves son los nombres de los meses y
+         los valores son el número de avistamientos observados en ese mes
+    @rtype: {str: int}
+    '''
+    res = Counter()
+    for dia, n in _conteo_por_dia(columnas.fechahora).items():
+        res[MESES[_fecha_de_dia(dia).month - 1]] += n
+    return res
+
+
+def formas_por_mes(columnas):
+    '''
+    Devuelve un diccionario que indexa las distintas formas de avistamientos
+    por los nombres de los meses en que se observan.
+
+    @param columnas: almacén columnar
+    @type columnas: AvistamientosColumnar
+    @return: diccionario en el que las claves son los nombres de los meses
+         y los valores son conjuntos con las formas observadas en cada mes
+    @rtype: {str: {str}}
+    '''
+    dias = map(floordiv, columnas.fechahora, repeat(SEGUNDOS_DIA))
+    res = defaultdict(set)
+    for dia, forma in set(zip(dias, columnas.forma)):
+        res[MESES[_fecha_de_dia(dia).month - 1]].add(columnas.formas[forma])
+    return res
+
+
+def hora_mas_avistamientos(columnas):
+    '''
+    Devuelve la hora del día (de 0 a 23) con mayor número de avistamientos.
+
+    @param columnas: almacén columnar
+    @type columnas: AvistamientosColumnar
+    @return: hora del día en la que se producen más avistamientos
+    @rtype: int
+    '''
+    segundos = Counter(map(mod, columnas.fechahora, repeat(SEGUNDOS_DIA)))
+    por_hora = Counter()
+    for s, n in segundos.items():
+        por_hora[s // 3600] += n
+    return max(por_hora.items(), key=lambda t: t[1])[0]
+
+
+def longitud_media_comentarios_por_estado(columnas):
+    '''
+    Devuelve un diccionario con la longitud media de los comentarios
+    de los avistamientos de cada estado.
+
+    @param columnas: almacén columnar
+    @type columnas: AvistamientosColumnar
+    @return: diccionario que almacena la longitud media de los comentarios (valores)
+         por estado (claves)
+    @rtype: {str: float}
+    '''
+    suma = defaultdict(int)
+    for codigo, longitud in zip(columnas.estado, map(len, columnas.comentarios)):
+        suma[codigo] += longitud
+    cuenta = Counter(columnas.estado)
+    return {columnas.estados[c]: suma[c] / n for c, n in cuenta.items()}
+
+
+def coordenadas_mas_avistamientos(columnas):
+    '''
+    Devuelve las coordenadas enteras que se corresponden con
+    la zona donde más avistamientos se han observado.
+
+    @param columnas: almacén columnar
+    @type columnas: AvistamientosColumnar
+    @return: coordenadas (sin decimales) que acumulan más avistamientos
+    @rtype: Coordenadas(float, float)
+    '''
+    celdas = Counter(zip(map(round, columnas.latitud), map(round, columnas.longitud)))
+    return Coordenadas(*celdas.most_common(1)[0][0])
+
+
+def avistamientos_mayor_duracion_por_estado(columnas, n=3):
+    '''
+    Devuelve un diccionario que almacena los n avistamientos de mayor duración
+    en cada estado, ordenados de mayor a menor duración (si hay empate, el que
+    aparece antes).
+
+    @param columnas: almacén columnar
+    @type columnas: AvistamientosColumnar
+    @param n: número de avistamientos a almacenar por cada estado
+    @type n: int, optional
+    @return: diccionario en el que las claves son los estados y los valores son listas
+         con los n avistamientos de mayor duración de cada estado
+    @rtype: {str: [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]}
+    '''
+    # Un montículo de como mucho n (duración, -fila) por código de estado: con el
+    # montículo lleno, una fila posterior solo entra si dura estrictamente más
+    monticulos = {}
+    for i, (codigo, duracion) in enumerate(zip(columnas.estado, columnas.duracion)):
+        monticulo = monticulos.get(codigo)
+        if monticulo is None:
+            monticulo = monticulos[codigo] = []
+        if len(monticulo) < n:
+            heapq.heappush(monticulo, (duracion, -i))
+        elif monticulo and duracion > monticulo[0][0]:
+            heapq.heapreplace(monticulo, (duracion, -i))
+    return {columnas.estados[codigo]:
+                list(avistamientos(columnas, (-i for _, i in sorted(monticulo, reverse=True))))
+            for codigo, monticulo in monticulos.items()}
+
+
+def año_mas_avistamientos_forma(columnas, forma):
+    '''
+    Devuelve el año en el que se han observado más avistamientos de una forma dada.
+
+    @param columnas: almacén columnar
+    @type columnas: AvistamientosColumnar
+    @param forma: forma del avistamiento
+    @type forma: str
+    @return: año con mayor número de avistamientos de la forma dada
+    @rtype: int
+    '''
+    codigos = _codigos({forma}, columnas.formas)
+    por_año = _por_año(_conteo_por_dia(compress(columnas.fechahora, _mascara(columnas.forma, codigos))))
+    return max(por_año, key=por_año.get)
+
+
+def estados_mas_avistamientos(columnas, n=5):
+    '''
+    Devuelve una lista con los estados en los que se han observado más
+    avistamientos, junto con el número de avistamientos, ordenados de mayor
+    a menor número de avistamientos.
+
+    @param columnas: almacén columnar
+    @type columnas: AvistamientosColumnar
+    @param n: número de estados a devolver
+    @type n: int, optional
+    @return: lista de tuplas (estado, número de avistamientos), como mucho n
+    @rtype: [(str, int)]
+    '''
+    cuenta = Counter(columnas.estado)
+    return heapq.nlargest(n, zip(map(columnas.estados.__getitem__, cuenta), cuenta.values()),
+                          key=itemgetter(1))
+
+
+def duracion_total_avistamientos_año(columnas, estado):
+    '''
+    Devuelve un diccionario que almacena la duración total de los avistamientos
+    en cada año, para un estado dado.
+
+    @param columnas: almacén columnar
+    @type columnas: AvistamientosColumnar
+    @param estado: nombre del estado
+    @type estado: str
+    @return: diccionario en el que las claves son los años y los valores son la suma
+         de las duraciones de los avistamientos observados ese año en el estado dado
+    @rtype: {int: int}
+    '''
+    mascara = bytes(_mascara(columnas.estado, _codigos({estado}, columnas.estados)))
+    por_dia = defaultdict(int)
+    for dia, duracion in zip(map(floordiv, compress(columnas.fechahora, mascara), repeat(SEGUNDOS_DIA)),
+                             compress(columnas.duracion, mascara)):
+        por_dia[dia] += duracion
+    return dict(_por_año(por_dia))
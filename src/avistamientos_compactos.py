@@ -0,0 +1,178 @@
+'''
+Módulo avistamientos_compactos
+Representación compacta de los avistamientos. Cada avistamiento es un objeto
+con __slots__ (sin diccionario de atributos) que guarda la latitud y la longitud
+directamente, en lugar de una tupla Coordenadas aparte, y cuyos campos
+categóricos (ciudad, estado, forma) son cadenas internadas: todos los
+avistamientos del mismo estado comparten el mismo objeto cadena.
+
+Los objetos se comportan como Avistamiento: tienen los mismos atributos
+(incluido coordenadas, que se construye al consultarlo), se pueden desempaquetar
+e indexar como una tupla, y se comparan y tienen el mismo hash que la tupla
+Avistamiento equivalente (las comparaciones van campo a campo, sin construir la
+tupla; con objetos que no son tuplas devuelven NotImplemented, como una tupla).
+Por eso todas las funciones de avistamientos.py funcionan igual con ellos.
+'''
+import csv
+import sys
+from avistamientos import Avistamiento
+from coordenadas import Coordenadas
+from parsers import parse_fecha_hora_mdy_memo
+
+intern = sys.intern
+
+# Atributo correspondiente a cada posición de la tupla Avistamiento
+_CAMPOS = Avistamiento._fields
+
+
+class AvistamientoCompacto:
+    '''
+    Avistamiento con __slots__ y coordenadas en línea.
+
+    Atributos:
+        fechahora, ciudad, estado, forma, duracion, comentarios: como en Avistamiento
+        latitud, longitud: coordenadas del avistamiento
+        coordenadas: Coordenadas(latitud, longitud), de solo lectura
+    '''
+    __slots__ = ('fechahora', 'ciudad', 'estado', 'forma', 'duracion', 'comentarios',
+                 'latitud', 'longitud')
+    _fields = Avistamiento._fields
+
+    def __init__(self, fechahora, ciudad, estado, forma, duracion, comentarios, latitud, longitud):
+        self.fechahora = fechahora
+        self.ciudad = intern(ciudad)
+        self.estado = intern(estado)
+        self.forma = intern(forma)
+        self.duracion = duracion
+        self.comentarios = comentarios
+        self.latitud = latitud
+        self.longitud = longitud
+
+    @property
+    def coordenadas(self):
+        return Coordenadas(self.latitud, self.longitud)
+
+    def __iter__(self):
+        yield self.fechahora
+        yield self.ciudad
+        yield self.estado
+        yield self.forma
+        yield self.duracion
+        yield self.comentarios
+        yield self.coordenadas
+
+    def __len__(self):
+        return 7
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return tuple(getattr(self, campo) for campo in _CAMPOS[i])
+        return getattr(self, _CAMPOS[i])
+
+    def _diferencia(self, otro):
+        '''Devuelve el primer par de valores distintos de self y otro, comparados
+        como tuplas, o sus longitudes si uno empieza por todos los valores del
+        otro, sin construir las tuplas'''
+        if isinstance(otro, AvistamientoCompacto):
+            # Comparar latitud y longitud equivale a comparar las Coordenadas
+            for atributo in AvistamientoCompacto.__slots__:
+                x, y = getattr(self, atributo), getattr(otro, atributo)
+                if not (x is y or x == y):
+                    return x, y
+            return 7, 7
+        # Las coordenadas solo se construyen si los seis primeros valores coinciden
+        for x, y in zip(self, otro):
+            if not (x is y or x == y):
+                return x, y
+        return 7, len(otro)
+
+    def __eq__(self, otro):
+        if not isinstance(otro, (tuple, AvistamientoCompacto)):
+            return NotImplemented
+        x, y = self._diferencia(otro)
+        return x == y
+
+    def __lt__(self, otro):
+        if not isinstance(otro, (tuple, AvistamientoCompacto)):
+            return NotImplemented
+        x, y = self._diferencia(otro)
+        return x < y
+
+    def __le__(self, otro):
+        if not isinstance(otro, (tuple, AvistamientoCompacto)):
+            return NotImplemented
+        x, y = self._diferencia(otro)
+        return x <= y
+
+    def __gt__(self, otro):
+        if not isinstance(otro, (tuple, AvistamientoCompacto)):
+            return NotImplemented
+        x, y = self._diferencia(otro)
+        return x > y
+
+    def __ge__(self, otro):
+        if not isinstance(otro, (tuple, AvistamientoCompacto)):
+            return NotImplemented
+        x, y = self._diferencia(otro)
+        return x >= y
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return repr(Avistamiento(*self)).replace('Avistamiento(', 'AvistamientoCompacto(', 1)
+
+    def __reduce__(self):
+        return (AvistamientoCompacto, (self.fechahora, self.ciudad, self.estado, self.forma,
+                                       self.duracion, self.comentarios, self.latitud, self.longitud))
+
+    def a_avistamiento(self):
+        '''Devuelve el Avistamiento (tupla con nombre) equivalente'''
+        return Avistamiento(*self)
+
+
+def compacta(avistamiento):
+    '''
+    Convierte un Avistamiento en un AvistamientoCompacto.
+
+    @param avistamiento: avistamiento a convertir
+    @type avistamiento: Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+    @return: avistamiento compacto equivalente
+    @rtype: AvistamientoCompacto
+    '''
+    a = avistamiento
+    return AvistamientoCompacto(a.fechahora, a.ciudad, a.estado, a.forma, a.duracion,
+                                a.comentarios, a.coordenadas.latitud, a.coordenadas.longitud)
+
+
+def itera_avistamientos_compactos(fichero, parser_fecha=parse_fecha_hora_mdy_memo):
+    '''
+    Lee un fichero de avistamientos y devuelve un generador de avistamientos compactos.
+
+    @param fichero: ruta del fichero csv que contiene los datos en codificación utf-8
+    @type fichero: str
+    @param parser_fecha: función que convierte la cadena de la fecha en un datetime
+    @type parser_fecha: función str -> datetime.datetime, optional
+    @return: generador de avistamientos compactos, en el orden del fichero
+    @rtype: generador de AvistamientoCompacto
+    '''
+    with open(fichero, encoding='utf-8', buffering=1 << 20) as f:
+        lector = csv.reader(f)
+        next(lector)
+        for cadena_fecha, city, state, shape, duration, comments, latitude, longitude \
+                in lector:
+            yield AvistamientoCompacto(parser_fecha(cadena_fecha), city, state, shape,
+                                       int(duration), comments, float(latitude), float(longitude))
+
+
+def lee_avistamientos_compactos(fichero):
+    '''
+    Lee un fichero de avistamientos y devuelve una lista de avistamientos
+    compactos, que ocupa bastante menos memoria que la de lee_avistamientos.
+
+    @param fichero: ruta del fichero csv que contiene los datos en codificación utf-8
+    @type fichero: str
+    @return: lista de avistamientos compactos
+    @rtype: [AvistamientoCompacto]
+    '''
+    return list(itera_avistamientos_compactos(fichero))
@@ -0,0 +1,282 @@
+'''
+Módulo avistamientos_mapeados
+Lectura de ficheros de avistamientos muy grandes sin decodificar el fichero
+completo. El fichero se mapea en memoria (mmap) y se trabaja sobre sus bytes,
+sin convertirlos a str.
+
+El resultado es un almacén columnar (ver avistamientos_columnar) en el que:
+- la fecha, la duración y las coordenadas se convierten directamente desde los
+  bytes de cada campo (las fechas y las horas, que se repiten mucho, se
+  convierten una sola vez por cadena distinta);
+- la ciudad, el estado y la forma se decodifican una sola vez por valor distinto;
+- los comentarios no se decodifican al leer: solo se guarda dónde empieza y
+  acaba cada uno dentro del fichero, y se decodifican cuando se consultan.
+
+El fichero se procesa en trozos de unos megabytes que acaban en un fin de
+registro. Los registros de cada trozo se separan con bytes.split y cada columna
+se convierte de una vez con map, sin bucles en Python por registro. Solo los
+registros con comillas (campos con comas, comillas dobladas o saltos de línea
+dentro), que suelen ser pocos, se dividen uno a uno con una expresión regular
+que los trata igual que csv.reader.
+'''
+import gc
+import mmap
+import os
+import re
+from array import array
+from bisect import bisect_right
+from collections import Counter
+from itertools import accumulate, repeat
+from operator import add, sub, methodcaller
+from avistamientos_columnar import AvistamientosColumnar, a_epoca
+from parsers import parse_fecha_hora_mdy
+
+# Un campo entre comillas o sin comas ni saltos de línea. El comentario va sin
+# comillas si no las necesita y puede tener comas: se queda con todo lo que hay
+# hasta las dos últimas comas de la línea.
+_CAMPO = rb'("(?:[^"]|"")*"|[^,\r\n]*)'
+_COMENTARIO = rb'("(?:[^"]|"")*"|[^\r\n]*)'
+_REGISTRO = re.compile(b','.join([_CAMPO] * 5 + [_COMENTARIO] + [_CAMPO] * 2) + rb'(?:\r\n|\n|\r|\Z)')
+
+TAM_TROZO = 1 << 22
+
+_divide_cabeza = methodcaller('split', b',', 5)
+_divide_cola = methodcaller('rsplit', b',', 2)
+
+
+def _posiciones_comillas(datos):
+    '''Genera las posiciones de las comillas en datos'''
+    i = datos.find(b'"')
+    while i != -1:
+        yield i
+        i = datos.find(b'"', i + 1)
+
+
+def _sin_comillas(datos):
+    '''Quita las comillas de un campo si las tiene (como csv.reader)'''
+    if datos[:1] == b'"':
+        return datos[1:-1].replace(b'""', b'"').replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+    return datos
+
+
+def _texto(datos):
+    '''Decodifica un campo, quitando las comillas si las tiene'''
+    return _sin_comillas(datos).decode('utf-8')
+
+
+class CadenasMapeadas:
+    '''
+    Secuencia de cadenas guardadas en un fichero mapeado en memoria, que se
+    decodifican cada vez que se accede a ellas.
+
+    Atributos:
+        mapa: contenido del fichero mapeado en memoria
+        inicios, fines: posición del primer byte y del siguiente al último de cada cadena
+    '''
+
+    def __init__(self, mapa, inicios, fines):
+        self.mapa = mapa
+        self.inicios = inicios
+        self.fines = fines
+
+    def _cadena(self, inicio, fin):
+        return _texto(self.mapa[inicio:fin])
+
+    def __len__(self):
+        return len(self.inicios)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list(map(self._cadena, self.inicios[i], self.fines[i]))
+        return self._cadena(self.inicios[i], self.fines[i])
+
+    def __iter__(self):
+        return map(self._cadena, self.inicios, self.fines)
+
+
+class _Lector:
+    '''Estado de la lectura: columnas construidas hasta el momento y
+    diccionarios de valores ya decodificados'''
+
+    def __init__(self, fichero, mapa):
+        self.fichero = fichero
+        self.mapa = mapa
+        self.fechahora = array('q')
+        self.ciudad, self.estado, self.forma = array('i'), array('H'), array('H')
+        self.duracion = array('i')
+        self.latitud, self.longitud = array('d'), array('d')
+        self.inicios, self.fines = array('q'), array('q')
+        self.ciudades, self.estados, self.formas = [], [], []
+        self.cod_ciudades, self.cod_estados, self.cod_formas = {}, {}, {}
+        self.dias, self.horas, self.epocas = {}, {}, {}
+
+    def _error(self, posicion):
+        linea = self.mapa[:posicion].count(b'\n') + 1
+        return ValueError(f"Registro no válido en la línea {linea} de {self.fichero}")
+
+    def _epocas(self, cadenas):
+        '''Devuelve los segundos desde 1970 de cada cadena de fecha y hora'''
+        # Las fechas con hora se repiten poco, pero las fechas y las horas por
+        # separado sí: se convierte una vez cada fecha y cada hora distintas
+        try:
+            dias, _, horas = zip(*map(methodcaller('partition', b' '), cadenas))
+            for dia in dict.fromkeys(dias):
+                if dia not in self.dias:
+                    self.dias[dia] = a_epoca(parse_fecha_hora_mdy(dia.decode('utf-8') + ' 00:00'))
+            for hora in dict.fromkeys(horas):
+                if hora not in self.horas:
+                    self.horas[hora] = a_epoca(parse_fecha_hora_mdy('01/01/1970 ' + hora.decode('utf-8')))
+        except ValueError:
+            # Alguna cadena no tiene el formato habitual: se convierten enteras
+            for cadena in dict.fromkeys(cadenas):
+                if cadena not in self.epocas:
+                    self.epocas[cadena] = a_epoca(parse_fecha_hora_mdy(cadena.decode('utf-8')))
+            return map(self.epocas.__getitem__, cadenas)
+        return map(add, map(self.dias.__getitem__, dias), map(self.horas.__getitem__, horas))
+
+    @staticmethod
+    def _nuevos_valores(cadenas, codigos, valores):
+        # dict.fromkeys conserva el orden de aparición, así que los códigos
+        # son los mismos que asigna avistamientos_columnar.crea_columnar
+        for cadena in dict.fromkeys(cadenas):
+            if cadena not in codigos:
+                codigos[cadena] = len(valores)
+                valores.append(cadena.decode('utf-8'))
+
+    @staticmethod
+    def _registros(trozo, inicio):
+        '''Divide un trozo en registros y devuelve los registros, la posición de
+        inicio de cada uno en el fichero (más la del final) y las posiciones (en la
+        lista de registros) de los que tienen comillas. Un registro ocupa más de una
+        línea si tiene un salto de línea dentro de un campo entre comillas'''
+        lineas = trozo.split(b'\n')
+        if lineas[-1] == b'':
+            lineas.pop()
+        inicios = list(accumulate(map(add, map(len, lineas), repeat(1)), initial=0))
+        # Número de comillas de cada línea que tiene alguna: se buscan las comillas
+        # en el trozo, que suelen ser pocas, en lugar de contarlas línea a línea
+        comillas = Counter(bisect_right(inicios, i) - 1 for i in _posiciones_comillas(trozo))
+        if not any(n % 2 for n in comillas.values()):
+            return lineas, list(map(inicio.__add__, inicios)), sorted(comillas)
+        registros, inicios_registros, con_comillas = [], [], []
+        abierto = False
+        for i, linea in enumerate(lineas):
+            if abierto:
+                registros[-1] += b'\n' + linea
+            else:
+                registros.append(linea)
+                inicios_registros.append(inicio + inicios[i])
+                if i in comillas:
+                    con_comillas.append(len(registros) - 1)
+            abierto ^= comillas.get(i, 0) % 2
+        inicios_registros.append(inicio + inicios[-1])
+        return registros, inicios_registros, con_comillas
+
+    def _comprueba(self, partes, n, inicios_registros):
+        '''Comprueba que todos los registros se han dividido en n partes'''
+        if set(map(len, partes)) != {n}:
+            malo = next(i for i, p in enumerate(partes) if len(p) != n)
+            raise self._error(inicios_registros[malo])
+
+    def trozo(self, inicio, trozo):
+        '''Lee los registros de un trozo del fichero que empieza en la posición inicio'''
+        registros, inicios_registros, con_comillas = self._registros(trozo, inicio)
+
+        # Los registros sin comillas se dividen con split: la cabeza por las 5
+        # primeras comas y el resto (comentario, latitud y longitud) por las 2
+        # últimas. Los que tienen comillas se dividen con la expresión regular
+        cabezas = list(map(_divide_cabeza, registros))
+        encajes = {}
+        for i in con_comillas:
+            m = encajes[i] = _REGISTRO.fullmatch(registros[i])
+            if m is None:
+                raise self._error(inicios_registros[i])
+            cabezas[i] = list(map(_sin_comillas, m.group(1, 2, 3, 4, 5))) + [b',,']
+        self._comprueba(cabezas, 6, inicios_registros)
+        fechas, ciudades, estados, formas, duraciones, restos = zip(*cabezas)
+        colas = list(map(_divide_cola, restos))
+        self._comprueba(colas, 3, inicios_registros)
+        for i, m in encajes.items():
+            colas[i] = [b''] + list(map(_sin_comillas, m.group(7, 8)))
+        comentarios, latitudes, longitudes = zip(*colas)
+
+        # El comentario empieza donde empieza el resto, que acaba con el registro
+        fines_registros = map(add, inicios_registros, map(len, registros))
+        inicios_comentarios = list(map(sub, fines_registros, map(len, restos)))
+        fines_comentarios = list(map(add, inicios_comentarios, map(len, comentarios)))
+        for i, m in encajes.items():
+            inicios_comentarios[i], fines_comentarios[i] = map(inicios_registros[i].__add__, m.span(6))
+
+        self.fechahora.extend(self._epocas(fechas))
+        for cadenas, columna, codigos, valores in ((ciudades, self.ciudad, self.cod_ciudades, self.ciudades),
+                                                   (estados, self.estado, self.cod_estados, self.estados),
+                                                   (formas, self.forma, self.cod_formas, self.formas)):
+            self._nuevos_valores(cadenas, codigos, valores)
+            columna.extend(map(codigos.__getitem__, cadenas))
+        # int y float aceptan bytes directamente (y descartan el \r final)
+        self.duracion.extend(map(int, duraciones))
+        self.latitud.extend(map(float, latitudes))
+        self.longitud.extend(map(float, longitudes))
+        self.inicios.extend(inicios_comentarios)
+        self.fines.extend(fines_comentarios)
+
+    def columnas(self):
+        return AvistamientosColumnar(self.fechahora, self.ciudad, self.estado, self.forma, self.duracion,
+                                     CadenasMapeadas(self.mapa, self.inicios, self.fines),
+                                     self.latitud, self.longitud,
+                                     self.ciudades, self.estados, self.formas)
+
+
+def _trozos(mapa, inicio, tam_trozo):
+    '''Genera (inicio, trozo) con trozos consecutivos del fichero, de unos
+    tam_trozo bytes, que acaban en un fin de registro (un salto de línea que no
+    está dentro de un campo entre comillas)'''
+    final = len(mapa)
+    while inicio < final:
+        fin = mapa.find(b'\n', min(inicio + tam_trozo, final) - 1)
+        fin = final if fin == -1 else fin + 1
+        trozo = mapa[inicio:fin]
+        # Con un número impar de comillas, el salto de línea está dentro de un campo
+        while trozo.count(b'"') % 2 and fin < final:
+            siguiente = mapa.find(b'\n', fin)
+            siguiente = final if siguiente == -1 else siguiente + 1
+            trozo += mapa[fin:siguiente]
+            fin = siguiente
+        yield inicio, trozo
+        inicio = fin
+
+
+def lee_avistamientos_mapeados(fichero, tam_trozo=TAM_TROZO):
+    '''
+    Lee un fichero de avistamientos mapeándolo en memoria y devuelve un almacén
+    columnar cuyos comentarios se decodifican al consultarlos. El fichero queda
+    mapeado mientras se use la columna de comentarios, y no se debe modificar
+    mientras tanto.
+
+    @param fichero: ruta del fichero csv que contiene los datos en codificación utf-8
+    @type fichero: str
+    @param tam_trozo: tamaño aproximado, en bytes, de los trozos que se procesan de una vez
+    @type tam_trozo: int, optional
+    @return: almacén columnar con los avistamientos del fichero, en el mismo orden
+    @rtype: AvistamientosColumnar
+    @raise ValueError: si algún registro no tiene el formato esperado
+    '''
+    if os.path.getsize(fichero) == 0:
+        return AvistamientosColumnar(array('q'), array('i'), array('H'), array('H'), array('i'),
+                                     [], array('d'), array('d'), [], [], [])
+    with open(fichero, 'rb') as f:
+        mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    lector = _Lector(fichero, mapa)
+    fin_cabecera = mapa.find(b'\n')
+    inicio = len(mapa) if fin_cabecera == -1 else fin_cabecera + 1
+    # Cada trozo crea millones de listas y tuplas sin ciclos, que el recolector
+    # de ciclos recorrería una y otra vez: se detiene mientras dura la lectura
+    recolector = gc.isenabled()
+    gc.disable()
+    try:
+        for inicio, trozo in _trozos(mapa, inicio, tam_trozo):
+            lector.trozo(inicio, trozo)
+    finally:
+        if recolector:
+            gc.enable()
+    return lector.columnas()
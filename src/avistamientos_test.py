@@ -1,5 +1,28 @@
 import avistamientos
-from datetime import datetime, date
+import avistamientos_columnar
+import avistamientos_mapeados
+import carga_paralela
+import indice_espacial
+import indice_fechas
+import cache_avistamientos
+from catalogo import Catalogo
+import indice_comentarios
+import indice_categorias
+import cubo_avistamientos
+import instrumentacion
+import avistamientos_compactos
+from mapa_densidad import MapaDensidad
+import servicio_avistamientos
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+from memoizacion import MemoriaConsultas
+import intervalos
+import oleadas
+from consulta import consulta
+from datetime import datetime, date, timedelta
 from coordenadas import *
 
 
@@ -205,7 +228,7 @@ def test_avistamientos_mayor_duracion_por_estado(datos):
     for estado, av in d.items():
         print(estado)
         for a in av:
-            print("\t", av)
+            print("\t", a)
     print("=======================================================\n")
 
 
@@ -245,8 +268,359 @@ def test_avistamiento_mas_reciente_por_estado(datos):
     print("=======================================================\n")
 
 
+def test_avistamientos_columnar(datos):
+    print("Test de avistamientos_columnar")
+    columnas = avistamientos_columnar.crea_columnar(datos)
+    print(f"Almacén columnar con {avistamientos_columnar.numero_filas(columnas)} avistamientos,"
+          f" {len(columnas.estados)} estados y {len(columnas.formas)} formas")
+    print("Primer avistamiento reconstruido:", avistamientos_columnar.avistamiento(columnas, 0))
+    print("Duración total en 'ca':", avistamientos_columnar.duracion_total(columnas, "ca"),
+          "(lista:", avistamientos.duracion_total(datos, "ca"), ")")
+    print("Formas en in, nm, pa o wa:",
+          avistamientos_columnar.formas_estados(columnas, {"in", "nm", "pa", "wa"}),
+          "(lista:", avistamientos.formas_estados(datos, {"in", "nm", "pa", "wa"}), ")")
+    print("Hora con más avistamientos:", avistamientos_columnar.hora_mas_avistamientos(columnas))
+    print("¿Mismos resultados que con la lista?", all(
+        getattr(avistamientos_columnar, nombre)(columnas, *args) == getattr(avistamientos, nombre)(datos, *args)
+        for nombre, args in [
+            ("avistamientos_fechas", (date(2005, 5, 1), date(2005, 5, 31))),
+            ("comentario_mas_largo", (2005, "ufo")),
+            ("avistamiento_cercano_mayor_duracion", (Coordenadas(40.2, -85.4), 20)),
+            ("media_dias_entre_avistamientos", (2005,)),
+            ("estados_mas_avistamientos", ()),
+            ("avistamientos_mayor_duracion_por_estado", ()),
+            ("año_mas_avistamientos_forma", ("circle",)),
+            ("duracion_total_avistamientos_año", ("ca",)),
+        ]))
+    print("=======================================================\n")
+
+
+def test_itera_avistamientos(fichero):
+    print("Test de itera_avistamientos")
+    d = avistamientos.numero_avistamientos_por_año(avistamientos.itera_avistamientos(fichero))
+    print("Número de avistamientos por año (leyendo el fichero sin cargarlo en memoria):")
+    for año, numero in sorted(d.items()):
+        print(f"{año}: {numero}")
+    print("=======================================================\n")
+
+
+def test_lee_avistamientos_paralelo(fichero):
+    print("Test de lee_avistamientos_paralelo")
+    datos = carga_paralela.lee_avistamientos_paralelo(fichero)
+    print(f"Se han leido {len(datos)} avistamientos en paralelo")
+    print("¿Igual que la lectura secuencial?", datos == avistamientos.lee_avistamientos(fichero))
+    print("Hora con más avistamientos (map-reduce):",
+          carga_paralela.hora_mas_avistamientos_paralelo(fichero))
+    # Un fichero con solo la cabecera da los mismos resultados que la versión secuencial
+    with open(fichero, encoding='utf-8') as f, tempfile.TemporaryDirectory() as directorio:
+        cabecera = os.path.join(directorio, "cabecera.csv")
+        with open(cabecera, 'w', encoding='utf-8') as g:
+            g.write(f.readline())
+        print("¿Igual que la versión secuencial con un fichero sin avistamientos?",
+              carga_paralela.lee_avistamientos_paralelo(cabecera) == [] and
+              carga_paralela.numero_avistamientos_por_año_paralelo(cabecera) ==
+              avistamientos.numero_avistamientos_por_año(avistamientos.lee_avistamientos(cabecera)))
+    print("=======================================================\n")
+
+
+def test_indice_espacial(datos):
+    print("Test de indice_espacial")
+    indice = indice_espacial.crea_indice_espacial(datos)
+    ubicacion = Coordenadas(40.1933333, -85.3863889)
+    res = avistamientos.avistamientos_cercanos_ubicacion(datos, ubicacion, 50, indice=indice)
+    print(f"Avistamientos a menos de 50 km de {ubicacion} con el índice: {len(res)}")
+    print("¿Igual que sin índice?",
+          res == avistamientos.avistamientos_cercanos_ubicacion(datos, ubicacion, 50))
+    print("Los 3 avistamientos más cercanos:")
+    for distancia, a in indice_espacial.k_mas_cercanos(indice, ubicacion, 3):
+        print(f"\t{distancia:.2f} km", a)
+    # Avistamientos a ambos lados del antimeridiano, con celdas que no dividen 360°
+    lados = [datos[0]._replace(coordenadas=Coordenadas(0, longitud))
+             for longitud in (179.5, 179.9, 180.0, -180.0, -179.9, -179.5)]
+    indice_lados = indice_espacial.crea_indice_espacial(lados, tam_celda=0.7)
+    ubicacion = Coordenadas(0, -179.5)
+    print("¿Encuentra los avistamientos a ambos lados del antimeridiano?",
+          len(list(indice_espacial.cercanos(indice_lados, ubicacion, 112))) ==
+          len(avistamientos.avistamientos_cercanos_ubicacion(lados, ubicacion, 112)) == 6)
+    print("=======================================================\n")
+
+
+def test_indice_fechas(datos):
+    print("Test de indice_fechas")
+    indice = indice_fechas.crea_indice_fechas(datos)
+    res = avistamientos.avistamientos_fechas(datos, date(2005, 5, 1), date(2005, 5, 1), indice=indice)
+    print("Mostrando los avistamientos del 1 de mayo de 2005 (con el índice):")
+    for a in res:
+        print("\t", a)
+    print("¿Igual que sin índice?",
+          res == avistamientos.avistamientos_fechas(datos, date(2005, 5, 1), date(2005, 5, 1)))
+    print("Avistamientos en 1979:", indice_fechas.numero_avistamientos_año(indice, 1979))
+    print("=======================================================\n")
+
+
+def test_resumen_avistamientos(datos):
+    print("Test de resumen_avistamientos")
+    res = avistamientos.resumen_avistamientos(datos)
+    print("Hora con más avistamientos:", res["hora_mas_avistamientos"])
+    print("Coordenadas con más avistamientos:", res["coordenadas_mas_avistamientos"])
+    print("Número de avistamientos por mes:")
+    for mes, numero in res["num_avistamientos_por_mes"].items():
+        print(f"{mes}: {numero}")
+    print("=======================================================\n")
+
+
+def test_catalogo(datos):
+    print("Test de Catalogo")
+    catalogo = Catalogo(datos[:-5])
+    print(f"Avistamientos en 2013 antes de añadir los 5 últimos: {catalogo.resultado('numero_avistamientos_por_año')[2013]}")
+    catalogo.agregar_lote(datos[-5:])
+    print(f"Avistamientos en 2013 después de añadirlos: {catalogo.resultado('numero_avistamientos_por_año')[2013]}")
+    print("Avistamientos de mayor duración en 'wa':")
+    for a in catalogo.resultado("avistamientos_mayor_duracion_por_estado")["wa"]:
+        print("\t", a)
+    print("=======================================================\n")
+
+
+def test_indice_comentarios(datos):
+    print("Test de indice_comentarios")
+    indice = indice_comentarios.crea_indice_comentarios(datos)
+    res = avistamientos.comentario_mas_largo(datos, 2005, "ufo", indice=indice)
+    print('El avistamiento con el comentario más largo de 2005 incluyendo la palabra "ufo" (con el índice) es:')
+    print(res)
+    print("¿Igual que sin índice?", res == avistamientos.comentario_mas_largo(datos, 2005, "ufo"))
+    print('Avistamientos con "ufo" en el comentario:', len(indice_comentarios.filas_con(indice, "ufo")))
+    print("=======================================================\n")
+
+
+def test_instrumentacion(datos):
+    # Solo registra estadísticas si se ejecuta con AVISTAMIENTOS_PERFIL=1
+    print("Test de instrumentacion")
+    instrumentacion.reinicia()
+    avistamientos.avistamientos_cercanos_ubicacion(datos, Coordenadas(40.19, -85.38), 0.5)
+    avistamientos.resumen_avistamientos(datos)
+    instrumentacion.imprime_resumen()
+    print("=======================================================\n")
+
+
+def test_avistamientos_compactos(datos):
+    print("Test de avistamientos_compactos")
+    compactos = [avistamientos_compactos.compacta(a) for a in datos]
+    print("Primer avistamiento compacto:", compactos[0])
+    print("¿Iguales que los avistamientos originales?", compactos == datos)
+    print("¿Mismo resultado de duracion_total para 'ca'?",
+          avistamientos.duracion_total(compactos, "ca") == avistamientos.duracion_total(datos, "ca"))
+    print("¿Mismo orden que los avistamientos originales?", sorted(compactos) == sorted(datos))
+    print("¿Distinto de None y de un entero?", compactos[0] != None and compactos[0] not in {1, 2})
+    print("=======================================================\n")
+
+
+def test_mapa_densidad(datos):
+    print("Test de MapaDensidad")
+    mapa = MapaDensidad(datos, tam_celda=0.1)
+    print("Las 5 celdas de 0.1 grados con más avistamientos son:")
+    for centro, numero in mapa.puntos_calientes(5):
+        print("\t", centro, numero)
+    mapa.crea_tabla_acumulada()
+    print("Avistamientos en el rectángulo (40, -90) - (45, -80):",
+          mapa.numero_rectangulo(Coordenadas(40, -90), Coordenadas(45, -80)))
+    print("¿Misma celda con más avistamientos que coordenadas_mas_avistamientos?",
+          avistamientos.coordenadas_mas_avistamientos(datos) ==
+          avistamientos.coordenadas_mas_avistamientos(datos, mapa=MapaDensidad(datos)))
+    print("¿Un mapa vacío no tiene puntos calientes?", MapaDensidad().puntos_calientes(1) == [])
+    try:
+        avistamientos.coordenadas_mas_avistamientos([], mapa=MapaDensidad())
+        print("¿Falla coordenadas_mas_avistamientos con un mapa vacío? False")
+    except ValueError:
+        print("¿Falla coordenadas_mas_avistamientos con un mapa vacío? True")
+    print("=======================================================\n")
+
+
+def test_servicio_avistamientos(fichero):
+    print("Test de servicio_avistamientos")
+
+    async def prueba():
+        servicio = servicio_avistamientos.ServicioAvistamientos(fichero, procesos=2)
+        puerto = await servicio.inicia(puerto=0)
+        try:
+            res = await asyncio.gather(
+                servicio_avistamientos.pide("numero_avistamientos_fecha", {"fecha": "2005-05-01"}, puerto=puerto),
+                servicio_avistamientos.pide("hora_mas_avistamientos", puerto=puerto),
+                servicio_avistamientos.pide("estados_mas_avistamientos", {"n": 3}, puerto=puerto),
+                servicio_avistamientos.pide("duracion_total", {"estado": "ca"}, puerto=puerto))
+        finally:
+            await servicio.cierra()
+        return res
+    numero, hora, estados, duracion = asyncio.run(prueba())
+    print("Avistamientos el 1 de mayo de 2005:", numero)
+    print("Hora con más avistamientos:", hora)
+    print("Estados con más avistamientos:", estados)
+    print("Duración total en ca:", duracion)
+    print("=======================================================\n")
+
+
+def test_cubo_avistamientos(datos):
+    print("Test de cubo_avistamientos")
+    cubo = cubo_avistamientos.crea_cubo(datos)
+    print("Avistamientos por mes (con el cubo):", avistamientos.num_avistamientos_por_mes(datos, cubo=cubo))
+    print("¿Igual que sin cubo?",
+          avistamientos.num_avistamientos_por_mes(datos, cubo=cubo) == avistamientos.num_avistamientos_por_mes(datos))
+    print("¿Mismos tipos de resultado que sin cubo?", all(
+        type(funcion(datos, cubo=cubo)) is type(funcion(datos))
+        for funcion in (avistamientos.formas_por_mes, avistamientos.numero_avistamientos_por_año,
+                        avistamientos.num_avistamientos_por_mes)))
+    print("Hora con más avistamientos (con el cubo):", avistamientos.hora_mas_avistamientos(datos, cubo=cubo))
+    print("Duración total por año en ca (con el cubo):",
+          avistamientos.duracion_total_avistamientos_año(datos, "ca", cubo=cubo))
+    print("¿Mismos años y en el mismo orden que sin cubo?",
+          list(avistamientos.duracion_total_avistamientos_año(datos, "ca", cubo=cubo).items()) ==
+          list(avistamientos.duracion_total_avistamientos_año(datos, "ca").items()))
+    print("Avistamientos light en ca por hora, en verano:",
+          cubo_avistamientos.agrega(cubo, ("hora",), estado="ca", forma="light", mes={6, 7, 8}))
+    with tempfile.TemporaryDirectory() as directorio:
+        cubo_avistamientos.guarda_cubo(cubo, directorio)
+        print("¿Cubo cargado igual que el guardado?", cubo_avistamientos.carga_cubo(directorio) == cubo)
+    print("=======================================================\n")
+
+
+def test_importacion_perezosa():
+    print("Test de importacion_perezosa")
+    # En un proceso nuevo, para que no cuenten los módulos que ya ha cargado este
+    orden = [sys.executable, "-c",
+             "import sys, avistamientos; "
+             "print(sorted(m for m in ('csv', 'indice_fechas', 'cubo_avistamientos', 'cProfile') if m in sys.modules))"]
+    print("Módulos opcionales cargados al importar avistamientos:",
+          subprocess.run(orden, capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip())
+    print("Módulo perezoso de índice por fecha:", avistamientos.indice_fechas)
+    print("=======================================================\n")
+
+
+def test_memoria_consultas(datos):
+    print("Test de MemoriaConsultas")
+    catalogo = Catalogo(datos[:-5])
+    memoria = MemoriaConsultas(catalogo)
+    memoria.formas_estados({"in", "nm", "pa", "wa"})
+    memoria.formas_estados(["wa", "pa", "nm", "in"])
+    memoria.duracion_total_avistamientos_año("ca")
+    print("Estadísticas tras repetir formas_estados:", memoria.estadisticas())
+    catalogo.agregar_lote(datos[-5:])
+    memoria.formas_estados({"in", "nm", "pa", "wa"})
+    print("Estadísticas tras añadir avistamientos al catálogo:", memoria.estadisticas())
+    print("=======================================================\n")
+
+
+def test_intervalos(datos):
+    print("Test de intervalos")
+    cronologia = intervalos.crea_cronologia(datos)
+    estadisticas = intervalos.estadisticas_intervalos(cronologia.dias)
+    print(f"Media: {estadisticas.media}, mediana: {estadisticas.mediana}, máximo: {estadisticas.maximo}")
+    print("¿Misma media que media_dias_entre_avistamientos en 2005?",
+          intervalos.media_dias_entre_avistamientos(cronologia, 2005) ==
+          avistamientos.media_dias_entre_avistamientos(datos, 2005))
+    print("Máximo intervalo en 'wa':", intervalos.estadisticas_por_estado(cronologia)["wa"].maximo)
+    print("=======================================================\n")
+
+
+def test_oleadas(datos):
+    print("Test de oleadas")
+    res = oleadas.detecta_oleadas(datos, radio=100, ventana_dias=7, min_avistamientos=4)
+    print(f"Se han encontrado {len(res.oleadas)} oleadas; las 5 con más avistamientos son:")
+    for oleada in sorted(res.oleadas, key=lambda o: o.numero, reverse=True)[:5]:
+        print("\t", oleada)
+    print("Avistamientos que no pertenecen a ninguna oleada:",
+          sum(1 for e in res.etiquetas if e == oleadas.RUIDO))
+    # Vecinos a ambos lados del antimeridiano, con celdas que no dividen 360°
+    lados = [datos[0]._replace(coordenadas=Coordenadas(0, longitud)) for longitud in (179.5, -179.9)]
+    res = oleadas.detecta_oleadas(lados, radio=80, ventana_dias=1, min_avistamientos=2, procesos=1)
+    print("¿Agrupa los avistamientos a ambos lados del antimeridiano?", list(res.etiquetas) == [0, 0])
+    # El centroide de una oleada que cruza el antimeridiano está junto a él
+    lados = [datos[0]._replace(coordenadas=Coordenadas(10, longitud)) for longitud in (179.9, -179.9)]
+    res = oleadas.detecta_oleadas(lados, radio=80, ventana_dias=1, min_avistamientos=2, procesos=1)
+    print("Centroide de la oleada que cruza el antimeridiano:", res.oleadas[0].centroide)
+    print("¿Está junto al antimeridiano?",
+          distancia_haversine(res.oleadas[0].centroide, Coordenadas(10, 180)) < 1)
+    # La ventana es de periodos de 24 horas, no de días del calendario
+    inicio = datetime(2005, 5, 2, 0, 0)
+    seguidos = [datos[0]._replace(fechahora=inicio + timedelta(hours=horas)) for horas in (0, 23, 49)]
+    res = oleadas.detecta_oleadas(seguidos, radio=80, ventana_dias=1, min_avistamientos=2, procesos=1)
+    print("¿La ventana es de 24 horas?", list(res.etiquetas) == [0, 0, oleadas.RUIDO])
+    print("=======================================================\n")
+
+
+def test_consulta(datos):
+    print("Test de consulta")
+    indices = {'fechas': indice_fechas.crea_indice_fechas(datos),
+               'espacial': indice_espacial.crea_indice_espacial(datos)}
+    q = consulta(datos, indices).estado('wa').forma('light', 'circle') \
+        .entre(date(2000, 1, 1), date(2010, 12, 31)).cerca(Coordenadas(47.61, -122.33), 100)
+    print("Plan:", q.explica())
+    print("Número de avistamientos:", q.cuenta())
+    print("Los 3 de mayor duración:")
+    for a in q.top(3):
+        print("\t", a)
+    print("=======================================================\n")
+
+
+def test_indice_categorias(datos):
+    print("Test de indice_categorias")
+    indice = indice_categorias.crea_indice_categorias(datos)
+    print("Formas en in, nm, pa, wa (con el índice):",
+          avistamientos.formas_estados(datos, {"in", "nm", "pa", "wa"}, indice=indice))
+    print("Duración total en ca (con el índice):", avistamientos.duracion_total(datos, "ca", indice=indice))
+    print("¿Igual que sin índice?",
+          avistamientos.duracion_total(datos, "ca", indice=indice) == avistamientos.duracion_total(datos, "ca"))
+    print("Año con más avistamientos de forma circle (con el índice):",
+          avistamientos.año_mas_avistamientos_forma(datos, "circle", indice=indice))
+    print("Avistamientos light en ca o wa:",
+          indice_categorias.numero(indice, estados={"ca", "wa"}, formas={"light"}))
+    print("=======================================================\n")
+
+
+def test_cache_avistamientos(fichero):
+    print("Test de cache_avistamientos")
+    with tempfile.TemporaryDirectory() as directorio:
+        columnas = cache_avistamientos.lee_avistamientos_cacheado(fichero, directorio)
+        print("¿Caché igual que la lectura con csv?",
+              list(avistamientos_columnar.avistamientos(cache_avistamientos.carga_snapshot(directorio))) ==
+              avistamientos.lee_avistamientos(fichero))
+        # Un fichero abandonado hace tiempo se borra al publicar; uno reciente, que
+        # puede ser de otro proceso que está escribiendo, se conserva
+        abandonado = os.path.join(directorio, "fechahora.abandonado.bin")
+        reciente = os.path.join(directorio, "fechahora.reciente.bin")
+        for ruta in (abandonado, reciente):
+            open(ruta, "wb").close()
+        os.utime(abandonado, (0, 0))
+        huella = cache_avistamientos.huella_fichero(fichero)
+        cache_avistamientos.guarda_snapshot(columnas, directorio, huella)
+        print("¿Borra los ficheros abandonados y conserva los recientes?",
+              not os.path.exists(abandonado) and os.path.exists(reciente))
+        # Si la escritura falla, no queda ningún fichero nuevo
+        antes = set(os.listdir(directorio))
+        try:
+            cache_avistamientos.guarda_snapshot(columnas._replace(comentarios=[None]), directorio, huella)
+        except AttributeError:
+            pass
+        print("¿No deja ficheros de una escritura fallida?", set(os.listdir(directorio)) == antes)
+    print("=======================================================\n")
+
+
+def test_avistamientos_mapeados(fichero):
+    print("Test de avistamientos_mapeados")
+    columnas = avistamientos_mapeados.lee_avistamientos_mapeados(fichero)
+    print(f"Se han leido {avistamientos_columnar.numero_filas(columnas)} avistamientos"
+          " sin decodificar los comentarios")
+    print("Primer avistamiento reconstruido:", avistamientos_columnar.avistamiento(columnas, 0))
+    print("¿Igual que la lectura con csv?",
+          list(avistamientos_columnar.avistamientos(columnas)) == avistamientos.lee_avistamientos(fichero))
+    print("Hora con más avistamientos:", avistamientos_columnar.hora_mas_avistamientos(columnas))
+    print("=======================================================\n")
+
+
 if __name__ == "__main__":
-    datos = avistamientos.lee_avistamientos("data/ovnis.csv")
+    # La primera ejecución lee el csv y crea la caché en data/ovnis.csv.cache;
+    # las siguientes cargan la caché mientras el csv no cambie
+    datos = list(avistamientos_columnar.avistamientos(
+        cache_avistamientos.lee_avistamientos_cacheado("data/ovnis.csv")))
     #test_lee_avistamientos(datos)
     #test_numero_avistamientos_fecha(datos)
     # test_formas_estados(datos)
@@ -273,3 +647,24 @@ if __name__ == "__main__":
     # test_estados_mas_avistamientos(datos)
     # test_duracion_total_avistamientos_año(datos)
     # test_avistamiento_mas_reciente_por_estado(datos)
+    # test_avistamientos_columnar(datos)
+    # test_itera_avistamientos("data/ovnis.csv")
+    # test_lee_avistamientos_paralelo("data/ovnis.csv")
+    # test_cache_avistamientos("data/ovnis.csv")
+    # test_avistamientos_mapeados("data/ovnis.csv")
+    # test_indice_espacial(datos)
+    # test_indice_fechas(datos)
+    # test_resumen_avistamientos(datos)
+    # test_catalogo(datos)
+    # test_indice_comentarios(datos)
+    # test_indice_categorias(datos)
+    # test_cubo_avistamientos(datos)
+    # test_instrumentacion(datos)
+    # test_avistamientos_compactos(datos)
+    # test_mapa_densidad(datos)
+    # test_servicio_avistamientos("data/ovnis.csv")
+    # test_memoria_consultas(datos)
+    # test_intervalos(datos)
+    # test_oleadas(datos)
+    # test_consulta(datos)
+    # test_importacion_perezosa()
@@ -0,0 +1,527 @@
+'''
+Módulo benchmarks
+Medidas de rendimiento de la carga y de las consultas de avistamientos.
+Se ejecuta como script:
+    python benchmarks.py suite [--tamaños 10000 1000000 10000000] [--salida resultados.json]
+        genera ficheros sintéticos de cada tamaño (si no existen) y mide la carga y todas
+        las consultas de avistamientos.py, cada tamaño en un proceso distinto para que el
+        pico de memoria (RSS) de un tamaño no afecte a los demás. Los resultados se
+        guardan en JSON
+    python benchmarks.py consultas fichero
+        mide la carga y las consultas sobre un fichero y escribe el resultado en JSON
+    python benchmarks.py compara antes.json despues.json
+        compara dos ficheros de resultados, para detectar regresiones entre versiones
+    python benchmarks.py memoria fichero
+        compara la memoria que ocupan los avistamientos cargados como tuplas,
+        como avistamientos compactos y en columnas
+    python benchmarks.py varios fichero
+        compara los parsers de fechas, la haversine por lotes y los top-n con montículo
+    python benchmarks.py arranque [--filas 100] [--objetivo-ms 25]
+        mide el arranque en frío de un script de consulta sencillo y los módulos que
+        importa (con python -X importtime); termina con error si supera el objetivo
+Con 10 millones de filas la lista de avistamientos ocupa varios GB de memoria.
+'''
+import argparse
+import compileall
+import gc
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+import random
+import re
+import tempfile
+from datetime import date, datetime
+import avistamientos
+import avistamientos_compactos
+import avistamientos_columnar
+import avistamientos_mapeados
+import generador_avistamientos
+from collections import defaultdict, Counter
+from coordenadas import Coordenadas, distancia_haversine, prepara_lote, distancias_haversine_lote
+from parsers import parse_fecha_hora_mdy, parse_fecha_hora_mdy_memo
+
+
+def mide(funcion, *args, repeticiones=1):
+    '''Ejecuta una función varias veces y devuelve el mejor tiempo (en segundos)
+    junto con el resultado de la última ejecución
+
+    @param funcion: función a medir
+    @type funcion: función
+    @param repeticiones: número de veces que se ejecuta la función
+    @type repeticiones: int
+    @return: mejor tiempo y resultado
+    @rtype: (float, object)
+    '''
+    mejor = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        res = funcion(*args)
+        t = time.perf_counter() - inicio
+        if mejor is None or t < mejor:
+            mejor = t
+    return mejor, res
+
+
+def filas_por_segundo(filas, segundos):
+    return filas / segundos if segundos > 0 else float('inf')
+
+
+def benchmark_carga(fichero, repeticiones=3):
+    '''Compara la velocidad de carga (filas/s) con strptime y con el
+    parser de fechas rápido con memoria
+
+    @param fichero: ruta del fichero csv de avistamientos
+    @type fichero: str
+    @return: diccionario con las filas por segundo de cada variante
+    @rtype: {str: float}
+    '''
+    def carga(parser):
+        n = 0
+        for bloque in avistamientos.lee_avistamientos_por_bloques(fichero, parser_fecha=parser):
+            n += len(bloque)
+        return n
+
+    res = {}
+    variantes = [('strptime', avistamientos.parse_fecha_strptime),
+                 ('parse_fecha_hora_mdy', parse_fecha_hora_mdy),
+                 ('parse_fecha_hora_mdy_memo', parse_fecha_hora_mdy_memo)]
+    for nombre, parser in variantes:
+        if hasattr(parser, 'cache_clear'):
+            parser.cache_clear()
+        t, n = mide(carga, parser, repeticiones=repeticiones)
+        res[nombre] = filas_por_segundo(n, t)
+        print(f"Carga con {nombre}: {n} filas en {t:.3f} s ({res[nombre]:.0f} filas/s)")
+    return res
+
+
+def benchmark_haversine(n=1000000, repeticiones=3):
+    '''Compara el cálculo de n distancias de haversine llamando a
+    distancia_haversine punto a punto con el cálculo por lotes
+
+    @param n: número de puntos
+    @type n: int
+    @return: diccionario con las distancias por segundo de cada variante
+    @rtype: {str: float}
+    '''
+    aleatorio = random.Random(0)
+    latitudes = [aleatorio.uniform(-90, 90) for _ in range(n)]
+    longitudes = [aleatorio.uniform(-180, 180) for _ in range(n)]
+    puntos = list(map(Coordenadas, latitudes, longitudes))
+    origen = Coordenadas(40.1933333, -85.3863889)
+    lote = prepara_lote(latitudes, longitudes)
+    variantes = [
+        ('escalar', lambda: [distancia_haversine(p, origen) for p in puntos]),
+        ('lote (incluye prepara_lote)',
+         lambda: distancias_haversine_lote(origen, prepara_lote(latitudes, longitudes))),
+        ('lote precalculado', lambda: distancias_haversine_lote(origen, lote)),
+    ]
+    res = {}
+    for nombre, funcion in variantes:
+        t, _ = mide(funcion, repeticiones=repeticiones)
+        res[nombre] = filas_por_segundo(n, t)
+        print(f"Haversine {nombre}: {n} distancias en {t:.3f} s ({res[nombre]:.0f} distancias/s)")
+    return res
+
+
+def _mayor_duracion_por_estado_ordenando(datos, n):
+    por_estado = defaultdict(list)
+    for a in datos:
+        por_estado[a.estado].append(a)
+    return {estado: sorted(lista, key=lambda a: a.duracion, reverse=True)[:n]
+            for estado, lista in por_estado.items()}
+
+
+def _estados_mas_avistamientos_ordenando(datos, n):
+    return sorted(Counter(a.estado for a in datos).items(),
+                  key=lambda t: t[1], reverse=True)[:n]
+
+
+def benchmark_top_n(datos, valores_n=(1, 3, 10, 100, 1000), repeticiones=3):
+    '''Compara las versiones con montículo de avistamientos_mayor_duracion_por_estado
+    y estados_mas_avistamientos con las versiones que agrupan y ordenan
+
+    @param datos: lista de avistamientos
+    @type datos: [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
+    @param valores_n: valores de n que se prueban
+    @type valores_n: tuple de int
+    @return: diccionario {(función, variante, n): filas por segundo}
+    @rtype: {(str, str, int): float}
+    '''
+    variantes = [
+        ('avistamientos_mayor_duracion_por_estado', 'montículo',
+         avistamientos.avistamientos_mayor_duracion_por_estado),
+        ('avistamientos_mayor_duracion_por_estado', 'ordenando',
+         _mayor_duracion_por_estado_ordenando),
+        ('estados_mas_avistamientos', 'montículo', avistamientos.estados_mas_avistamientos),
+        ('estados_mas_avistamientos', 'ordenando', _estados_mas_avistamientos_ordenando),
+    ]
+    res = {}
+    for n in valores_n:
+        for funcion, variante, f in variantes:
+            t, _ = mide(f, datos, n, repeticiones=repeticiones)
+            res[(funcion, variante, n)] = filas_por_segundo(len(datos), t)
+            print(f"{funcion} ({variante}, n={n}): {t:.3f} s ({res[(funcion, variante, n)]:.0f} filas/s)")
+    return res
+
+
+## Suite de consultas
+UBICACION = Coordenadas(40.3, -86.1)
+# Consultas de avistamientos.py que se miden, con sus argumentos (además de la
+# lista de avistamientos). Las funciones que aún no están implementadas no se incluyen.
+CONSULTAS = [
+    ('numero_avistamientos_fecha', (date(2005, 5, 1),)),
+    ('numero_avistamientos_fecha2', (date(2005, 5, 1),)),
+    ('formas_estados', ({'in', 'nm', 'pa', 'wa'},)),
+    ('formas_estados2', ({'in', 'nm', 'pa', 'wa'},)),
+    ('duracion_total', ('ca',)),
+    ('duracion_total2', ('ca',)),
+    ('avistamientos_cercanos_ubicacion', (UBICACION, 100)),
+    ('avistamiento_mayor_duracion', ('circle',)),
+    ('avistamiento_mayor_duracion2', ('circle',)),
+    ('avistamiento_cercano_mayor_duracion', (UBICACION, 100)),
+    ('avistamiento_cercano_mayor_duracion2', (UBICACION, 100)),
+    ('avistamientos_fechas', (date(2005, 5, 1), date(2005, 5, 31))),
+    ('comentario_mas_largo', (2005, 'ufo')),
+    ('comentario_mas_largo2', (2005, 'ufo')),
+    ('media_dias_entre_avistamientos', ()),
+    ('media_dias_entre_avistamientos', (2005,)),
+    ('avistamientos_por_fecha', ()),
+    ('formas_por_mes', ()),
+    ('numero_avistamientos_por_año', ()),
+    ('num_avistamientos_por_mes', ()),
+    ('coordenadas_mas_avistamientos', ()),
+    ('hora_mas_avistamientos', ()),
+    ('longitud_media_comentarios_por_estado', ()),
+    ('avistamientos_mayor_duracion_por_estado', (3,)),
+    ('estados_mas_avistamientos', (5,)),
+    ('duracion_total_avistamientos_año', ('ca',)),
+    ('resumen_avistamientos', ()),
+]
+
+
+def pico_asignaciones(funcion, *args):
+    '''Ejecuta la función con tracemalloc activado y devuelve el pico de memoria
+    reservada durante la llamada (en bytes) y el número de bloques que quedan reservados'''
+    tracemalloc.start()
+    try:
+        res = funcion(*args)
+        _, pico = tracemalloc.get_traced_memory()
+        bloques = sum(e.count for e in tracemalloc.take_snapshot().statistics('filename'))
+    finally:
+        tracemalloc.stop()
+    del res
+    return pico, bloques
+
+
+def _medida(filas, funcion, args, repeticiones, asignaciones):
+    medida = {}
+    try:
+        t, _ = mide(funcion, *args, repeticiones=repeticiones)
+        medida['segundos'] = t
+        medida['filas_por_segundo'] = filas_por_segundo(filas, t)
+        if asignaciones:
+            medida['pico_asignaciones_bytes'], medida['bloques_reservados'] = \
+                pico_asignaciones(funcion, *args)
+    except Exception as e:
+        medida['error'] = repr(e)
+    return medida
+
+
+def benchmark_consultas(fichero, repeticiones=3, asignaciones=True):
+    '''
+    Mide la carga de un fichero con lee_avistamientos y todas las consultas
+    de CONSULTAS sobre los avistamientos leídos.
+
+    @param fichero: ruta del fichero csv de avistamientos
+    @type fichero: str
+    @param repeticiones: número de veces que se ejecuta cada consulta (se guarda el mejor tiempo)
+    @type repeticiones: int
+    @param asignaciones: si es True, se mide también la memoria reservada con tracemalloc
+    @type asignaciones: bool
+    @return: diccionario con las medidas de la carga, de cada consulta y el pico de RSS
+    @rtype: {str: object}
+    '''
+    t, datos = mide(avistamientos.lee_avistamientos, fichero)
+    filas = len(datos)
+    res = {'filas': filas,
+           'carga': {'segundos': t, 'filas_por_segundo': filas_por_segundo(filas, t)},
+           'consultas': {}}
+    if asignaciones:
+        res['carga']['pico_asignaciones_bytes'], res['carga']['bloques_reservados'] = \
+            pico_asignaciones(avistamientos.lee_avistamientos, fichero)
+    for nombre, args in CONSULTAS:
+        clave = nombre if not args or nombre not in res['consultas'] else f"{nombre}{args}"
+        res['consultas'][clave] = _medida(filas, getattr(avistamientos, nombre),
+                                          (datos,) + args, repeticiones, asignaciones)
+    res['pico_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return res
+
+
+def benchmark_suite(tamaños=(10000, 1000000, 10000000), directorio='.', repeticiones=3,
+                    asignaciones=True):
+    '''
+    Genera (si no existen) ficheros sintéticos de cada tamaño y ejecuta
+    benchmark_consultas sobre cada uno en un proceso distinto.
+
+    @param tamaños: números de filas de los ficheros
+    @type tamaños: tuple de int
+    @param directorio: directorio donde se guardan los ficheros sintéticos
+    @type directorio: str
+    @return: diccionario con la información del entorno y los resultados por tamaño
+    @rtype: {str: object}
+    '''
+    res = {'fecha': datetime.now().isoformat(timespec='seconds'),
+           'python': platform.python_version(),
+           'plataforma': platform.platform(),
+           'version': _version_codigo(),
+           'tamaños': {}}
+    for n in tamaños:
+        fichero = os.path.join(directorio, f'ovnis_sintetico_{n}.csv')
+        if not os.path.exists(fichero):
+            print(f"Generando {fichero}...", file=sys.stderr)
+            generador_avistamientos.genera_fichero(fichero, n)
+        orden = [sys.executable, os.path.abspath(__file__), 'consultas', fichero,
+                 '--repeticiones', str(repeticiones)]
+        if not asignaciones:
+            orden.append('--sin-asignaciones')
+        print(f"Midiendo {n} filas...", file=sys.stderr)
+        salida = subprocess.run(orden, check=True, capture_output=True, text=True).stdout
+        res['tamaños'][str(n)] = json.loads(salida)
+    return res
+
+
+def _version_codigo():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return None
+
+
+def compara(antes, despues):
+    '''
+    Compara dos resultados de benchmark_suite y devuelve, para cada tamaño
+    y consulta que aparece en ambos, el cociente entre los tiempos
+    (mayor que 1 significa que la versión de después es más lenta).
+
+    @param antes: resultados de la versión anterior
+    @type antes: {str: object}
+    @param despues: resultados de la versión nueva
+    @type despues: {str: object}
+    @return: diccionario {(tamaño, consulta): cociente de tiempos}
+    @rtype: {(str, str): float}
+    '''
+    res = {}
+    for n, r_despues in despues['tamaños'].items():
+        r_antes = antes['tamaños'].get(n)
+        if r_antes is None:
+            continue
+        medidas_antes = dict(r_antes['consultas'], carga=r_antes['carga'])
+        medidas_despues = dict(r_despues['consultas'], carga=r_despues['carga'])
+        for nombre, m in medidas_despues.items():
+            m_antes = medidas_antes.get(nombre, {})
+            if 'segundos' in m and m_antes.get('segundos'):
+                res[(n, nombre)] = m['segundos'] / m_antes['segundos']
+    return res
+
+
+## Memoria de las representaciones
+def memoria_retenida(funcion, *args):
+    '''
+    Ejecuta la función y devuelve la memoria que sigue reservada después
+    (la que ocupa el resultado), medida con tracemalloc, junto con el resultado.
+    Se vacía antes la caché del parser de fechas, para que los datetime
+    compartidos se cuenten en cada medida.
+
+    @return: tupla (bytes retenidos, resultado)
+    @rtype: (int, object)
+    '''
+    parse_fecha_hora_mdy_memo.cache_clear()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        res = funcion(*args)
+        gc.collect()
+        retenida, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return retenida, res
+
+
+REPRESENTACIONES = [
+    ('tuplas (lee_avistamientos)', avistamientos.lee_avistamientos),
+    ('compactos (lee_avistamientos_compactos)', avistamientos_compactos.lee_avistamientos_compactos),
+    ('columnas (lee_avistamientos_columnar)', avistamientos_columnar.lee_avistamientos_columnar),
+    ('mapeados (lee_avistamientos_mapeados)', avistamientos_mapeados.lee_avistamientos_mapeados),
+]
+
+
+def benchmark_memoria(fichero):
+    '''
+    Muestra la memoria que ocupan los avistamientos de un fichero con cada
+    una de las representaciones de REPRESENTACIONES.
+
+    @param fichero: ruta del fichero csv de avistamientos
+    @type fichero: str
+    @return: diccionario {representación: bytes retenidos}
+    @rtype: {str: int}
+    '''
+    res = {}
+    for nombre, funcion in REPRESENTACIONES:
+        res[nombre], datos = memoria_retenida(funcion, fichero)
+        if isinstance(datos, avistamientos_columnar.AvistamientosColumnar):
+            filas = avistamientos_columnar.numero_filas(datos)
+        else:
+            filas = len(datos)
+        del datos
+        print(f"{nombre:45} {res[nombre] / 2**20:10.1f} MB {res[nombre] / filas:8.0f} bytes/fila")
+    return res
+
+
+## Arranque
+# Script de consulta sencillo: importa avistamientos, lee un fichero pequeño y hace una consulta
+SCRIPT_ARRANQUE = ('import sys, avistamientos; from datetime import date; '
+                   'print(avistamientos.numero_avistamientos_fecha('
+                   'avistamientos.lee_avistamientos(sys.argv[1]), date(2005, 5, 1)))')
+# Milisegundos que puede tardar el script, además de lo que tarda en arrancar el intérprete
+OBJETIVO_ARRANQUE_MS = 25
+_LINEA_IMPORTTIME = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)')
+
+
+def _ejecuta_python(*args):
+    '''Ejecuta un proceso de python en el directorio de los módulos y devuelve
+    los segundos que ha tardado y su salida de error'''
+    inicio = time.perf_counter()
+    proceso = subprocess.run([sys.executable, *args], check=True, capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+    return time.perf_counter() - inicio, proceso.stderr
+
+
+def importaciones(salida_importtime):
+    '''
+    Interpreta la salida de python -X importtime.
+
+    @param salida_importtime: salida de error del proceso
+    @type salida_importtime: str
+    @return: lista de (módulo, microsegundos propios, microsegundos acumulados, nivel),
+         en el orden en que terminan de importarse (nivel 0: importado directamente)
+    @rtype: [(str, int, int, int)]
+    '''
+    return [(m.group(4), int(m.group(1)), int(m.group(2)), len(m.group(3)) // 2)
+            for m in _LINEA_IMPORTTIME.finditer(salida_importtime)]
+
+
+def benchmark_arranque(filas=100, repeticiones=10, objetivo_ms=OBJETIVO_ARRANQUE_MS):
+    '''
+    Mide el arranque en frío de SCRIPT_ARRANQUE sobre un fichero sintético de
+    filas filas: el mejor tiempo de varias ejecuciones, cada una en un proceso
+    nuevo, menos el mejor tiempo de arranque del intérprete sin hacer nada, y las
+    importaciones del script según python -X importtime. Antes se compilan los
+    módulos con compileall, para no medir su compilación (que se repite en cada
+    proceso si no se pueden escribir los .pyc, por ejemplo con PYTHONDONTWRITEBYTECODE).
+
+    @param filas: número de filas del fichero sintético
+    @type filas: int
+    @param repeticiones: número de veces que se ejecuta cada proceso
+    @type repeticiones: int
+    @param objetivo_ms: milisegundos que puede tardar el script además del intérprete
+    @type objetivo_ms: float
+    @return: diccionario con los tiempos (en milisegundos), el número de módulos
+         importados, los que más tardan en importarse y si se cumple el objetivo
+    @rtype: {str: object}
+    '''
+    compileall.compile_dir(os.path.dirname(os.path.abspath(__file__)), maxlevels=0, quiet=1)
+    with tempfile.TemporaryDirectory() as directorio:
+        fichero = os.path.join(directorio, 'ovnis.csv')
+        generador_avistamientos.genera_fichero(fichero, filas)
+        interprete = min(_ejecuta_python('-c', 'pass')[0] for _ in range(repeticiones))
+        script = min(_ejecuta_python('-c', SCRIPT_ARRANQUE, fichero)[0] for _ in range(repeticiones))
+        _, salida = _ejecuta_python('-X', 'importtime', '-c', SCRIPT_ARRANQUE, fichero)
+    modulos = importaciones(salida)
+    arranque_ms = (script - interprete) * 1000
+    res = {'interprete_ms': interprete * 1000,
+           'script_ms': script * 1000,
+           'arranque_ms': arranque_ms,
+           'importaciones_ms': sum(acumulado for _, _, acumulado, nivel in modulos if nivel == 0) / 1000,
+           'modulos': len(modulos),
+           'mas_lentos': [(nombre, propio / 1000) for nombre, propio, _, _ in
+                          sorted(modulos, key=lambda m: m[1], reverse=True)[:10]],
+           'objetivo_ms': objetivo_ms,
+           'cumple': arranque_ms <= objetivo_ms}
+    print(f"Intérprete: {res['interprete_ms']:.1f} ms; script: {res['script_ms']:.1f} ms; "
+          f"arranque: {arranque_ms:.1f} ms (objetivo: {objetivo_ms} ms)")
+    print(f"{res['modulos']} módulos importados en {res['importaciones_ms']:.1f} ms. Los más lentos:")
+    for nombre, ms in res['mas_lentos']:
+        print(f"    {nombre:40} {ms:8.2f} ms")
+    return res
+
+
+def _muestra_resultados(res):
+    for n, r in res['tamaños'].items():
+        print(f"== {n} filas (pico RSS: {r['pico_rss_kb'] / 1024:.0f} MB) ==")
+        for nombre, m in [('lee_avistamientos', r['carga'])] + list(r['consultas'].items()):
+            if 'error' in m:
+                print(f"{nombre:55} error: {m['error']}")
+                continue
+            asignado = m.get('pico_asignaciones_bytes')
+            asignado = f"{asignado / 2**20:10.1f} MB" if asignado is not None else ''
+            print(f"{nombre:55} {m['segundos']:10.4f} s {m['filas_por_segundo']:14.0f} filas/s {asignado}")
+
+
+if __name__ == "__main__":
+    analizador = argparse.ArgumentParser(description='Benchmarks de avistamientos')
+    ordenes = analizador.add_subparsers(dest='orden', required=True)
+    suite = ordenes.add_parser('suite')
+    suite.add_argument('--tamaños', type=int, nargs='+', default=[10000, 1000000, 10000000])
+    suite.add_argument('--directorio', default='.')
+    suite.add_argument('--salida', default='resultados_benchmarks.json')
+    suite.add_argument('--repeticiones', type=int, default=3)
+    suite.add_argument('--sin-asignaciones', action='store_true')
+    consultas = ordenes.add_parser('consultas')
+    consultas.add_argument('fichero')
+    consultas.add_argument('--repeticiones', type=int, default=3)
+    consultas.add_argument('--sin-asignaciones', action='store_true')
+    comparacion = ordenes.add_parser('compara')
+    comparacion.add_argument('antes')
+    comparacion.add_argument('despues')
+    memoria = ordenes.add_parser('memoria')
+    memoria.add_argument('fichero')
+    varios = ordenes.add_parser('varios')
+    varios.add_argument('fichero', nargs='?', default='data/ovnis.csv')
+    arranque = ordenes.add_parser('arranque')
+    arranque.add_argument('--filas', type=int, default=100)
+    arranque.add_argument('--repeticiones', type=int, default=10)
+    arranque.add_argument('--objetivo-ms', type=float, default=OBJETIVO_ARRANQUE_MS)
+    args = analizador.parse_args()
+
+    if args.orden == 'suite':
+        res = benchmark_suite(args.tamaños, args.directorio, args.repeticiones,
+                              not args.sin_asignaciones)
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(res, f, indent=2, ensure_ascii=False)
+        _muestra_resultados(res)
+    elif args.orden == 'consultas':
+        json.dump(benchmark_consultas(args.fichero, args.repeticiones, not args.sin_asignaciones),
+                  sys.stdout)
+    elif args.orden == 'compara':
+        with open(args.antes, encoding='utf-8') as f:
+            antes = json.load(f)
+        with open(args.despues, encoding='utf-8') as f:
+            despues = json.load(f)
+        for (n, nombre), cociente in sorted(compara(antes, despues).items()):
+            aviso = '  <-- más lento' if cociente > 1.1 else ''
+            print(f"{n:>10} {nombre:55} x{cociente:.2f}{aviso}")
+    elif args.orden == 'memoria':
+        benchmark_memoria(args.fichero)
+    elif args.orden == 'arranque':
+        if not benchmark_arranque(args.filas, args.repeticiones, args.objetivo_ms)['cumple']:
+            sys.exit("El arranque supera el objetivo")
+    else:
+        benchmark_carga(args.fichero)
+        benchmark_haversine()
+        benchmark_top_n(avistamientos.lee_avistamientos(args.fichero))
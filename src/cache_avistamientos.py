@@ -0,0 +1,298 @@
+'''
+Módulo cache_avistamientos
+Caché en disco de los avistamientos ya leídos. Los datos se guardan en formato
+columnar binario (un fichero por columna con el contenido de un array tipado,
+y las cadenas como bytes utf-8 más un array de desplazamientos) junto a un
+manifiesto con la huella del fichero csv de origen (ruta, tamaño, fecha de
+modificación y hash del contenido). Las columnas numéricas se cargan con mmap,
+sin copiarlas, así que un arranque con la caché no parsea el csv ni convierte fechas.
+
+Los ficheros de datos nunca se sobrescriben: cada caché se escribe en ficheros
+con nombres nuevos, que se anotan en el manifiesto, y se publica sustituyendo el
+manifiesto con os.replace. Así las columnas mapeadas de una caché cargada antes
+(en este proceso o en otro) siguen siendo válidas, y un proceso que lee el
+manifiesto mientras otro guarda una caché ve la anterior o la nueva, no una mezcla.
+
+Al publicar una caché se borran los ficheros de la anterior y los que no usa
+ningún manifiesto (de escrituras que fallaron o que perdieron la carrera con
+otra), para que el directorio no crezca sin límite. Estos últimos solo se borran
+si tienen más de ANTIGUEDAD_HUERFANOS segundos, porque pueden ser de otro
+proceso que todavía está escribiendo su caché.
+'''
+import hashlib
+import json
+import mmap
+import os
+import sys
+import tempfile
+import time
+from array import array
+from avistamientos_columnar import AvistamientosColumnar, crea_columnar
+from avistamientos import itera_avistamientos
+
+VERSION = 2
+MANIFIESTO = 'manifiesto.json'
+COLUMNAS_NUMERICAS = ['fechahora', 'ciudad', 'estado', 'forma', 'duracion', 'latitud', 'longitud']
+COLUMNAS_CADENAS = ['comentarios', 'ciudades', 'estados', 'formas']
+# Segundos sin modificarse tras los que un fichero de datos que no está en el
+# manifiesto se da por abandonado
+ANTIGUEDAD_HUERFANOS = 3600
+# Prefijos de los ficheros que crea guarda_snapshot (ver _fichero_nuevo)
+_PREFIJOS = tuple(nombre + '.' for nombre in COLUMNAS_NUMERICAS + COLUMNAS_CADENAS + [MANIFIESTO])
+
+
+def hash_fichero(fichero):
+    '''Devuelve el hash sha256 (en hexadecimal) del contenido de un fichero'''
+    h = hashlib.sha256()
+    with open(fichero, 'rb') as f:
+        for trozo in iter(lambda: f.read(1 << 20), b''):
+            h.update(trozo)
+    return h.hexdigest()
+
+
+def huella_fichero(fichero, con_hash=True):
+    '''
+    Devuelve la huella de un fichero: ruta absoluta, tamaño, fecha de modificación
+    y, opcionalmente, hash del contenido.
+
+    @param fichero: ruta del fichero
+    @type fichero: str
+    @param con_hash: si es True se calcula también el hash del contenido
+    @type con_hash: bool, optional
+    @return: diccionario con la huella
+    @rtype: {str: object}
+    '''
+    info = os.stat(fichero)
+    huella = {'ruta': os.path.abspath(fichero), 'tamaño': info.st_size,
+              'modificacion': info.st_mtime_ns}
+    if con_hash:
+        huella['hash'] = hash_fichero(fichero)
+    return huella
+
+
+def directorio_cache(fichero):
+    '''Directorio de caché por defecto para un fichero: fichero + '.cache' '''
+    return fichero + '.cache'
+
+
+def _fichero_nuevo(directorio, prefijo, sufijo, escritos):
+    '''Crea un fichero con un nombre que no existe en el directorio, anota su
+    nombre en escritos y devuelve el fichero abierto para escribir en binario y
+    su nombre'''
+    descriptor, ruta = tempfile.mkstemp(suffix=sufijo, prefix=prefijo + '.', dir=directorio)
+    escritos.append(os.path.basename(ruta))
+    return os.fdopen(descriptor, 'wb'), escritos[-1]
+
+
+def _guarda_columna(columna, directorio, nombre, escritos):
+    f, fichero = _fichero_nuevo(directorio, nombre, '.bin', escritos)
+    with f:
+        columna.tofile(f)
+    return fichero
+
+
+def _guarda_cadenas(cadenas, directorio, nombre, escritos):
+    desplazamientos = array('q', [0])
+    f, fichero_datos = _fichero_nuevo(directorio, nombre, '.bin', escritos)
+    with f:
+        total = 0
+        for c in cadenas:
+            datos = c.encode('utf-8')
+            f.write(datos)
+            total += len(datos)
+            desplazamientos.append(total)
+    return fichero_datos, _guarda_columna(desplazamientos, directorio, nombre + '.off', escritos)
+
+
+def _publica_manifiesto(directorio, manifiesto):
+    '''Escribe el manifiesto en un fichero temporal propio y lo pone en su sitio
+    con os.replace, de forma atómica'''
+    descriptor, temporal = tempfile.mkstemp(suffix='.tmp', prefix=MANIFIESTO + '.', dir=directorio)
+    try:
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+            json.dump(manifiesto, f, ensure_ascii=False)
+        os.replace(temporal, os.path.join(directorio, MANIFIESTO))
+    except BaseException:
+        os.remove(temporal)
+        raise
+
+
+def _ficheros(manifiesto):
+    '''Nombres de los ficheros de datos de una caché'''
+    res = set(manifiesto.get('ficheros', {}).values())
+    for datos, desplazamientos in manifiesto.get('cadenas', {}).values():
+        res.update((datos, desplazamientos))
+    return res
+
+
+def _borra(directorio, ficheros):
+    for fichero in ficheros:
+        try:
+            os.remove(os.path.join(directorio, fichero))
+        except OSError:
+            # Ya borrado por otro proceso, o (en Windows) todavía mapeado
+            pass
+
+
+def _huerfanos(directorio, conservar):
+    '''Ficheros de datos del directorio que no están en conservar y llevan
+    más de ANTIGUEDAD_HUERFANOS segundos sin modificarse'''
+    limite = time.time() - ANTIGUEDAD_HUERFANOS
+    for fichero in os.listdir(directorio):
+        if fichero.startswith(_PREFIJOS) and fichero not in conservar:
+            try:
+                if os.path.getmtime(os.path.join(directorio, fichero)) < limite:
+                    yield fichero
+            except OSError:
+                pass
+
+
+def _mapea(ruta, tipo):
+    '''Devuelve el contenido de un fichero como memoryview de tipo tipo,
+    mapeado en memoria (o un array vacío si el fichero está vacío)'''
+    if os.path.getsize(ruta) == 0:
+        return array(tipo)
+    with open(ruta, 'rb') as f:
+        mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mapa).cast(tipo)
+
+
+def _carga_cadenas(ruta_datos, ruta_desplazamientos):
+    desplazamientos = _mapea(ruta_desplazamientos, 'q')
+    datos = _mapea(ruta_datos, 'B')
+    datos = bytes(datos) if len(datos) else b''
+    return [datos[i:j].decode('utf-8') for i, j in zip(desplazamientos, desplazamientos[1:])]
+
+
+def guarda_snapshot(columnas, directorio, huella):
+    '''
+    Guarda un almacén columnar en un directorio, junto con la huella del
+    fichero del que procede. Los datos se escriben en ficheros nuevos y el
+    manifiesto se sustituye al final, de forma que una caché a medio escribir
+    nunca se da por válida; si la escritura falla, se borran los ficheros ya
+    escritos. Después se borran los ficheros de la caché anterior (las columnas
+    que otros procesos tengan mapeadas siguen siendo válidas) y los abandonados
+    que no usa ningún manifiesto.
+
+    @param columnas: almacén columnar
+    @type columnas: AvistamientosColumnar
+    @param directorio: directorio donde se guarda la caché
+    @type directorio: str
+    @param huella: huella del fichero de origen (ver huella_fichero)
+    @type huella: {str: object}
+    '''
+    os.makedirs(directorio, exist_ok=True)
+    anterior = _lee_manifiesto(directorio)
+    tipos, ficheros, cadenas = {}, {}, {}
+    escritos = []
+    try:
+        for nombre in COLUMNAS_NUMERICAS:
+            columna = getattr(columnas, nombre)
+            if not isinstance(columna, array):
+                columna = array(columna.format, columna)
+            tipos[nombre] = columna.typecode
+            ficheros[nombre] = _guarda_columna(columna, directorio, nombre, escritos)
+        for nombre in COLUMNAS_CADENAS:
+            cadenas[nombre] = _guarda_cadenas(getattr(columnas, nombre), directorio, nombre, escritos)
+        manifiesto = {'version': VERSION, 'orden_bytes': sys.byteorder, 'tipos': tipos,
+                      'ficheros': ficheros, 'cadenas': cadenas, 'huella': huella}
+        _publica_manifiesto(directorio, manifiesto)
+    except BaseException:
+        _borra(directorio, escritos)
+        raise
+    # Si otro proceso ha publicado después, su manifiesto es el que queda y sus
+    # ficheros se conservan
+    conservar = set(escritos) | _ficheros(_lee_manifiesto(directorio) or {})
+    if anterior is not None:
+        _borra(directorio, _ficheros(anterior) - conservar)
+    _borra(directorio, list(_huerfanos(directorio, conservar)))
+
+
+def carga_snapshot(directorio):
+    '''
+    Carga un almacén columnar guardado con guarda_snapshot. Las columnas
+    numéricas son memoryviews sobre los ficheros mapeados en memoria.
+
+    @param directorio: directorio donde está la caché
+    @type directorio: str
+    @return: almacén columnar
+    @rtype: AvistamientosColumnar
+    '''
+    with open(os.path.join(directorio, MANIFIESTO), encoding='utf-8') as f:
+        manifiesto = json.load(f)
+    campos = {nombre: _mapea(os.path.join(directorio, manifiesto['ficheros'][nombre]),
+                             manifiesto['tipos'][nombre])
+              for nombre in COLUMNAS_NUMERICAS}
+    for nombre in COLUMNAS_CADENAS:
+        datos, desplazamientos = manifiesto['cadenas'][nombre]
+        campos[nombre] = _carga_cadenas(os.path.join(directorio, datos),
+                                        os.path.join(directorio, desplazamientos))
+    return AvistamientosColumnar(**campos)
+
+
+def _lee_manifiesto(directorio):
+    try:
+        with open(os.path.join(directorio, MANIFIESTO), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def snapshot_valido(fichero, directorio):
+    '''
+    Indica si la caché del directorio corresponde al contenido actual del fichero.
+    Si coinciden el tamaño y la fecha de modificación no se lee el fichero; si solo
+    cambia la fecha de modificación se compara el hash del contenido, y si coincide
+    se actualiza la fecha guardada en el manifiesto.
+
+    @param fichero: ruta del fichero csv de avistamientos
+    @type fichero: str
+    @param directorio: directorio donde está la caché
+    @type directorio: str
+    @return: True si la caché se puede usar
+    @rtype: bool
+    '''
+    manifiesto = _lee_manifiesto(directorio)
+    if manifiesto is None or manifiesto.get('version') != VERSION \
+            or manifiesto.get('orden_bytes') != sys.byteorder:
+        return False
+    guardada = manifiesto['huella']
+    actual = huella_fichero(fichero, con_hash=False)
+    if guardada['ruta'] != actual['ruta'] or guardada['tamaño'] != actual['tamaño']:
+        return False
+    if guardada['modificacion'] == actual['modificacion']:
+        return True
+    if guardada['hash'] != hash_fichero(fichero):
+        return False
+    guardada['modificacion'] = actual['modificacion']
+    _publica_manifiesto(directorio, manifiesto)
+    return True
+
+
+def lee_avistamientos_cacheado(fichero, directorio=None):
+    '''
+    Devuelve los avistamientos del fichero como almacén columnar, usando la caché
+    en disco si corresponde al contenido actual del fichero. Si no existe o el
+    fichero ha cambiado, se lee el csv y se vuelve a crear la caché.
+
+    @param fichero: ruta del fichero csv que contiene los datos en codificación utf-8
+    @type fichero: str
+    @param directorio: directorio de la caché. Si es None, se usa fichero + '.cache'
+    @type directorio: str, optional
+    @return: almacén columnar con los avistamientos del fichero
+    @rtype: AvistamientosColumnar
+    '''
+    directorio = directorio or directorio_cache(fichero)
+    if snapshot_valido(fichero, directorio):
+        try:
+            return carga_snapshot(directorio)
+        except OSError:
+            # Otro proceso ha publicado una caché nueva y ha borrado los ficheros
+            # de la que se iba a cargar: se lee el csv
+            pass
+    huella = huella_fichero(fichero)
+    columnas = crea_columnar(itera_avistamientos(fichero))
+    # Si el fichero ha cambiado mientras se leía, no se guarda la caché
+    if huella_fichero(fichero, con_hash=False).items() <= huella.items():
+        guarda_snapshot(columnas, directorio, huella)
+    return columnas
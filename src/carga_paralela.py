@@ -0,0 +1,218 @@
+'''
+Módulo carga_paralela
+Lectura del fichero de avistamientos en varios procesos. El fichero se divide
+en rangos de bytes que empiezan y acaban en un fin de línea (sin partir los
+comentarios que contienen saltos de línea entre comillas), y cada rango se
+procesa en un proceso distinto.
+'''
+import csv
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce, partial
+from collections import Counter
+from avistamientos import Avistamiento
+from coordenadas import Coordenadas
+from parsers import parse_fecha_hora_mdy_memo
+
+TAM_LECTURA = 1 << 24
+
+
+def _fin_cabecera(fichero):
+    with open(fichero, 'rb') as f:
+        f.readline()
+        return f.tell()
+
+
+def _avanza_comillas(f, desde, hasta, paridad):
+    '''Cuenta las comillas entre desde y hasta, y devuelve la paridad acumulada'''
+    f.seek(desde)
+    pendiente = hasta - desde
+    while pendiente > 0:
+        trozo = f.read(min(pendiente, TAM_LECTURA))
+        if not trozo:
+            break
+        paridad ^= trozo.count(b'"') & 1
+        pendiente -= len(trozo)
+    return paridad
+
+
+def _siguiente_fin_linea(f, desde, paridad):
+    '''Busca, a partir de desde, el primer salto de línea que no esté dentro
+    de un campo entre comillas. Devuelve la posición siguiente al salto de línea
+    (o None si se llega al final del fichero) y la paridad en ese punto'''
+    f.seek(desde)
+    posicion = desde
+    while True:
+        trozo = f.read(TAM_LECTURA)
+        if not trozo:
+            return None, paridad
+        inicio = 0
+        i = trozo.find(b'\n')
+        while i != -1:
+            paridad ^= trozo.count(b'"', inicio, i) & 1
+            if paridad == 0:
+                return posicion + i + 1, paridad
+            inicio = i
+            i = trozo.find(b'\n', i + 1)
+        paridad ^= trozo.count(b'"', inicio) & 1
+        posicion += len(trozo)
+
+
+def divide_en_rangos(fichero, n):
+    '''
+    Divide el fichero (sin la cabecera) en como mucho n rangos de bytes de
+    tamaño parecido. Cada rango empieza al principio de un registro y acaba
+    al final de otro, aunque los comentarios tengan saltos de línea entre comillas.
+
+    @param fichero: ruta del fichero csv de avistamientos
+    @type fichero: str
+    @param n: número de rangos deseado
+    @type n: int
+    @return: lista de rangos (inicio, fin), consecutivos y en orden
+    @rtype: [(int, int)]
+    '''
+    inicio = _fin_cabecera(fichero)
+    tamaño = os.path.getsize(fichero)
+    cortes = [inicio]
+    paridad = 0
+    with open(fichero, 'rb') as f:
+        for k in range(1, n):
+            objetivo = inicio + (tamaño - inicio) * k // n
+            if objetivo <= cortes[-1]:
+                continue
+            paridad = _avanza_comillas(f, cortes[-1], objetivo, paridad)
+            corte, paridad = _siguiente_fin_linea(f, objetivo, paridad)
+            if corte is None or corte >= tamaño:
+                break
+            cortes.append(corte)
+    cortes.append(tamaño)
+    return [(a, b) for a, b in zip(cortes, cortes[1:]) if a < b]
+
+
+def itera_rango(fichero, inicio, fin, parser_fecha=parse_fecha_hora_mdy_memo):
+    '''
+    Genera los avistamientos contenidos en un rango de bytes del fichero.
+
+    @param fichero: ruta del fichero csv de avistamientos
+    @type fichero: str
+    @param inicio: posición del primer byte del rango
+    @type inicio: int
+    @param fin: posición siguiente al último byte del rango
+    @type fin: int
+    @param parser_fecha: función que convierte la cadena de la fecha en un datetime
+    @type parser_fecha: función str -> datetime.datetime, optional
+    @return: generador de avistamientos del rango, en el orden del fichero
+    @rtype: generador de Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+    '''
+    with open(fichero, 'rb') as f:
+        f.seek(inicio)
+        texto = f.read(fin - inicio).decode('utf-8')
+    for cadena_fecha, city, state, shape, duration, comments, latitude, longitude \
+            in csv.reader(io.StringIO(texto, newline=None)):
+        yield Avistamiento(parser_fecha(cadena_fecha), city, state, shape,
+                           int(duration), comments,
+                           Coordenadas(float(latitude), float(longitude)))
+
+
+def _lee_rango(fichero, rango):
+    return list(itera_rango(fichero, *rango))
+
+
+def _agrega_rango(fichero, funcion, rango):
+    return funcion(itera_rango(fichero, *rango))
+
+
+def lee_avistamientos_paralelo(fichero, procesos=None):
+    '''
+    Lee un fichero de avistamientos usando varios procesos y devuelve
+    la misma lista que lee_avistamientos, en el mismo orden.
+
+    @param fichero: ruta del fichero csv que contiene los datos en codificación utf-8
+    @type fichero: str
+    @param procesos: número de procesos. Si es None, uno por núcleo
+    @type procesos: int, optional
+    @return: lista de tuplas con la información de los avistamientos
+    @rtype: [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
+    '''
+    procesos = procesos or os.cpu_count() or 1
+    rangos = divide_en_rangos(fichero, procesos)
+    res = []
+    with ProcessPoolExecutor(max_workers=procesos) as ejecutor:
+        for parte in ejecutor.map(partial(_lee_rango, fichero), rangos):
+            res.extend(parte)
+    return res
+
+
+def suma_contadores(c1, c2):
+    '''Suma el contador c2 sobre c1 y devuelve c1'''
+    c1.update(c2)
+    return c1
+
+
+def agrega_paralelo(fichero, funcion, combina=suma_contadores, procesos=None):
+    '''
+    Calcula un agregado en paralelo al estilo map-reduce: cada proceso aplica
+    funcion a los avistamientos de su rango y solo devuelve el resultado parcial,
+    que después se combina con combina. Los avistamientos nunca vuelven al
+    proceso principal.
+
+    funcion y combina tienen que estar definidas a nivel de módulo para que
+    se puedan enviar a los procesos. Si el fichero no tiene avistamientos (solo
+    la cabecera), se devuelve funcion aplicada a ningún avistamiento, sin crear
+    procesos: con las funciones de conteo, un Counter vacío, como en la versión
+    secuencial.
+
+    @param fichero: ruta del fichero csv de avistamientos
+    @type fichero: str
+    @param funcion: función que recibe un iterable de avistamientos y devuelve un resultado parcial
+    @type funcion: función
+    @param combina: función que combina dos resultados parciales
+    @type combina: función, optional
+    @param procesos: número de procesos. Si es None, uno por núcleo
+    @type procesos: int, optional
+    @return: resultado de combinar los resultados parciales
+    '''
+    procesos = procesos or os.cpu_count() or 1
+    rangos = divide_en_rangos(fichero, procesos)
+    if not rangos:
+        return funcion(())
+    with ProcessPoolExecutor(max_workers=procesos) as ejecutor:
+        return reduce(combina, ejecutor.map(partial(_agrega_rango, fichero, funcion), rangos))
+
+
+def cuenta_por_año(avistamientos):
+    return Counter(a.fechahora.year for a in avistamientos)
+
+
+def cuenta_por_hora(avistamientos):
+    return Counter(a.fechahora.hour for a in avistamientos)
+
+
+def numero_avistamientos_por_año_paralelo(fichero, procesos=None):
+    '''
+    Versión map-reduce de avistamientos.numero_avistamientos_por_año
+    que trabaja directamente sobre el fichero.
+
+    @param fichero: ruta del fichero csv de avistamientos
+    @type fichero: str
+    @return: diccionario en el que las claves son los años
+         y los valores son el número de avistamientos observados en ese año
+    @rtype: {int: int}
+    '''
+    return agrega_paralelo(fichero, cuenta_por_año, procesos=procesos)
+
+
+def hora_mas_avistamientos_paralelo(fichero, procesos=None):
+    '''
+    Versión map-reduce de avistamientos.hora_mas_avistamientos
+    que trabaja directamente sobre el fichero.
+
+    @param fichero: ruta del fichero csv de avistamientos
+    @type fichero: str
+    @return: hora del día en la que se producen más avistamientos
+    @rtype: int
+    @raise ValueError: si el fichero no tiene avistamientos, como la versión secuencial
+    '''
+    avistamientos_por_hora = agrega_paralelo(fichero, cuenta_por_hora, procesos=procesos)
+    return max(avistamientos_por_hora.items(), key=lambda t: t[1])[0]
@@ -0,0 +1,132 @@
+'''
+Módulo catalogo
+Catálogo de avistamientos que se actualiza de forma incremental. El catálogo
+guarda los avistamientos junto con el estado de un conjunto de agregaciones
+(módulo agregaciones) y un índice espacial. Al añadir un avistamiento solo se
+actualizan esos estados (contadores, conjuntos por fecha, montículos de los
+n mayores por estado, sumas para las medias...), sin recalcular nada.
+'''
+import agregaciones
+import indice_espacial
+from avistamientos import (NUMERO_POR_AÑO, NUMERO_POR_MES, FORMAS_POR_MES,
+                           HORA_MAS_AVISTAMIENTOS, COORDENADAS_MAS_AVISTAMIENTOS,
+                           LONGITUD_MEDIA_COMENTARIOS_POR_ESTADO)
+
+
+def agregaciones_catalogo(n=3):
+    '''
+    Devuelve las agregaciones que mantiene un catálogo por defecto.
+
+    @param n: número de avistamientos de mayor duración que se guardan por estado
+    @type n: int
+    @return: diccionario con las agregaciones, cuyas claves son los nombres
+         de las funciones de avistamientos equivalentes
+    @rtype: {str: Agregacion}
+    '''
+    return {
+        'avistamientos_por_fecha': agregaciones.agrupa_por(lambda a: a.fechahora.date()),
+        'numero_avistamientos_por_año': NUMERO_POR_AÑO,
+        'num_avistamientos_por_mes': NUMERO_POR_MES,
+        'formas_por_mes': FORMAS_POR_MES,
+        'hora_mas_avistamientos': HORA_MAS_AVISTAMIENTOS,
+        'coordenadas_mas_avistamientos': COORDENADAS_MAS_AVISTAMIENTOS,
+        'longitud_media_comentarios_por_estado': LONGITUD_MEDIA_COMENTARIOS_POR_ESTADO,
+        'numero_avistamientos_por_estado': agregaciones.cuenta_por(lambda a: a.estado),
+        'avistamientos_mayor_duracion_por_estado':
+            agregaciones.top_n_por(lambda a: a.estado, n, lambda a: a.duracion),
+    }
+
+
+class Catalogo:
+    '''
+    Catálogo de avistamientos con agregaciones que se mantienen al día
+    a medida que se añaden avistamientos.
+
+    Atributos:
+        avistamientos: lista de avistamientos, en el orden en que se añadieron
+        indice_espacial: índice espacial de los avistamientos
+        version: número que cambia cada vez que se añaden avistamientos
+    '''
+
+    def __init__(self, avistamientos=(), agregaciones=None, n=3, tam_celda=1.0):
+        '''
+        @param avistamientos: avistamientos iniciales del catálogo
+        @type avistamientos: iterable de Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float)), optional
+        @param agregaciones: agregaciones a mantener. Si es None, se usan las de agregaciones_catalogo()
+        @type agregaciones: {str: Agregacion}, optional
+        @param n: número de avistamientos de mayor duración que se guardan por estado
+             (solo si agregaciones es None)
+        @type n: int, optional
+        @param tam_celda: tamaño de las celdas del índice espacial, en grados
+        @type tam_celda: float, optional
+        '''
+        self.avistamientos = []
+        self.agregaciones = dict(agregaciones_catalogo(n) if agregaciones is None else agregaciones)
+        self._estados = {nombre: ag.inicial() for nombre, ag in self.agregaciones.items()}
+        self._pasos = [(ag.paso, self._estados[nombre]) for nombre, ag in self.agregaciones.items()]
+        self.indice_espacial = indice_espacial.crea_indice_espacial([], tam_celda)
+        self.version = 0
+        self.agregar_lote(avistamientos)
+
+    def __len__(self):
+        return len(self.avistamientos)
+
+    def agregar(self, avistamiento):
+        '''
+        Añade un avistamiento al catálogo y actualiza las agregaciones.
+
+        @param avistamiento: avistamiento que se añade
+        @type avistamiento: Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+        '''
+        self.avistamientos.append(avistamiento)
+        for paso, estado in self._pasos:
+            paso(estado, avistamiento)
+        indice_espacial.inserta(self.indice_espacial, avistamiento)
+        self.version += 1
+
+    def agregar_lote(self, avistamientos):
+        '''
+        Añade varios avistamientos al catálogo y actualiza las agregaciones.
+
+        @param avistamientos: avistamientos que se añaden
+        @type avistamientos: iterable de Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+        @return: número de avistamientos añadidos
+        @rtype: int
+        '''
+        pasos = self._pasos
+        indice = self.indice_espacial
+        n = 0
+        for a in avistamientos:
+            self.avistamientos.append(a)
+            for paso, estado in pasos:
+                paso(estado, a)
+            indice_espacial.inserta(indice, a)
+            n += 1
+        if n:
+            self.version += 1
+        return n
+
+    def resultado(self, nombre):
+        '''
+        Devuelve el resultado actual de una de las agregaciones del catálogo.
+
+        @param nombre: nombre de la agregación (ver agregaciones_catalogo)
+        @type nombre: str
+        @return: resultado de la agregación con los avistamientos añadidos hasta ahora.
+             Puede compartir estructuras con el catálogo, así que no se debe modificar
+        '''
+        return self.agregaciones[nombre].final(self._estados[nombre])
+
+    def cercanos(self, ubicacion, radio):
+        '''
+        Devuelve el conjunto de avistamientos del catálogo a una distancia
+        inferior a radio de la ubicación.
+
+        @param ubicacion: coordenadas de la ubicación
+        @type ubicacion: Coordenadas(float, float)
+        @param radio: radio de distancia, en kilómetros
+        @type radio: float
+        @return: conjunto de avistamientos cercanos
+        @rtype: {Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))}
+        '''
+        return set(indice_espacial.cercanos(self.indice_espacial, ubicacion, radio))
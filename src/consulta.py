@@ -0,0 +1,246 @@
+'''
+Módulo consulta
+Consultas componibles sobre los avistamientos:
+
+    (consulta(datos, indices).estado('wa').forma('circle')
+        .entre(date(2005, 1, 1), date(2010, 12, 31))
+        .cerca(Coordenadas(47.61, -122.33), 50).top(5, key=lambda a: a.duracion))
+
+Cada método de filtro devuelve una consulta nueva, sin recorrer los datos. Al
+pedir el resultado (iterando, con lista, cuenta, top o agrega) se construye un
+plan: si hay un índice que sirve para alguno de los filtros (el índice por fecha
+para entre, el espacial para cerca, el de comentarios para comentario, el de
+categorías para estado y forma) se toma como origen el que deja menos
+candidatos, y el resto de filtros se comprueban en una sola pasada sobre ellos,
+de los más baratos (estado, forma) a los más caros (distancia de haversine), sin
+construir listas intermedias.
+'''
+import heapq
+from collections import namedtuple
+from datetime import date
+import agregaciones
+import indice_categorias
+import indice_comentarios
+import indice_espacial
+import indice_fechas
+from coordenadas import distancia_haversine
+
+## Definición de tipos
+# origen: de dónde salen los candidatos ('indice_espacial', 'indice_fechas',
+#     'indice_comentarios', 'indice_categorias' o 'datos')
+# estimacion: número de candidatos que se recorren (o None si no se conoce)
+# filtros: nombres de los filtros que se comprueban sobre cada candidato, en orden
+Plan = namedtuple('Plan', 'origen, estimacion, filtros')
+
+
+def _interseca(actual, nuevos):
+    nuevos = frozenset(nuevos)
+    return nuevos if actual is None else actual & nuevos
+
+
+class Consulta:
+    '''
+    Consulta sobre unos avistamientos. Se construye con la función consulta.
+    '''
+
+    def __init__(self, datos, indices):
+        self._datos = datos
+        self._indices = indices
+        self._estados = None
+        self._formas = None
+        self._fechas = (None, None)
+        self._cerca = ()
+        self._palabras = ()
+        self._predicados = ()
+
+    def _con(self, **cambios):
+        copia = Consulta.__new__(Consulta)
+        copia.__dict__.update(self.__dict__)
+        for nombre, valor in cambios.items():
+            setattr(copia, '_' + nombre, valor)
+        return copia
+
+    ## Filtros
+    def estado(self, *estados):
+        '''Se queda con los avistamientos de alguno de los estados'''
+        return self._con(estados=_interseca(self._estados, estados))
+
+    def forma(self, *formas):
+        '''Se queda con los avistamientos de alguna de las formas'''
+        return self._con(formas=_interseca(self._formas, formas))
+
+    def entre(self, fecha_inicial=None, fecha_final=None):
+        '''Se queda con los avistamientos entre las dos fechas, ambas inclusive.
+        Si alguna es None, el rango no está limitado por ese extremo'''
+        inicial, final = self._fechas
+        if fecha_inicial is not None and (inicial is None or fecha_inicial > inicial):
+            inicial = fecha_inicial
+        if fecha_final is not None and (final is None or fecha_final < final):
+            final = fecha_final
+        return self._con(fechas=(inicial, final))
+
+    def año(self, anyo):
+        '''Se queda con los avistamientos de un año'''
+        return self.entre(date(anyo, 1, 1), date(anyo, 12, 31))
+
+    def cerca(self, ubicacion, radio):
+        '''Se queda con los avistamientos a una distancia inferior a radio (km) de la ubicación'''
+        return self._con(cerca=self._cerca + ((ubicacion, radio),))
+
+    def comentario(self, palabra):
+        '''Se queda con los avistamientos cuyo comentario contiene la palabra'''
+        return self._con(palabras=self._palabras + (palabra,))
+
+    def donde(self, predicado):
+        '''Se queda con los avistamientos para los que el predicado devuelve True'''
+        return self._con(predicados=self._predicados + (predicado,))
+
+    ## Plan
+    def _origenes(self):
+        '''Genera los posibles orígenes de candidatos: (nombre, estimación, generador, filtro resuelto)'''
+        if self._cerca and 'espacial' in self._indices:
+            espacial = self._indices['espacial']
+            ubicacion, radio = min(self._cerca, key=lambda t: t[1])
+            yield ('indice_espacial', indice_espacial.numero_candidatos(espacial, ubicacion, radio),
+                   lambda: indice_espacial.cercanos(espacial, ubicacion, radio), ('cerca', ubicacion, radio))
+        if self._fechas != (None, None) and 'fechas' in self._indices:
+            fechas = self._indices['fechas']
+            yield ('indice_fechas', indice_fechas.numero_avistamientos_entre(fechas, *self._fechas),
+                   lambda: indice_fechas.itera_entre(fechas, *self._fechas), ('fechas',))
+        if self._palabras and 'comentarios' in self._indices:
+            comentarios = self._indices['comentarios']
+            filas, palabra = min(((indice_comentarios.filas_con(comentarios, p), p) for p in self._palabras),
+                                 key=lambda t: len(t[0]))
+            yield ('indice_comentarios', len(filas),
+                   lambda: map(comentarios.avistamientos.__getitem__, filas), ('comentario', palabra))
+
+        if (self._estados is not None or self._formas is not None) and 'categorias' in self._indices:
+            categorias = self._indices['categorias']
+            mapa = indice_categorias.filas(categorias, self._estados, self._formas)
+            yield ('indice_categorias', mapa.bit_count(),
+                   lambda: indice_categorias.avistamientos_filas(categorias, mapa), ('categorias',))
+
+    def _filtros(self, resuelto):
+        '''Devuelve la lista de filtros (nombre, función) que quedan por comprobar,
+        de los más baratos a los más caros'''
+        filtros = []
+        if self._estados is not None and resuelto != ('categorias',):
+            estados = self._estados
+            filtros.append(('estado', lambda a: a.estado in estados))
+        if self._formas is not None and resuelto != ('categorias',):
+            formas = self._formas
+            filtros.append(('forma', lambda a: a.forma in formas))
+        inicial, final = self._fechas
+        if resuelto != ('fechas',):
+            if inicial is not None and final is not None:
+                filtros.append(('fechas', lambda a: inicial <= a.fechahora.date() <= final))
+            elif inicial is not None:
+                filtros.append(('fechas', lambda a: a.fechahora.date() >= inicial))
+            elif final is not None:
+                filtros.append(('fechas', lambda a: a.fechahora.date() <= final))
+        for palabra in self._palabras:
+            if resuelto == ('comentario', palabra):
+                resuelto = None
+                continue
+            filtros.append(('comentario', lambda a, palabra=palabra: palabra in a.comentarios))
+        for predicado in self._predicados:
+            filtros.append(('donde', predicado))
+        for ubicacion, radio in self._cerca:
+            if resuelto == ('cerca', ubicacion, radio):
+                resuelto = None
+                continue
+            filtros.append(('cerca', lambda a, ubicacion=ubicacion, radio=radio:
+                            distancia_haversine(a.coordenadas, ubicacion) < radio))
+        return filtros
+
+    def _planifica(self):
+        try:
+            total = len(self._datos)
+        except TypeError:
+            total = None
+        elegido = ('datos', total, lambda: iter(self._datos), None)
+        for origen in self._origenes():
+            if elegido[1] is None or origen[1] < elegido[1]:
+                elegido = origen
+        nombre, estimacion, fuente, resuelto = elegido
+        return nombre, estimacion, fuente, self._filtros(resuelto)
+
+    def explica(self):
+        '''
+        Devuelve el plan con el que se ejecutaría la consulta.
+
+        @return: plan de la consulta
+        @rtype: Plan(str, int, [str])
+        '''
+        nombre, estimacion, _, filtros = self._planifica()
+        return Plan(nombre, estimacion, [f for f, _ in filtros])
+
+    ## Resultados
+    def __iter__(self):
+        _, _, fuente, filtros = self._planifica()
+        # Cada filter es perezoso: cada candidato pasa por los filtros, en orden,
+        # hasta que uno lo descarta, sin listas intermedias
+        res = fuente()
+        for _, funcion in filtros:
+            res = filter(funcion, res)
+        return res
+
+    def lista(self):
+        '''
+        @return: lista con los avistamientos que cumplen todos los filtros
+        @rtype: [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
+        '''
+        return list(self)
+
+    def cuenta(self):
+        '''
+        @return: número de avistamientos que cumplen todos los filtros
+        @rtype: int
+        '''
+        return sum(1 for _ in self)
+
+    def top(self, n, key=None):
+        '''
+        Devuelve los n avistamientos con mayor valor de key, de mayor a menor,
+        sin ordenar todos los que cumplen los filtros. Si hay empates, el orden
+        depende del origen elegido en el plan.
+
+        @param n: número de avistamientos a devolver
+        @type n: int
+        @param key: función que devuelve el valor por el que se ordena. Si es None, la duración
+        @type key: función, optional
+        @return: lista de avistamientos
+        @rtype: [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
+        '''
+        return heapq.nlargest(n, self, key=key or (lambda a: a.duracion))
+
+    def agrega(self, agregacion):
+        '''
+        Calcula una agregación (ver módulo agregaciones) sobre los avistamientos
+        que cumplen todos los filtros.
+
+        @param agregacion: agregación a calcular
+        @type agregacion: Agregacion
+        @return: resultado de la agregación
+        '''
+        return agregaciones.agrega_una(self, agregacion)
+
+
+def consulta(datos, indices=None):
+    '''
+    Empieza una consulta sobre unos avistamientos.
+
+    @param datos: lista de avistamientos, o catálogo (se usan sus avistamientos y su índice espacial)
+    @type datos: [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))] o Catalogo
+    @param indices: índices construidos sobre los mismos avistamientos, con las claves
+         'fechas' (IndiceFechas), 'espacial' (IndiceEspacial), 'comentarios' (IndiceComentarios)
+         y 'categorias' (IndiceCategorias)
+    @type indices: {str: object}, optional
+    @return: consulta sin filtros
+    @rtype: Consulta
+    '''
+    indices = dict(indices or {})
+    if hasattr(datos, 'indice_espacial'):
+        indices.setdefault('espacial', datos.indice_espacial)
+        datos = datos.avistamientos
+    return Consulta(datos, indices)
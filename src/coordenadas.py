@@ -2,7 +2,15 @@
 # Creación de una tupla con nombre para las coordenadas
 from collections import namedtuple
 from math import radians, sin, cos, asin, sqrt
+from array import array
+from itertools import repeat
+from operator import sub, mul, add
+from instrumentacion import instrumentado
 Coordenadas = namedtuple('Coordenadas', 'latitud, longitud')
+# Lote de coordenadas ya convertidas a radianes, con los cosenos de las latitudes
+LoteCoordenadas = namedtuple('LoteCoordenadas', 'latitudes, longitudes, cosenos')
+
+RADIO_TIERRA = 6371 # Radio de la tierra en kilómetros
 
 def a_radianes(coordenadas):
     '''Convierte unas coordenadas en grados a radianes
@@ -15,6 +23,7 @@ def a_radianes(coordenadas):
     return Coordenadas(radians(coordenadas.latitud), radians(coordenadas.longitud))
 
 
+@instrumentado(filas='llamada')
 def distancia_haversine(coordenadas1, coordenadas2):
     '''Devuelve la distancia de harvesine entre dos coordenadas
 
@@ -28,12 +37,85 @@ def distancia_haversine(coordenadas1, coordenadas2):
     coordenadas1 = a_radianes(coordenadas1)
     coordenadas2 = a_radianes(coordenadas2)
     dlon = coordenadas2.longitud - coordenadas1.longitud 
-    dlat = coordenadas1.latitud - coordenadas1.latitud 
+    dlat = coordenadas2.latitud - coordenadas1.latitud 
     a = sin(dlat/2)**2 + cos(coordenadas1.latitud) * cos(coordenadas2.latitud) * sin(dlon/2)**2
-    r = 6371 # Radio de la tierra en kilómetors
-    d = 2 * r * asin(sqrt(a)) 
+    d = 2 * RADIO_TIERRA * asin(sqrt(a)) 
     return d
 
+def prepara_lote(latitudes, longitudes):
+    '''Convierte a radianes una secuencia de latitudes y otra de longitudes
+    (en grados) y precalcula los cosenos de las latitudes, para poder calcular
+    muchas distancias de haversine sin repetir esas operaciones
+
+    @param latitudes: latitudes en grados
+    @type latitudes: iterable de float
+    @param longitudes: longitudes en grados
+    @type longitudes: iterable de float
+    @return: lote de coordenadas en radianes
+    @rtype: LoteCoordenadas(array de float, array de float, array de float)
+    '''
+    latitudes = array('d', map(radians, latitudes))
+    longitudes = array('d', map(radians, longitudes))
+    return LoteCoordenadas(latitudes, longitudes, array('d', map(cos, latitudes)))
+
+
+@instrumentado(filas='salida')
+def distancias_haversine_lote(origen, lote):
+    '''Devuelve la distancia de haversine entre cada punto del lote y el origen.
+    Cada distancia es exactamente la misma que daría distancia_haversine(punto, origen),
+    pero el cálculo se hace con map sobre los arrays, sin una llamada por punto.
+
+    @param origen: Coordenadas del punto de origen
+    @type origen: Coordenadas(float, float)
+    @param lote: lote de coordenadas preparado con prepara_lote
+    @type lote: LoteCoordenadas
+    @return: distancias en kilómetros, en el orden del lote
+    @rtype: array de float
+    '''
+    origen = a_radianes(origen)
+    seno_dlat = map(sin, map(mul, map(sub, repeat(origen.latitud), lote.latitudes), repeat(0.5)))
+    seno_dlon = map(sin, map(mul, map(sub, repeat(origen.longitud), lote.longitudes), repeat(0.5)))
+    a = map(add, map(pow, seno_dlat, repeat(2)),
+            map(mul, map(mul, lote.cosenos, repeat(cos(origen.latitud))),
+                map(pow, seno_dlon, repeat(2))))
+    return array('d', map(mul, repeat(2 * RADIO_TIERRA), map(asin, map(sqrt, a))))
+
+
+@instrumentado(filas='salida')
+def distancias_haversine(origen, latitudes, longitudes):
+    '''Devuelve la distancia de haversine entre el origen y cada uno de los
+    puntos dados por las secuencias de latitudes y longitudes
+
+    @param origen: Coordenadas del punto de origen
+    @type origen: Coordenadas(float, float)
+    @param latitudes: latitudes en grados
+    @type latitudes: iterable de float
+    @param longitudes: longitudes en grados
+    @type longitudes: iterable de float
+    @return: distancias en kilómetros
+    @rtype: array de float
+    '''
+    return distancias_haversine_lote(origen, prepara_lote(latitudes, longitudes))
+
+
+@instrumentado(filas='entrada')
+def matriz_distancias_haversine(origenes, latitudes, longitudes):
+    '''Devuelve la matriz de distancias de haversine entre cada origen y
+    cada uno de los puntos dados por las secuencias de latitudes y longitudes.
+    Los puntos se convierten a radianes una sola vez para todos los orígenes.
+
+    @param origenes: Coordenadas de los puntos de origen
+    @type origenes: iterable de Coordenadas(float, float)
+    @param latitudes: latitudes en grados
+    @type latitudes: iterable de float
+    @param longitudes: longitudes en grados
+    @type longitudes: iterable de float
+    @return: una fila de distancias (en kilómetros) por cada origen
+    @rtype: [array de float]
+    '''
+    lote = prepara_lote(latitudes, longitudes)
+    return [distancias_haversine_lote(origen, lote) for origen in origenes]
+
 def redondear(coordenadas):
     '''Devuelve unas coordenadas cuya latitud y longitud son 
     el redondeo de la latitud y la longitud de las coordenadas originales
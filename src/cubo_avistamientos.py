@@ -0,0 +1,352 @@
+'''
+Módulo cubo_avistamientos
+Cubo de avistamientos precalculado: número de avistamientos y suma de las
+duraciones por estado, forma, año, mes y hora.
+
+Los valores de cada dimensión se codifican como enteros, en el orden en que
+aparecen por primera vez en los avistamientos. El cubo completo tiene demasiadas
+celdas para guardarlo denso (con los datos reales, unos 67 estados × 29 formas ×
+109 años × 12 meses × 24 horas son más de 60 millones de celdas, casi todas
+vacías), así que el cubo base guarda solo las celdas con avistamientos: un array
+de códigos por dimensión y los arrays de números y duraciones, construidos en una
+sola pasada.
+
+Sobre el cubo base se materializan vistas densas: para cada combinación de (por
+defecto) dos dimensiones, un array plano con una posición por combinación de
+valores, calculada con pasos como en un array multidimensional; y, a partir de
+ellas, las vistas de una dimensión y el total. Las consultas que agrupan y filtran
+por como mucho esas dimensiones se resuelven sumando posiciones de la vista, sin
+mirar el cubo base; el resto recorre las celdas del cubo base, que son muchas
+menos que los avistamientos.
+
+Las celdas del cubo base están en el orden en que aparece su primer avistamiento,
+y cada posición de una vista guarda la primera celda que suma en ella. Así los
+resultados de una consulta, con vista o sin ella, siguen el orden en que aparecen
+los valores en los avistamientos que cumplen los filtros.
+'''
+import json
+import os
+import sys
+import tempfile
+from array import array
+from collections import namedtuple
+from itertools import combinations, compress, product, repeat
+from operator import add, mul, and_
+
+## Definición de tipos
+# valores: diccionario dimensión -> lista de valores, en el orden de sus códigos
+# codigos: diccionario dimensión -> {valor: código}
+# coordenadas: diccionario dimensión -> array con el código de cada celda del cubo base
+# numeros, duraciones: número de avistamientos y suma de duraciones de cada celda del cubo base
+# vistas: diccionario (dimensiones) -> (array de números, array de duraciones,
+#         array con la primera celda del cubo base de cada posición), densos
+CuboAvistamientos = namedtuple('CuboAvistamientos',
+                               'valores, codigos, coordenadas, numeros, duraciones, vistas')
+
+DIMENSIONES = ('estado', 'forma', 'año', 'mes', 'hora')
+MEDIDAS = ('numero', 'duracion')
+# Arrays de cada vista densa
+ARRAYS_VISTA = MEDIDAS + ('primera',)
+
+VERSION = 2
+MANIFIESTO = 'manifiesto.json'
+
+
+def _ceros(n):
+    return array('q', bytes(8 * n))
+
+
+def _pasos(valores, vista):
+    '''Paso de cada dimensión de una vista densa (la última varía más deprisa)'''
+    pasos = {}
+    paso = 1
+    for dimension in reversed(vista):
+        pasos[dimension] = paso
+        paso *= len(valores[dimension])
+    return pasos, paso
+
+
+def _vista_base(valores, coordenadas, numeros, duraciones, vista):
+    '''Calcula una vista densa recorriendo las celdas del cubo base'''
+    pasos, tam = _pasos(valores, vista)
+    vista_numeros, vista_duraciones = _ceros(tam), _ceros(tam)
+    # Las posiciones vacías tienen como primera celda el número de celdas
+    primeras = array('q', repeat(len(numeros), tam))
+    posiciones = repeat(0)
+    for dimension in vista:
+        posiciones = map(add, posiciones, map(mul, coordenadas[dimension], repeat(pasos[dimension])))
+    for celda, (i, n, d) in enumerate(zip(posiciones, numeros, duraciones)):
+        if not vista_numeros[i]:
+            primeras[i] = celda
+        vista_numeros[i] += n
+        vista_duraciones[i] += d
+    return vista_numeros, vista_duraciones, primeras
+
+
+def _enrolla(valores, vista, datos, destino, celdas):
+    '''Calcula una vista densa sumando las posiciones de otra vista densa con más dimensiones'''
+    pasos, tam = _pasos(valores, destino)
+    destino_numeros, destino_duraciones = _ceros(tam), _ceros(tam)
+    numeros, duraciones, primeras = datos
+    destino_primeras = array('q', repeat(celdas, tam))
+    for i, codigos in enumerate(product(*(range(len(valores[d])) for d in vista))):
+        j = sum(c * pasos[d] for d, c in zip(vista, codigos) if d in pasos)
+        destino_numeros[j] += numeros[i]
+        destino_duraciones[j] += duraciones[i]
+        if primeras[i] < destino_primeras[j]:
+            destino_primeras[j] = primeras[i]
+    return destino_numeros, destino_duraciones, destino_primeras
+
+
+def _crea_vistas(valores, coordenadas, numeros, duraciones, max_dimensiones):
+    vistas = {}
+    for vista in combinations(DIMENSIONES, max_dimensiones):
+        vistas[vista] = _vista_base(valores, coordenadas, numeros, duraciones, vista)
+    # Las vistas con menos dimensiones salen de la primera vista que las contiene
+    for k in range(max_dimensiones - 1, -1, -1):
+        for vista in combinations(DIMENSIONES, k):
+            origen = next(v for v in combinations(DIMENSIONES, k + 1) if set(vista) <= set(v))
+            vistas[vista] = _enrolla(valores, origen, vistas[origen], vista, len(numeros))
+    return vistas
+
+
+def _con_codigos(valores, coordenadas, numeros, duraciones, vistas):
+    codigos = {d: {v: i for i, v in enumerate(valores[d])} for d in DIMENSIONES}
+    return CuboAvistamientos(valores, codigos, coordenadas, numeros, duraciones, vistas)
+
+
+def crea_cubo(avistamientos, max_dimensiones=2):
+    '''
+    Construye el cubo de los avistamientos, en una sola pasada, y materializa
+    las vistas densas de hasta max_dimensiones dimensiones.
+
+    @param avistamientos: avistamientos
+    @type avistamientos: iterable de Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+    @param max_dimensiones: número de dimensiones de las vistas densas más grandes
+    @type max_dimensiones: int, optional
+    @return: cubo de los avistamientos
+    @rtype: CuboAvistamientos
+    '''
+    if not 0 <= max_dimensiones <= len(DIMENSIONES):
+        raise ValueError(f"El número de dimensiones de las vistas debe estar entre 0 y {len(DIMENSIONES)}")
+    # Celdas indexadas por sus valores; el diccionario conserva el orden de aparición
+    celdas = {}
+    for a in avistamientos:
+        f = a.fechahora
+        clave = (a.estado, a.forma, f.year, f.month, f.hour)
+        celda = celdas.get(clave)
+        if celda is None:
+            celdas[clave] = [1, a.duracion]
+        else:
+            celda[0] += 1
+            celda[1] += a.duracion
+    valores, coordenadas = {}, {}
+    for i, dimension in enumerate(DIMENSIONES):
+        # El primer avistamiento con cada valor está en la primera celda con ese valor
+        codigos = {v: c for c, v in enumerate(dict.fromkeys(clave[i] for clave in celdas))}
+        valores[dimension] = list(codigos)
+        coordenadas[dimension] = array('i', (codigos[clave[i]] for clave in celdas))
+    numeros = array('q', (n for n, _ in celdas.values()))
+    duraciones = array('q', (d for _, d in celdas.values()))
+    vistas = _crea_vistas(valores, coordenadas, numeros, duraciones, max_dimensiones)
+    return _con_codigos(valores, coordenadas, numeros, duraciones, vistas)
+
+
+def _valores_filtro(valor):
+    if isinstance(valor, (set, frozenset, list, tuple, range)):
+        return valor
+    return (valor,)
+
+
+def _agrega_vista(cubo, vista, dimensiones, filtros, medida):
+    '''Agrega recorriendo las posiciones seleccionadas de una vista densa'''
+    numeros, datos = cubo.vistas[vista][0], cubo.vistas[vista][MEDIDAS.index(medida)]
+    primeras = cubo.vistas[vista][-1]
+    pasos, _ = _pasos(cubo.valores, vista)
+    # Se parte de la posición 0 y se añade cada dimensión (primero las de agrupación,
+    # en el orden pedido, que forman la clave) multiplicando por sus valores admitidos
+    posiciones = [((), 0)]
+    for d in list(dimensiones) + [d for d in vista if d not in dimensiones]:
+        if d in filtros:
+            codigos = cubo.codigos[d]
+            candidatos = [(v, codigos[v] * pasos[d]) for v in dict.fromkeys(filtros[d]) if v in codigos]
+        else:
+            candidatos = list(zip(cubo.valores[d], range(0, len(cubo.valores[d]) * pasos[d], pasos[d])))
+        if d in dimensiones:
+            posiciones = [(clave + (v,), i + j) for clave, i in posiciones for v, j in candidatos]
+        else:
+            posiciones = [(clave, i + j) for clave, i in posiciones for _, j in candidatos]
+    # Las posiciones con avistamientos se recorren por su primera celda (cada celda
+    # suma en una sola posición, así que no hay empates), y las claves quedan en
+    # el orden de su primer avistamiento, como en _agrega_base
+    ocupadas = sorted((primeras[i], clave, i) for clave, i in posiciones if numeros[i])
+    res = {}
+    for _, clave, i in ocupadas:
+        if len(clave) == 1:
+            clave = clave[0]
+        res[clave] = res.get(clave, 0) + datos[i]
+    return res
+
+
+def _agrega_base(cubo, dimensiones, filtros, medida):
+    '''Agrega recorriendo las celdas del cubo base que cumplen los filtros'''
+    datos = cubo.numeros if medida == 'numero' else cubo.duraciones
+    selectores = None
+    for d, filtro in filtros.items():
+        codigos = {cubo.codigos[d][v] for v in filtro if v in cubo.codigos[d]}
+        seleccion = bytes(map(codigos.__contains__, cubo.coordenadas[d]))
+        selectores = seleccion if selectores is None else bytes(map(and_, selectores, seleccion))
+    if selectores is None:
+        columnas = [cubo.coordenadas[d] for d in dimensiones]
+    else:
+        columnas = [compress(cubo.coordenadas[d], selectores) for d in dimensiones]
+        datos = compress(datos, selectores)
+    # Las celdas están en el orden de su primer avistamiento, así que las claves
+    # quedan en el orden en que aparecen en los avistamientos que cumplen los filtros
+    por_codigos = {}
+    for *codigos, dato in zip(*columnas, datos):
+        codigos = tuple(codigos)
+        por_codigos[codigos] = por_codigos.get(codigos, 0) + dato
+    res = {}
+    for codigos, dato in por_codigos.items():
+        clave = tuple(cubo.valores[d][c] for d, c in zip(dimensiones, codigos))
+        res[clave[0] if len(clave) == 1 else clave] = dato
+    return res
+
+
+def agrega(cubo, dimensiones=(), medida='numero', **filtros):
+    '''
+    Devuelve el número de avistamientos (o la suma de sus duraciones) agrupados
+    por unas dimensiones, de los avistamientos que cumplen los filtros. Sin
+    dimensiones, devuelve el total. Por ejemplo:
+
+        agrega(cubo, ('año',), 'duracion', estado='ca', forma={'light', 'fireball'})
+
+    Solo aparecen las combinaciones de valores con algún avistamiento, y las
+    claves siguen el orden en que aparecen los valores en los avistamientos que
+    cumplen los filtros.
+
+    @param cubo: cubo de los avistamientos
+    @type cubo: CuboAvistamientos
+    @param dimensiones: dimensiones por las que se agrupa (ver DIMENSIONES)
+    @type dimensiones: (str), optional
+    @param medida: 'numero' o 'duracion'
+    @type medida: str, optional
+    @param filtros: para cada dimensión que se filtra, el valor o conjunto de valores admitidos
+    @return: diccionario {valor: medida} si se agrupa por una dimensión,
+         {(valor, ...): medida} si se agrupa por varias, o el total si no se agrupa
+    @rtype: {object: int} o int
+    '''
+    desconocidas = [d for d in (*dimensiones, *filtros) if d not in DIMENSIONES]
+    if desconocidas:
+        raise ValueError(f"Dimensiones desconocidas: {', '.join(desconocidas)}")
+    if medida not in MEDIDAS:
+        raise ValueError(f"Medida desconocida: {medida}")
+    if len(set(dimensiones)) != len(dimensiones):
+        raise ValueError("Las dimensiones no pueden repetirse")
+    filtros = {d: _valores_filtro(v) for d, v in filtros.items()}
+    necesarias = set(dimensiones) | set(filtros)
+    vista = tuple(d for d in DIMENSIONES if d in necesarias)
+    if vista in cubo.vistas:
+        res = _agrega_vista(cubo, vista, dimensiones, filtros, medida)
+    else:
+        res = _agrega_base(cubo, dimensiones, filtros, medida)
+    return res if dimensiones else res.get((), 0)
+
+
+def valor_mas_avistamientos(cubo, dimension, **filtros):
+    '''
+    Devuelve el valor de una dimensión con más avistamientos (si hay empate, el
+    que aparece antes en los avistamientos) de los que cumplen los filtros.
+
+    @param cubo: cubo de los avistamientos
+    @type cubo: CuboAvistamientos
+    @param dimension: dimensión (ver DIMENSIONES)
+    @type dimension: str
+    @param filtros: para cada dimensión que se filtra, el valor o conjunto de valores admitidos
+    @return: valor con más avistamientos
+    '''
+    numeros = agrega(cubo, (dimension,), **filtros)
+    if not numeros:
+        raise ValueError("No hay avistamientos que cumplan los filtros")
+    # max devuelve el primero de los empatados, y las claves están en orden de aparición
+    return max(numeros.items(), key=lambda t: t[1])[0]
+
+
+## Persistencia
+def _guarda_array(datos, ruta):
+    with open(ruta, 'wb') as f:
+        datos.tofile(f)
+
+
+def _carga_array(ruta, tipo, n, cambia_orden):
+    datos = array(tipo)
+    with open(ruta, 'rb') as f:
+        datos.fromfile(f, n)
+    if cambia_orden:
+        datos.byteswap()
+    return datos
+
+
+def guarda_cubo(cubo, directorio):
+    '''
+    Guarda un cubo en un directorio: un fichero binario por array y un manifiesto
+    con los valores de las dimensiones y las vistas. El manifiesto se escribe al
+    final, de forma que un cubo a medio escribir no se puede cargar.
+
+    @param cubo: cubo de los avistamientos
+    @type cubo: CuboAvistamientos
+    @param directorio: directorio donde se guarda el cubo
+    @type directorio: str
+    '''
+    os.makedirs(directorio, exist_ok=True)
+    ruta_manifiesto = os.path.join(directorio, MANIFIESTO)
+    if os.path.exists(ruta_manifiesto):
+        os.remove(ruta_manifiesto)
+    for i, dimension in enumerate(DIMENSIONES):
+        _guarda_array(cubo.coordenadas[dimension], os.path.join(directorio, f'coordenadas_{i}.bin'))
+    _guarda_array(cubo.numeros, os.path.join(directorio, 'numeros.bin'))
+    _guarda_array(cubo.duraciones, os.path.join(directorio, 'duraciones.bin'))
+    vistas = list(cubo.vistas)
+    for i, vista in enumerate(vistas):
+        for nombre, datos in zip(ARRAYS_VISTA, cubo.vistas[vista]):
+            _guarda_array(datos, os.path.join(directorio, f'vista_{i}_{nombre}.bin'))
+    manifiesto = {'version': VERSION, 'orden_bytes': sys.byteorder, 'celdas': len(cubo.numeros),
+                  'valores': cubo.valores, 'vistas': vistas}
+    descriptor, temporal = tempfile.mkstemp(suffix='.tmp', prefix=MANIFIESTO + '.', dir=directorio)
+    try:
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+            json.dump(manifiesto, f, ensure_ascii=False)
+        os.replace(temporal, ruta_manifiesto)
+    except BaseException:
+        os.remove(temporal)
+        raise
+
+
+def carga_cubo(directorio):
+    '''
+    Carga un cubo guardado con guarda_cubo.
+
+    @param directorio: directorio donde está el cubo
+    @type directorio: str
+    @return: cubo de los avistamientos
+    @rtype: CuboAvistamientos
+    '''
+    with open(os.path.join(directorio, MANIFIESTO), encoding='utf-8') as f:
+        manifiesto = json.load(f)
+    if manifiesto.get('version') != VERSION:
+        raise ValueError(f"Versión del cubo no soportada: {manifiesto.get('version')}")
+    cambia_orden = manifiesto['orden_bytes'] != sys.byteorder
+    n = manifiesto['celdas']
+    valores = manifiesto['valores']
+    coordenadas = {d: _carga_array(os.path.join(directorio, f'coordenadas_{i}.bin'), 'i', n, cambia_orden)
+                   for i, d in enumerate(DIMENSIONES)}
+    numeros = _carga_array(os.path.join(directorio, 'numeros.bin'), 'q', n, cambia_orden)
+    duraciones = _carga_array(os.path.join(directorio, 'duraciones.bin'), 'q', n, cambia_orden)
+    vistas = {}
+    for i, vista in enumerate(map(tuple, manifiesto['vistas'])):
+        _, tam = _pasos(valores, vista)
+        vistas[vista] = tuple(_carga_array(os.path.join(directorio, f'vista_{i}_{nombre}.bin'),
+                                           'q', tam, cambia_orden)
+                              for nombre in ARRAYS_VISTA)
+    return _con_codigos(valores, coordenadas, numeros, duraciones, vistas)
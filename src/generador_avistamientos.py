@@ -0,0 +1,121 @@
+'''
+Módulo generador_avistamientos
+Generador de ficheros de avistamientos sintéticos con el mismo formato que
+data/ovnis.csv, para medir el rendimiento con muchas filas. Las distribuciones
+imitan las del fichero real: más avistamientos en los estados más poblados,
+formas dominadas por 'light', años concentrados a partir de 1995, horas
+concentradas al anochecer y duraciones muy asimétricas.
+Se ejecuta como script: python generador_avistamientos.py fichero numero_filas [semilla]
+'''
+import csv
+import random
+import sys
+
+# estado: (peso, latitud, longitud, ciudades)
+ESTADOS = {
+    'ca': (12.0, 36.8, -119.4, ['los angeles', 'san diego', 'sacramento', 'san jose', 'fresno']),
+    'fl': (5.5, 27.8, -81.7, ['miami', 'orlando', 'tampa', 'clearwater', 'fort myers']),
+    'wa': (5.0, 47.4, -120.7, ['seattle', 'spokane', 'tacoma', 'olympia']),
+    'tx': (5.0, 31.0, -99.9, ['houston', 'austin', 'dallas', 'san antonio', 'el paso']),
+    'ny': (4.0, 42.9, -75.5, ['new york city', 'buffalo', 'rochester', 'albany']),
+    'il': (3.5, 40.0, -89.2, ['chicago', 'springfield', 'peoria']),
+    'az': (3.5, 34.2, -111.6, ['phoenix', 'tucson', 'mesa', 'sedona']),
+    'pa': (3.5, 41.2, -77.6, ['philadelphia', 'pittsburgh', 'erie']),
+    'oh': (3.3, 40.4, -82.9, ['columbus', 'cleveland', 'cincinnati']),
+    'mi': (2.8, 44.3, -85.6, ['detroit', 'grand rapids', 'lansing']),
+    'nc': (2.6, 35.6, -79.0, ['charlotte', 'raleigh', 'asheville']),
+    'or': (2.4, 43.8, -120.6, ['portland', 'eugene', 'salem']),
+    'in': (1.9, 40.3, -86.1, ['indianapolis', 'muncie', 'fort wayne']),
+    'co': (1.9, 39.1, -105.4, ['denver', 'colorado springs', 'boulder']),
+    'nj': (1.7, 40.1, -74.4, ['newark', 'trenton', 'jersey city']),
+    'mo': (1.7, 38.6, -92.6, ['st. louis', 'kansas city', 'springfield']),
+    'ga': (1.6, 33.0, -83.6, ['atlanta', 'savannah', 'augusta']),
+    'va': (1.6, 37.4, -78.7, ['richmond', 'virginia beach', 'norfolk']),
+    'nm': (1.0, 34.5, -106.0, ['albuquerque', 'roswell', 'deming (somewhere near)']),
+    'ky': (0.9, 37.8, -84.3, ['louisville', 'lexington', 'independence']),
+}
+FORMAS = {
+    'light': 20.0, 'triangle': 10.0, 'circle': 9.5, 'fireball': 7.7, 'unknown': 7.0,
+    'other': 7.0, 'sphere': 6.6, 'disk': 6.5, 'oval': 4.7, 'formation': 3.0,
+    'changing': 2.4, 'cigar': 2.5, 'flash': 1.7, 'rectangle': 1.7, 'cylinder': 1.6,
+    'diamond': 1.5, 'chevron': 1.2, 'egg': 0.9, 'teardrop': 0.9, 'cone': 0.4,
+    'cross': 0.3,
+}
+PALABRAS = ['bright', 'light', 'lights', 'object', 'objects', 'sky', 'moving', 'hovering',
+            'orange', 'red', 'white', 'green', 'blue', 'slowly', 'fast', 'silent', 'ufo',
+            'UFO', 'triangle', 'formation', 'craft', 'saw', 'over', 'the', 'a', 'three',
+            'then', 'disappeared', 'north', 'south', 'east', 'west', 'high', 'low',
+            'strange', 'shaped', 'large', 'small', 'flashing', 'glowing', 'near',
+            'highway', 'house', 'night', '((NUFORC', 'Note:', 'PD))', 'witness', 'reports']
+
+
+def _año(aleatorio):
+    # Pocos avistamientos antes de 1995 y crecimiento fuerte después
+    if aleatorio.random() < 0.15:
+        return aleatorio.randint(1940, 1994)
+    return min(2014, 1995 + int(aleatorio.triangular(0, 20, 18)))
+
+
+def _hora(aleatorio):
+    # Pico al anochecer (alrededor de las 21h) y pocas horas de día
+    return int(aleatorio.gauss(21, 3)) % 24
+
+
+def _duracion(aleatorio):
+    return max(1, min(int(aleatorio.lognormvariate(5.5, 1.6)), 97836000))
+
+
+def _comentario(aleatorio):
+    texto = ' '.join(aleatorio.choices(PALABRAS, k=aleatorio.randint(3, 25)))
+    if aleatorio.random() < 0.05:
+        texto += ', "quoted" object'
+    return texto
+
+
+def genera_filas(n, semilla=0):
+    '''
+    Genera n filas de avistamientos sintéticos en el formato del fichero csv.
+
+    @param n: número de filas
+    @type n: int
+    @param semilla: semilla del generador aleatorio, para que el resultado sea reproducible
+    @type semilla: int, optional
+    @return: generador de filas
+    @rtype: generador de [str]
+    '''
+    aleatorio = random.Random(semilla)
+    estados = list(ESTADOS)
+    pesos_estados = [ESTADOS[e][0] for e in estados]
+    formas = list(FORMAS)
+    pesos_formas = list(FORMAS.values())
+    for _ in range(n):
+        estado = aleatorio.choices(estados, pesos_estados)[0]
+        _, latitud, longitud, ciudades = ESTADOS[estado]
+        fecha = f'{aleatorio.randint(1, 12):02d}/{aleatorio.randint(1, 28):02d}/{_año(aleatorio)} ' \
+                f'{_hora(aleatorio):02d}:{aleatorio.choice((0, 0, 0, 15, 30, 45, aleatorio.randint(0, 59))):02d}'
+        yield [fecha, aleatorio.choice(ciudades), estado,
+               aleatorio.choices(formas, pesos_formas)[0], str(_duracion(aleatorio)),
+               _comentario(aleatorio),
+               f'{latitud + aleatorio.gauss(0, 1.5):.7f}', f'{longitud + aleatorio.gauss(0, 2):.7f}']
+
+
+def genera_fichero(fichero, n, semilla=0):
+    '''
+    Escribe un fichero csv de avistamientos sintéticos con n filas más la cabecera.
+
+    @param fichero: ruta del fichero a crear
+    @type fichero: str
+    @param n: número de filas
+    @type n: int
+    @param semilla: semilla del generador aleatorio
+    @type semilla: int, optional
+    '''
+    with open(fichero, 'w', encoding='utf-8', newline='') as f:
+        escritor = csv.writer(f)
+        escritor.writerow(['datetime', 'city', 'state', 'shape', 'duration', 'comments',
+                           'latitude', 'longitude'])
+        escritor.writerows(genera_filas(n, semilla))
+
+
+if __name__ == "__main__":
+    genera_fichero(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]) if len(sys.argv) > 3 else 0)
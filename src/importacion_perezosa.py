@@ -0,0 +1,58 @@
+'''
+Módulo importacion_perezosa
+Importación perezosa de módulos, para que importar avistamientos (o cualquier
+módulo que lo use) no cargue los motores opcionales (índices, cubo...) ni las
+bibliotecas que solo necesitan algunas funciones.
+
+    indice_fechas = importacion_perezosa.importa('indice_fechas')
+
+devuelve enseguida un objeto que importa el módulo la primera vez que se accede
+a uno de sus atributos y a partir de ahí le pasa todos los accesos. Al contrario
+que un __getattr__ de módulo (PEP 562), que solo se usa cuando se accede al
+atributo desde fuera del módulo, funciona también como variable global dentro
+de las funciones del módulo que lo importa. El módulo se importa con el
+mecanismo normal (y su cerrojo), así que sigue habiendo un único módulo en
+sys.modules, se importe antes o después de forma perezosa o normal.
+
+No usa importlib.util.LazyLoader porque importar importlib.util cuesta más que
+muchos de los módulos que se quieren aplazar.
+'''
+import sys
+
+
+class ModuloPerezoso:
+    '''
+    Módulo que se importa la primera vez que se usa uno de sus atributos.
+    Se construye con la función importa.
+    '''
+
+    def __init__(self, nombre):
+        self._nombre = nombre
+        self._modulo = None
+
+    def __getattr__(self, atributo):
+        # Solo se llama con los atributos que no son del propio objeto
+        modulo = self._modulo
+        if modulo is None:
+            __import__(self._nombre)
+            modulo = self._modulo = sys.modules[self._nombre]
+        return getattr(modulo, atributo)
+
+    def __repr__(self):
+        estado = 'cargado' if self._modulo is not None else 'sin cargar'
+        return f"<módulo perezoso '{self._nombre}' ({estado})>"
+
+
+def importa(nombre):
+    '''
+    Importa un módulo de forma perezosa. Si el módulo ya está importado, se
+    devuelve sin más.
+
+    @param nombre: nombre del módulo
+    @type nombre: str
+    @return: el módulo, o un módulo perezoso que se carga la primera vez que se usa
+    @rtype: module o ModuloPerezoso
+    '''
+    if nombre in sys.modules:
+        return sys.modules[nombre]
+    return ModuloPerezoso(nombre)
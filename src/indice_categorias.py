@@ -0,0 +1,280 @@
+'''
+Módulo indice_categorias
+Índice de mapas de bits sobre las columnas categóricas de los avistamientos
+(estado, forma y año). Para cada valor se guarda un entero de Python cuyo bit i
+vale 1 si el avistamiento i tiene ese valor.
+
+Los filtros por varios estados o formas se resuelven con operaciones de bits
+sobre esos enteros (| para "alguno de", & para combinar columnas), que Python
+hace sobre palabras de máquina, y los recuentos con int.bit_count, sin mirar
+los avistamientos uno a uno.
+
+Las duraciones se guardan también como mapas de bits, uno por cada bit de la
+duración (índice por rodajas de bits): la rodaja k tiene a 1 los avistamientos
+cuya duración tiene a 1 el bit k. Así la suma de las duraciones de un mapa m es
+la suma de 2**k * (rodaja_k & m).bit_count(), y la duración máxima se obtiene
+recorriendo las rodajas de la más alta a la más baja, sin mirar las filas.
+Solo las consultas que devuelven avistamientos o agrupan por otra columna
+recorren las filas seleccionadas, con itertools.compress.
+'''
+from collections import namedtuple, defaultdict
+from functools import reduce
+from itertools import compress, repeat
+from operator import or_, and_, rshift
+
+## Definición de tipos
+# avistamientos: lista de avistamientos indexados (los bits se refieren a sus posiciones)
+# estados, formas, años: diccionario valor -> mapa de bits de los avistamientos con ese valor
+# rodajas: lista con un mapa de bits por cada bit de las duraciones, del menos al más significativo
+# duraciones, años_filas: duración y año de cada avistamiento
+IndiceCategorias = namedtuple('IndiceCategorias',
+                              'avistamientos, estados, formas, años, rodajas, duraciones, años_filas')
+
+# Convierten entre los caracteres '0' y '1' de bin() y los bytes 0 y 1
+_BITS = bytes.maketrans(b'01', b'\x00\x01')
+_CARACTERES = bytes.maketrans(b'\x00\x01', b'01')
+
+
+def _mapa_bits(posiciones, n):
+    '''Construye el mapa de bits con las posiciones dadas, de n bits'''
+    buf = bytearray((n + 7) // 8)
+    for i in posiciones:
+        buf[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buf, 'little')
+
+
+def _mapas_bits(valores, n):
+    posiciones = defaultdict(list)
+    for i, valor in enumerate(valores):
+        posiciones[valor].append(i)
+    return {valor: _mapa_bits(p, n) for valor, p in posiciones.items()}
+
+
+def _primera_fila(mapa):
+    '''Posición del bit a 1 más bajo de un mapa de bits no vacío'''
+    return (mapa & -mapa).bit_length() - 1
+
+
+def _rodajas(duraciones):
+    '''Construye un mapa de bits por cada bit de las duraciones'''
+    if duraciones and min(duraciones) < 0:
+        raise ValueError("Las duraciones no pueden ser negativas")
+    maximo = max(duraciones, default=0)
+    # Los bits de la rodaja se calculan con map sobre todo el array, en C, y el
+    # entero se lee de su representación en binario (fila 0 = bit menos significativo)
+    return [int(bytes(map(and_, map(rshift, duraciones, repeat(k)), repeat(1)))[::-1]
+                .translate(_CARACTERES) or b'0', 2)
+            for k in range(maximo.bit_length())]
+
+
+def crea_indice_categorias(avistamientos):
+    '''
+    Construye los mapas de bits de estados, formas, años y duraciones de los
+    avistamientos. Las duraciones no pueden ser negativas.
+
+    @param avistamientos: avistamientos que se quieren indexar
+    @type avistamientos: iterable de Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+    @return: índice de categorías
+    @rtype: IndiceCategorias
+    '''
+    avistamientos = list(avistamientos)
+    n = len(avistamientos)
+    # Listas y no arrays: compress sobre un array crea un int por fila
+    duraciones = [a.duracion for a in avistamientos]
+    años_filas = [a.fechahora.year for a in avistamientos]
+    return IndiceCategorias(avistamientos,
+                            _mapas_bits((a.estado for a in avistamientos), n),
+                            _mapas_bits((a.forma for a in avistamientos), n),
+                            _mapas_bits(años_filas, n),
+                            _rodajas(duraciones),
+                            duraciones,
+                            años_filas)
+
+
+def selectores(mapa):
+    '''
+    Devuelve un byte por avistamiento (0 o 1) a partir de un mapa de bits,
+    para usarlo con itertools.compress.
+
+    @param mapa: mapa de bits
+    @type mapa: int
+    @return: selectores, hasta el último bit a 1
+    @rtype: bytes
+    '''
+    return bin(mapa)[:1:-1].encode().translate(_BITS)
+
+
+def filas(indice, estados=None, formas=None, años=None):
+    '''
+    Devuelve el mapa de bits de los avistamientos de alguno de los estados,
+    alguna de las formas y alguno de los años dados. Las columnas para las que
+    se pasa None no se filtran.
+
+    @param indice: índice de categorías
+    @type indice: IndiceCategorias
+    @param estados: estados
+    @type estados: {str}, optional
+    @param formas: formas
+    @type formas: {str}, optional
+    @param años: años
+    @type años: {int}, optional
+    @return: mapa de bits de los avistamientos que cumplen los filtros
+    @rtype: int
+    '''
+    res = (1 << len(indice.avistamientos)) - 1
+    for mapas, valores in ((indice.estados, estados), (indice.formas, formas), (indice.años, años)):
+        if valores is not None:
+            res &= reduce(or_, (mapas.get(v, 0) for v in valores), 0)
+    return res
+
+
+def numero(indice, estados=None, formas=None, años=None):
+    '''
+    Devuelve el número de avistamientos que cumplen los filtros (ver filas).
+
+    @return: número de avistamientos
+    @rtype: int
+    '''
+    return filas(indice, estados, formas, años).bit_count()
+
+
+def avistamientos_filas(indice, mapa):
+    '''
+    Genera los avistamientos de un mapa de bits, en el orden en que se indexaron.
+
+    @param indice: índice de categorías
+    @type indice: IndiceCategorias
+    @param mapa: mapa de bits
+    @type mapa: int
+    @return: generador de avistamientos
+    @rtype: generador de Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+    '''
+    return compress(indice.avistamientos, selectores(mapa))
+
+
+def suma_duraciones(indice, mapa):
+    '''
+    Devuelve la suma de las duraciones de los avistamientos de un mapa de bits.
+
+    @param indice: índice de categorías
+    @type indice: IndiceCategorias
+    @param mapa: mapa de bits
+    @type mapa: int
+    @return: suma de las duraciones
+    @rtype: int
+    '''
+    if not mapa:
+        return 0
+    return sum((rodaja & mapa).bit_count() << k for k, rodaja in enumerate(indice.rodajas))
+
+
+def filas_mayor_duracion(indice, mapa):
+    '''
+    Devuelve el mapa de bits de los avistamientos de mayor duración de entre
+    los de un mapa de bits (más de uno si hay empate).
+
+    @param indice: índice de categorías
+    @type indice: IndiceCategorias
+    @param mapa: mapa de bits
+    @type mapa: int
+    @return: mapa de bits de los avistamientos de mayor duración
+    @rtype: int
+    '''
+    for rodaja in reversed(indice.rodajas):
+        con_bit = mapa & rodaja
+        if con_bit:
+            mapa = con_bit
+    return mapa
+
+
+def formas_estados(indice, estados):
+    '''
+    Devuelve el número de formas distintas observadas en alguno de los estados.
+    Equivale a avistamientos.formas_estados.
+
+    @param indice: índice de categorías
+    @type indice: IndiceCategorias
+    @param estados: estados
+    @type estados: {str}
+    @return: número de formas distintas
+    @rtype: int
+    '''
+    mapa = filas(indice, estados=estados)
+    return sum(1 for mapa_forma in indice.formas.values() if mapa_forma & mapa)
+
+
+def duracion_total(indice, estado):
+    '''
+    Devuelve la duración total de los avistamientos de un estado.
+    Equivale a avistamientos.duracion_total.
+
+    @param indice: índice de categorías
+    @type indice: IndiceCategorias
+    @param estado: estado
+    @type estado: str
+    @return: duración total en segundos
+    @rtype: int
+    '''
+    return suma_duraciones(indice, indice.estados.get(estado, 0))
+
+
+def avistamiento_mayor_duracion(indice, forma):
+    '''
+    Devuelve el avistamiento de mayor duración de una forma (el primero, si hay
+    empate). Equivale a avistamientos.avistamiento_mayor_duracion.
+
+    @param indice: índice de categorías
+    @type indice: IndiceCategorias
+    @param forma: forma
+    @type forma: str
+    @return: avistamiento más largo de la forma
+    @rtype: Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+    '''
+    mapa = indice.formas.get(forma, 0)
+    if not mapa:
+        raise ValueError(f"No hay avistamientos de forma {forma}")
+    mayores = filas_mayor_duracion(indice, mapa)
+    return indice.avistamientos[_primera_fila(mayores)]
+
+
+def año_mas_avistamientos_forma(indice, forma):
+    '''
+    Devuelve el año con más avistamientos de una forma (si hay empate, el del
+    año que aparece antes en los avistamientos). Equivale a
+    avistamientos.año_mas_avistamientos_forma.
+
+    @param indice: índice de categorías
+    @type indice: IndiceCategorias
+    @param forma: forma
+    @type forma: str
+    @return: año con más avistamientos de la forma
+    @rtype: int
+    '''
+    mapa_forma = indice.formas.get(forma, 0)
+    mapas = {año: mapa_año & mapa_forma for año, mapa_año in indice.años.items()}
+    numeros = {año: mapa.bit_count() for año, mapa in mapas.items()}
+    maximo = max(numeros.values(), default=0)
+    if not maximo:
+        raise ValueError(f"No hay avistamientos de forma {forma}")
+    # Si hay empate, gana el año cuyo primer avistamiento de la forma aparece antes
+    return min((año for año, n in numeros.items() if n == maximo),
+               key=lambda año: _primera_fila(mapas[año]))
+
+
+def duracion_total_avistamientos_año(indice, estado):
+    '''
+    Devuelve la duración total de los avistamientos de cada año en un estado.
+    Equivale a avistamientos.duracion_total_avistamientos_año.
+
+    @param indice: índice de categorías
+    @type indice: IndiceCategorias
+    @param estado: estado
+    @type estado: str
+    @return: diccionario {año: duración total}
+    @rtype: {int: int}
+    '''
+    res = defaultdict(int)
+    sel = selectores(indice.estados.get(estado, 0))
+    for año, duracion in zip(compress(indice.años_filas, sel), compress(indice.duraciones, sel)):
+        res[año] += duracion
+    return dict(res)
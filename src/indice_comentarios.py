@@ -0,0 +1,162 @@
+'''
+Módulo indice_comentarios
+Índice invertido sobre los comentarios de los avistamientos: para cada palabra
+(secuencia de caracteres alfanuméricos) se guarda la lista ordenada de las
+posiciones de los avistamientos cuyo comentario la contiene.
+
+Las búsquedas mantienen la semántica de "palabra in comentario" (subcadena,
+distinguiendo mayúsculas): un comentario contiene una cadena alfanumérica si y
+solo si alguna de sus palabras la contiene, así que basta con buscar la cadena
+en el vocabulario (mucho más pequeño que los comentarios) y unir las listas de
+las palabras que la contienen. Las cadenas con otros caracteres se resuelven
+con los candidatos de su trozo alfanumérico más largo y comprobando la subcadena,
+y si no tienen ningún trozo alfanumérico se recorren todos los comentarios.
+'''
+import re
+from bisect import bisect_left
+from array import array
+from collections import namedtuple, defaultdict
+
+## Definición de tipos
+# avistamientos: lista de avistamientos indexados (las posiciones se refieren a ella)
+# listas: diccionario palabra -> array con las posiciones de los avistamientos cuyo
+#     comentario contiene la palabra, ordenadas por año y, dentro de cada año, de mayor
+#     a menor longitud del comentario
+# años_listas: diccionario palabra -> array con el año de cada posición de listas[palabra]
+# años, longitudes: año y longitud del comentario de cada avistamiento
+# busquedas: caché de las últimas búsquedas
+IndiceComentarios = namedtuple('IndiceComentarios',
+                               'avistamientos, listas, años_listas, años, longitudes, busquedas')
+
+PALABRA = re.compile(r'\w+')
+MAX_BUSQUEDAS = 1024
+
+
+def crea_indice_comentarios(avistamientos):
+    '''
+    Construye un índice invertido sobre los comentarios de los avistamientos.
+
+    @param avistamientos: avistamientos que se quieren indexar
+    @type avistamientos: iterable de Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+    @return: índice de comentarios
+    @rtype: IndiceComentarios
+    '''
+    avistamientos = list(avistamientos)
+    años = array('H', (a.fechahora.year for a in avistamientos))
+    longitudes = array('l', (len(a.comentarios) for a in avistamientos))
+    posiciones = defaultdict(list)
+    for i, a in enumerate(avistamientos):
+        for palabra in set(PALABRA.findall(a.comentarios)):
+            posiciones[palabra].append(i)
+    listas, años_listas = {}, {}
+    for palabra, lista in posiciones.items():
+        lista.sort(key=lambda i: (años[i], -longitudes[i]))
+        listas[palabra] = array('l', lista)
+        años_listas[palabra] = array('H', (años[i] for i in lista))
+    return IndiceComentarios(avistamientos, listas, años_listas, años, longitudes, {})
+
+
+def _cacheada(indice, clave, funcion):
+    res = indice.busquedas.get(clave)
+    if res is None:
+        if len(indice.busquedas) >= MAX_BUSQUEDAS:
+            indice.busquedas.clear()
+        res = indice.busquedas[clave] = funcion()
+    return res
+
+
+def _palabras_que_contienen(indice, trozo):
+    '''Devuelve las palabras del vocabulario que contienen el trozo'''
+    return _cacheada(indice, ('palabras', trozo),
+                     lambda: [p for p in indice.listas if trozo in p])
+
+
+def _busca(indice, cadena):
+    '''Devuelve la lista ordenada de posiciones de los avistamientos cuyo
+    comentario contiene la cadena'''
+    trozos = PALABRA.findall(cadena)
+    if not trozos:
+        return [i for i, a in enumerate(indice.avistamientos) if cadena in a.comentarios]
+    trozo = max(trozos, key=len)
+    posiciones = set()
+    for palabra in _palabras_que_contienen(indice, trozo):
+        posiciones.update(indice.listas[palabra])
+    posiciones = sorted(posiciones)
+    if trozo != cadena:
+        posiciones = [i for i in posiciones if cadena in indice.avistamientos[i].comentarios]
+    return posiciones
+
+
+def filas_con(indice, cadena):
+    '''
+    Devuelve las posiciones de los avistamientos cuyo comentario contiene la
+    cadena, de menor a mayor. Equivale a filtrar con "cadena in a.comentarios".
+
+    @param indice: índice de comentarios
+    @type indice: IndiceComentarios
+    @param cadena: cadena a buscar
+    @type cadena: str
+    @return: posiciones de los avistamientos, en orden creciente
+    @rtype: [int]
+    '''
+    return _cacheada(indice, ('filas', cadena), lambda: _busca(indice, cadena))
+
+
+def avistamientos_con(indice, cadena, anyo=None, orden=None):
+    '''
+    Devuelve los avistamientos cuyo comentario contiene la cadena,
+    opcionalmente solo los de un año.
+
+    @param indice: índice de comentarios
+    @type indice: IndiceComentarios
+    @param cadena: cadena a buscar
+    @type cadena: str
+    @param anyo: año de los avistamientos. Si es None, se devuelven todos
+    @type anyo: int, optional
+    @param orden: None para mantener el orden original, 'año' para ordenarlos por año
+         o 'longitud' para ordenarlos de mayor a menor longitud del comentario
+    @type orden: str, optional
+    @return: lista de avistamientos
+    @rtype: [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
+    '''
+    posiciones = filas_con(indice, cadena)
+    if anyo is not None:
+        posiciones = [i for i in posiciones if indice.años[i] == anyo]
+    if orden == 'año':
+        posiciones = sorted(posiciones, key=indice.años.__getitem__)
+    elif orden == 'longitud':
+        posiciones = sorted(posiciones, key=indice.longitudes.__getitem__, reverse=True)
+    elif orden is not None:
+        raise ValueError(f"Orden no válido: {orden}")
+    return [indice.avistamientos[i] for i in posiciones]
+
+
+def comentario_mas_largo(indice, anyo, palabra):
+    '''
+    Devuelve el avistamiento cuyo comentario es el más largo, de entre
+    los avistamientos del año dado cuyo comentario incluye la palabra.
+    Da el mismo resultado que avistamientos.comentario_mas_largo.
+
+    @param indice: índice de comentarios
+    @type indice: IndiceComentarios
+    @param anyo: año para el que se hará la búsqueda
+    @type anyo: int
+    @param palabra: palabra que debe incluir el comentario del avistamiento buscado
+    @type palabra: str
+    @return: avistamiento con el comentario más largo
+    @rtype: Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+    '''
+    if PALABRA.fullmatch(palabra):
+        # Como cada lista está ordenada por año y longitud, el candidato de cada
+        # palabra del vocabulario es el primero de su año, que se busca con bisect
+        posiciones = []
+        for p in _palabras_que_contienen(indice, palabra):
+            años_lista = indice.años_listas[p]
+            k = bisect_left(años_lista, anyo)
+            if k < len(años_lista) and años_lista[k] == anyo:
+                posiciones.append(indice.listas[p][k])
+    else:
+        posiciones = [i for i in filas_con(indice, palabra) if indice.años[i] == anyo]
+    # Entre comentarios igual de largos, el que aparece antes (como max en la lista)
+    mejor = max(posiciones, key=lambda i: (indice.longitudes[i], -i))
+    return indice.avistamientos[mejor]
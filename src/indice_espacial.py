@@ -0,0 +1,180 @@
+'''
+Módulo indice_espacial
+Índice espacial en forma de rejilla de latitud/longitud. Se construye una vez
+a partir de los avistamientos y permite hacer búsquedas por radio y de los k
+más cercanos calculando la distancia de haversine solo con los avistamientos
+de las celdas que caen dentro del casquete de búsqueda.
+'''
+from collections import namedtuple, defaultdict
+from math import floor, ceil, degrees, asin, sin, cos, radians, pi
+from coordenadas import distancia_haversine, RADIO_TIERRA
+
+## Definición de tipos
+# celdas: diccionario (fila, columna) -> lista de elementos de esa celda
+IndiceEspacial = namedtuple('IndiceEspacial', 'tam_celda, columnas, celdas')
+
+
+def _fila(latitud, tam_celda):
+    return floor((latitud + 90) / tam_celda)
+
+
+def _columna(longitud, tam_celda, columnas):
+    return floor((longitud + 180) / tam_celda) % columnas
+
+
+def columnas_entre(lon_min, lon_max, tam_celda, columnas):
+    '''
+    Devuelve las columnas de una rejilla de celdas de tam_celda grados que
+    cubren las longitudes entre lon_min y lon_max, que pueden pasar por el
+    antimeridiano. Las columnas se calculan a partir de las longitudes llevadas
+    a [-180, 180) y no con el resto de dividir entre el número de columnas,
+    porque si tam_celda no divide a 360 la última columna es más estrecha que
+    las demás.
+
+    @param lon_min: longitud inicial, en grados
+    @type lon_min: float
+    @param lon_max: longitud final, en grados (lon_max - lon_min < 360)
+    @type lon_max: float
+    @param tam_celda: ancho de las columnas, en grados
+    @type tam_celda: float
+    @param columnas: número de columnas de la rejilla
+    @type columnas: int
+    @return: columnas, de oeste a este
+    @rtype: range o [int]
+    '''
+    desde = (lon_min + 180) % 360 - 180
+    hasta = desde + (lon_max - lon_min)
+    if hasta < 180:
+        return range(floor((desde + 180) / tam_celda), floor((hasta + 180) / tam_celda) + 1)
+    # Pasa por el antimeridiano: hasta la última columna, y desde la primera
+    return [*range(floor((desde + 180) / tam_celda), columnas),
+            *range(0, floor((hasta - 180) / tam_celda) + 1)]
+
+
+def crea_indice_espacial(avistamientos, tam_celda=1.0):
+    '''
+    Construye un índice espacial sobre los avistamientos.
+
+    @param avistamientos: avistamientos que se quieren indexar
+    @type avistamientos: iterable de Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+    @param tam_celda: tamaño de las celdas de la rejilla, en grados
+    @type tam_celda: float, optional
+    @return: índice espacial
+    @rtype: IndiceEspacial
+    '''
+    columnas = ceil(360 / tam_celda)
+    celdas = defaultdict(list)
+    for a in avistamientos:
+        c = a.coordenadas
+        celdas[(_fila(c.latitud, tam_celda), _columna(c.longitud, tam_celda, columnas))].append(a)
+    return IndiceEspacial(tam_celda, columnas, dict(celdas))
+
+
+def inserta(indice, avistamiento):
+    '''
+    Añade un avistamiento a un índice espacial ya construido.
+
+    @param indice: índice espacial
+    @type indice: IndiceEspacial
+    @param avistamiento: avistamiento que se añade
+    @type avistamiento: Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+    '''
+    c = avistamiento.coordenadas
+    celda = (_fila(c.latitud, indice.tam_celda), _columna(c.longitud, indice.tam_celda, indice.columnas))
+    indice.celdas.setdefault(celda, []).append(avistamiento)
+
+
+def _celdas_candidatas(indice, ubicacion, radio):
+    '''Genera las claves de las celdas que pueden contener puntos a una
+    distancia menor que radio de la ubicación'''
+    angulo = radio / RADIO_TIERRA
+    if angulo >= pi:
+        yield from indice.celdas
+        return
+    dlat = degrees(angulo)
+    lat_min = ubicacion.latitud - dlat
+    lat_max = ubicacion.latitud + dlat
+    if lat_min <= -90 or lat_max >= 90:
+        # El casquete incluye un polo: hay que mirar todas las longitudes
+        columnas = range(indice.columnas)
+    else:
+        # Máxima diferencia de longitud dentro del casquete
+        dlon = degrees(asin(min(1.0, sin(angulo) / cos(radians(ubicacion.latitud)))))
+        if 2 * dlon >= 360:
+            columnas = range(indice.columnas)
+        else:
+            columnas = set(columnas_entre(ubicacion.longitud - dlon, ubicacion.longitud + dlon,
+                                          indice.tam_celda, indice.columnas))
+    for i in range(_fila(max(lat_min, -90), indice.tam_celda),
+                   _fila(min(lat_max, 90), indice.tam_celda) + 1):
+        for j in columnas:
+            if (i, j) in indice.celdas:
+                yield (i, j)
+
+
+def cercanos(indice, ubicacion, radio):
+    '''
+    Genera los avistamientos del índice que están a una distancia
+    inferior a radio de la ubicación.
+
+    @param indice: índice espacial
+    @type indice: IndiceEspacial
+    @param ubicacion: coordenadas de la ubicación
+    @type ubicacion: Coordenadas(float, float)
+    @param radio: radio de distancia, en kilómetros
+    @type radio: float
+    @return: generador de avistamientos cercanos
+    @rtype: generador de Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+    '''
+    for celda in _celdas_candidatas(indice, ubicacion, radio):
+        for a in indice.celdas[celda]:
+            if distancia_haversine(a.coordenadas, ubicacion) < radio:
+                yield a
+
+
+def numero_candidatos(indice, ubicacion, radio):
+    '''
+    Devuelve el número de avistamientos de las celdas que se recorren al
+    buscar los cercanos a la ubicación: una cota superior del número de
+    avistamientos cercanos que no necesita calcular distancias.
+
+    @param indice: índice espacial
+    @type indice: IndiceEspacial
+    @param ubicacion: coordenadas de la ubicación
+    @type ubicacion: Coordenadas(float, float)
+    @param radio: radio de distancia, en kilómetros
+    @type radio: float
+    @return: número de avistamientos candidatos
+    @rtype: int
+    '''
+    return sum(len(indice.celdas[celda]) for celda in _celdas_candidatas(indice, ubicacion, radio))
+
+
+def k_mas_cercanos(indice, ubicacion, k):
+    '''
+    Devuelve los k avistamientos del índice más cercanos a la ubicación,
+    ordenados de menor a mayor distancia, junto con su distancia.
+
+    Se busca primero en un radio del tamaño de una celda, y se dobla el radio
+    hasta encontrar al menos k avistamientos (o hasta cubrir toda la Tierra).
+
+    @param indice: índice espacial
+    @type indice: IndiceEspacial
+    @param ubicacion: coordenadas de la ubicación
+    @type ubicacion: Coordenadas(float, float)
+    @param k: número de avistamientos a devolver
+    @type k: int
+    @return: lista de tuplas (distancia, avistamiento)
+    @rtype: [(float, Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float)))]
+    '''
+    radio = radians(indice.tam_celda) * RADIO_TIERRA
+    while True:
+        encontrados = [(distancia_haversine(a.coordenadas, ubicacion), a)
+                       for celda in _celdas_candidatas(indice, ubicacion, radio)
+                       for a in indice.celdas[celda]]
+        dentro = [t for t in encontrados if t[0] < radio]
+        if len(dentro) >= k or radio / RADIO_TIERRA >= pi:
+            encontrados = dentro if len(dentro) >= k else encontrados
+            encontrados.sort(key=lambda t: t[0])
+            return encontrados[:k]
+        radio *= 2
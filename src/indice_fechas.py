@@ -0,0 +1,142 @@
+'''
+Módulo indice_fechas
+Índice de avistamientos por fecha. Los avistamientos se ordenan una sola vez
+de más reciente a más antiguo (el mismo orden que devuelve
+avistamientos.avistamientos_fechas) y las consultas por fecha se resuelven con
+búsqueda binaria (bisect) sobre un array con las fechas, en O(log N + k).
+'''
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import date
+
+## Definición de tipos
+# ordenados: avistamientos de más reciente a más antiguo
+# claves: -fecha.toordinal() de cada avistamiento de ordenados (creciente)
+IndiceFechas = namedtuple('IndiceFechas', 'ordenados, claves')
+
+
+def _clave(fecha):
+    return -fecha.toordinal()
+
+
+def crea_indice_fechas(avistamientos):
+    '''
+    Construye un índice por fecha de los avistamientos.
+
+    @param avistamientos: avistamientos que se quieren indexar
+    @type avistamientos: iterable de Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+    @return: índice por fecha
+    @rtype: IndiceFechas
+    '''
+    ordenados = sorted(avistamientos, reverse=True)
+    claves = array('l', (_clave(a.fechahora) for a in ordenados))
+    return IndiceFechas(ordenados, claves)
+
+
+def _posiciones(indice, fecha_inicial=None, fecha_final=None):
+    '''Devuelve las posiciones (desde, hasta) de ordenados que corresponden
+    al rango de fechas, ambas inclusive'''
+    desde = 0 if fecha_final is None else bisect_left(indice.claves, _clave(fecha_final))
+    hasta = len(indice.claves) if fecha_inicial is None \
+        else bisect_right(indice.claves, _clave(fecha_inicial))
+    return desde, max(desde, hasta)
+
+
+def avistamientos_entre(indice, fecha_inicial=None, fecha_final=None):
+    '''
+    Devuelve una lista con los avistamientos que han tenido lugar
+    entre fecha_inicial y fecha_final (ambas inclusive), ordenados de los más
+    recientes a los más antiguos. Si alguna de las fechas es None, el rango
+    no está limitado por ese extremo.
+
+    @param indice: índice por fecha
+    @type indice: IndiceFechas
+    @param fecha_inicial: fecha a partir de la cual se devuelven los avistamientos
+    @type fecha_inicial: datetime.date, optional
+    @param fecha_final: fecha hasta la cual se devuelven los avistamientos
+    @type fecha_final: datetime.date, optional
+    @return: lista de avistamientos en el rango de fechas
+    @rtype: [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
+    '''
+    desde, hasta = _posiciones(indice, fecha_inicial, fecha_final)
+    return indice.ordenados[desde:hasta]
+
+
+def itera_entre(indice, fecha_inicial=None, fecha_final=None):
+    '''
+    Como avistamientos_entre, pero devuelve un generador en lugar de copiar
+    el tramo de la lista.
+
+    @param indice: índice por fecha
+    @type indice: IndiceFechas
+    @param fecha_inicial: fecha a partir de la cual se devuelven los avistamientos
+    @type fecha_inicial: datetime.date, optional
+    @param fecha_final: fecha hasta la cual se devuelven los avistamientos
+    @type fecha_final: datetime.date, optional
+    @return: generador de los avistamientos en el rango de fechas
+    @rtype: generador de Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+    '''
+    desde, hasta = _posiciones(indice, fecha_inicial, fecha_final)
+    ordenados = indice.ordenados
+    return (ordenados[i] for i in range(desde, hasta))
+
+
+def numero_avistamientos_entre(indice, fecha_inicial=None, fecha_final=None):
+    '''
+    Devuelve el número de avistamientos que han tenido lugar entre
+    fecha_inicial y fecha_final (ambas inclusive), sin construir la lista.
+
+    @param indice: índice por fecha
+    @type indice: IndiceFechas
+    @param fecha_inicial: fecha a partir de la cual se cuentan los avistamientos
+    @type fecha_inicial: datetime.date, optional
+    @param fecha_final: fecha hasta la cual se cuentan los avistamientos
+    @type fecha_final: datetime.date, optional
+    @return: número de avistamientos en el rango de fechas
+    @rtype: int
+    '''
+    desde, hasta = _posiciones(indice, fecha_inicial, fecha_final)
+    return hasta - desde
+
+
+def numero_avistamientos_fecha(indice, fecha):
+    '''
+    Devuelve el número de avistamientos que se han producido en una fecha.
+
+    @param indice: índice por fecha
+    @type indice: IndiceFechas
+    @param fecha: fecha del avistamiento
+    @type fecha: datetime.date
+    @return: número de avistamientos producidos en la fecha
+    @rtype: int
+    '''
+    return numero_avistamientos_entre(indice, fecha, fecha)
+
+
+def avistamientos_año(indice, año):
+    '''
+    Devuelve los avistamientos de un año, de los más recientes a los más antiguos.
+
+    @param indice: índice por fecha
+    @type indice: IndiceFechas
+    @param año: año de los avistamientos
+    @type año: int
+    @return: lista de avistamientos del año
+    @rtype: [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
+    '''
+    return avistamientos_entre(indice, date(año, 1, 1), date(año, 12, 31))
+
+
+def numero_avistamientos_año(indice, año):
+    '''
+    Devuelve el número de avistamientos de un año.
+
+    @param indice: índice por fecha
+    @type indice: IndiceFechas
+    @param año: año de los avistamientos
+    @type año: int
+    @return: número de avistamientos del año
+    @rtype: int
+    '''
+    return numero_avistamientos_entre(indice, date(año, 1, 1), date(año, 12, 31))
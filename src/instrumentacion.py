@@ -0,0 +1,164 @@
+'''
+Módulo instrumentacion
+Instrumentación opcional de la carga y de las consultas de avistamientos.
+Las funciones marcadas con el decorador instrumentado registran el número de
+llamadas, el tiempo acumulado (incluye el de las funciones a las que llaman)
+y el número de filas procesadas.
+
+Se activa con variables de entorno, que se leen al importar el módulo:
+    AVISTAMIENTOS_PERFIL=1            registra las estadísticas y muestra la tabla
+                                      resumen por la salida de error al terminar
+    AVISTAMIENTOS_PSTATS=fichero      ejecuta todo el programa bajo cProfile y guarda
+                                      las estadísticas en el fichero (formato pstats)
+Si AVISTAMIENTOS_PERFIL no está definida, instrumentado devuelve la función sin
+cambios, así que la instrumentación no tiene ningún coste.
+'''
+import atexit
+import os
+import sys
+import time
+from collections import defaultdict
+from functools import wraps
+from types import GeneratorType
+import importacion_perezosa
+
+# cProfile y multiprocessing solo hacen falta para perfilar: se cargan la primera vez que se usan
+cProfile = importacion_perezosa.importa('cProfile')
+multiprocessing = importacion_perezosa.importa('multiprocessing')
+
+ACTIVA = os.environ.get('AVISTAMIENTOS_PERFIL', '') not in ('', '0')
+FICHERO_PSTATS = os.environ.get('AVISTAMIENTOS_PSTATS')
+
+# nombre de la función -> [llamadas, segundos, filas]
+estadisticas = defaultdict(lambda: [0, 0.0, 0])
+
+
+def _filas(valor):
+    try:
+        return len(valor)
+    except TypeError:
+        return 0
+
+
+def _itera_instrumentado(generador, registro, contar):
+    '''Recorre el generador sumando su tiempo y, si contar es True, los elementos que produce'''
+    while True:
+        inicio = time.perf_counter()
+        try:
+            elemento = next(generador)
+        except StopIteration:
+            registro[1] += time.perf_counter() - inicio
+            return
+        registro[1] += time.perf_counter() - inicio
+        if contar:
+            registro[2] += 1
+        yield elemento
+
+
+def instrumentado(funcion=None, *, filas='entrada'):
+    '''
+    Decorador que registra las estadísticas de las llamadas a una función
+    si la instrumentación está activa. Si no lo está, devuelve la función tal cual.
+
+    @param funcion: función a instrumentar
+    @type funcion: función
+    @param filas: de dónde se sacan las filas procesadas: 'entrada' (longitud
+         del primer parámetro), 'salida' (longitud del resultado, o número de elementos
+         si es un generador), 'llamada' (una fila por llamada) o None (no se cuentan)
+    @type filas: str, optional
+    @return: función instrumentada
+    @rtype: función
+    '''
+    if funcion is None:
+        return lambda f: instrumentado(f, filas=filas)
+    if not ACTIVA:
+        return funcion
+    registro = estadisticas[f'{funcion.__module__}.{funcion.__qualname__}']
+
+    @wraps(funcion)
+    def envoltorio(*args, **kwargs):
+        inicio = time.perf_counter()
+        res = funcion(*args, **kwargs)
+        registro[1] += time.perf_counter() - inicio
+        registro[0] += 1
+        if isinstance(res, GeneratorType):
+            return _itera_instrumentado(res, registro, filas == 'salida')
+        if filas == 'entrada':
+            registro[2] += _filas(args[0]) if args else 0
+        elif filas == 'salida':
+            registro[2] += _filas(res)
+        elif filas == 'llamada':
+            registro[2] += 1
+        return res
+    return envoltorio
+
+
+def reinicia():
+    '''Borra las estadísticas registradas hasta ahora'''
+    # Se ponen a cero sin borrar las entradas, porque cada función instrumentada
+    # guarda una referencia a la suya
+    for registro in estadisticas.values():
+        registro[:] = [0, 0.0, 0]
+
+
+def resumen():
+    '''
+    Devuelve las estadísticas registradas, ordenadas de mayor a menor tiempo acumulado.
+
+    @return: lista de tuplas (nombre, llamadas, segundos, filas, filas por segundo)
+    @rtype: [(str, int, float, int, float)]
+    '''
+    res = [(nombre, llamadas, segundos, filas, filas / segundos if segundos else 0.0)
+           for nombre, (llamadas, segundos, filas) in estadisticas.items() if llamadas]
+    res.sort(key=lambda t: t[2], reverse=True)
+    return res
+
+
+def imprime_resumen(salida=None):
+    '''
+    Muestra la tabla resumen de las estadísticas registradas.
+
+    @param salida: fichero donde se escribe la tabla. Si es None, la salida de error
+    @type salida: fichero de texto, optional
+    '''
+    salida = salida or sys.stderr
+    print(f"{'función':60} {'llamadas':>10} {'segundos':>10} {'filas':>12} {'filas/s':>14}", file=salida)
+    for nombre, llamadas, segundos, filas, por_segundo in resumen():
+        print(f"{nombre:60} {llamadas:10} {segundos:10.4f} {filas:12} {por_segundo:14.0f}", file=salida)
+
+
+def perfila(fichero, funcion, *args, **kwargs):
+    '''
+    Ejecuta una función bajo cProfile y guarda las estadísticas en un
+    fichero en formato pstats (se pueden ver con python -m pstats fichero).
+
+    @param fichero: ruta del fichero donde se guardan las estadísticas
+    @type fichero: str
+    @param funcion: función a ejecutar
+    @type funcion: función
+    @return: resultado de la función
+    '''
+    perfil = cProfile.Profile()
+    try:
+        return perfil.runcall(funcion, *args, **kwargs)
+    finally:
+        perfil.dump_stats(fichero)
+
+
+def _al_terminar(funcion):
+    # Los procesos de multiprocessing que importan el módulo (por ejemplo, los de
+    # carga_paralela) no escriben al terminar; los procesos independientes, sí
+    atexit.register(lambda: funcion() if multiprocessing.parent_process() is None else None)
+
+
+if ACTIVA:
+    _al_terminar(imprime_resumen)
+
+if FICHERO_PSTATS:
+    _perfil = cProfile.Profile()
+    _perfil.enable()
+
+    def _guarda_perfil():
+        _perfil.disable()
+        _perfil.dump_stats(FICHERO_PSTATS)
+    _al_terminar(_guarda_perfil)
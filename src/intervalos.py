@@ -0,0 +1,169 @@
+'''
+Módulo intervalos
+Estadísticas de los intervalos (en días) entre avistamientos consecutivos.
+
+Las fechas de los avistamientos se guardan una sola vez, ordenadas, como un
+array de ordinales (date.toordinal), para todos los avistamientos y para cada
+estado. A partir de ahí los intervalos son las diferencias entre elementos
+consecutivos y todas las estadísticas se calculan en una pasada, sin volver a
+ordenar: la media no necesita ni recorrer los intervalos (su suma es la
+diferencia entre el último y el primer día) y la mediana sale de la
+distribución de los intervalos, que toman pocos valores distintos.
+'''
+from array import array
+from bisect import bisect_left
+from collections import namedtuple, Counter, defaultdict
+from datetime import date
+from operator import sub
+
+## Definición de tipos
+# dias: ordinales de las fechas de todos los avistamientos, en orden creciente
+# dias_por_estado: diccionario estado -> array con los ordinales de sus avistamientos, en orden creciente
+Cronologia = namedtuple('Cronologia', 'dias, dias_por_estado')
+# distribucion: Counter {días entre avistamientos consecutivos: número de veces}
+EstadisticasIntervalos = namedtuple('EstadisticasIntervalos',
+                                    'numero, media, mediana, maximo, distribucion')
+
+
+def crea_cronologia(avistamientos, indice=None):
+    '''
+    Construye la cronología de los avistamientos. Si se pasa un índice por
+    fechas, se aprovecha su orden y no hace falta ordenar nada.
+
+    @param avistamientos: avistamientos
+    @type avistamientos: iterable de Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+    @param indice: índice por fecha de los mismos avistamientos (ver indice_fechas.crea_indice_fechas)
+    @type indice: IndiceFechas, optional
+    @return: cronología de los avistamientos
+    @rtype: Cronologia
+    '''
+    por_estado = defaultdict(lambda: array('l'))
+    if indice is not None:
+        # El índice está ordenado de más reciente a más antiguo
+        dias = array('l', (-clave for clave in reversed(indice.claves)))
+        for dia, a in zip(dias, reversed(indice.ordenados)):
+            por_estado[a.estado].append(dia)
+        return Cronologia(dias, dict(por_estado))
+    dias = array('l')
+    for a in avistamientos:
+        dia = a.fechahora.toordinal()
+        dias.append(dia)
+        por_estado[a.estado].append(dia)
+    return Cronologia(array('l', sorted(dias)),
+                      {estado: array('l', sorted(d)) for estado, d in por_estado.items()})
+
+
+def intervalos(dias):
+    '''
+    Devuelve los días transcurridos entre cada dos avistamientos consecutivos.
+
+    @param dias: ordinales de las fechas, en orden creciente
+    @type dias: array('l') o [int]
+    @return: diferencias entre días consecutivos
+    @rtype: array('l')
+    '''
+    return array('l', map(sub, dias[1:], dias))
+
+
+def _mediana(distribucion, n):
+    '''Mediana de n valores dados por su distribución {valor: veces}, como statistics.median'''
+    medio_bajo, medio_alto = (n - 1) // 2, n // 2
+    bajo = None
+    vistos = 0
+    for valor in sorted(distribucion):
+        vistos += distribucion[valor]
+        if bajo is None and vistos > medio_bajo:
+            bajo = valor
+        if vistos > medio_alto:
+            return valor if valor == bajo else (bajo + valor) / 2
+
+
+def estadisticas_intervalos(dias):
+    '''
+    Calcula las estadísticas de los intervalos entre días consecutivos.
+
+    @param dias: ordinales de las fechas, en orden creciente
+    @type dias: array('l') o [int]
+    @return: número de intervalos, media, mediana y máximo, y distribución de los
+         intervalos. Si hay menos de dos días, media, mediana y máximo son None
+    @rtype: EstadisticasIntervalos(int, float, float, int, Counter)
+    '''
+    n = len(dias) - 1
+    if n < 1:
+        return EstadisticasIntervalos(0, None, None, None, Counter())
+    distribucion = Counter(intervalos(dias))
+    return EstadisticasIntervalos(n, (dias[-1] - dias[0]) / n, _mediana(distribucion, n),
+                                  max(distribucion), distribucion)
+
+
+def dias_año(cronologia, anyo, estado=None):
+    '''
+    Devuelve los días de los avistamientos de un año (opcionalmente, solo
+    los de un estado), que forman un tramo contiguo de la cronología.
+
+    @param cronologia: cronología de los avistamientos
+    @type cronologia: Cronologia
+    @param anyo: año
+    @type anyo: int
+    @param estado: estado. Si es None, se usan todos los avistamientos
+    @type estado: str, optional
+    @return: ordinales de las fechas del año, en orden creciente
+    @rtype: array('l')
+    '''
+    dias = cronologia.dias if estado is None else cronologia.dias_por_estado.get(estado, array('l'))
+    return dias[bisect_left(dias, date(anyo, 1, 1).toordinal()):
+                bisect_left(dias, date(anyo + 1, 1, 1).toordinal())]
+
+
+def media_dias_entre_avistamientos(cronologia, anyo=None):
+    '''
+    Devuelve la media de días transcurridos entre dos avistamientos consecutivos,
+    opcionalmente solo de los avistamientos de un año, en O(log N).
+    Da el mismo resultado que avistamientos.media_dias_entre_avistamientos.
+
+    @param cronologia: cronología de los avistamientos
+    @type cronologia: Cronologia
+    @param anyo: año. Si es None, se usan todos los avistamientos
+    @type anyo: int, optional
+    @return: media de días entre avistamientos, o None si hay menos de dos avistamientos
+    @rtype: float
+    '''
+    dias = cronologia.dias if anyo is None else dias_año(cronologia, anyo)
+    return (dias[-1] - dias[0]) / (len(dias) - 1) if len(dias) > 1 else None
+
+
+def estadisticas_por_año(cronologia, estado=None):
+    '''
+    Calcula las estadísticas de los intervalos entre avistamientos consecutivos
+    del mismo año, para cada año.
+
+    @param cronologia: cronología de los avistamientos
+    @type cronologia: Cronologia
+    @param estado: estado. Si es None, se usan todos los avistamientos
+    @type estado: str, optional
+    @return: diccionario {año: estadísticas}
+    @rtype: {int: EstadisticasIntervalos}
+    '''
+    dias = cronologia.dias if estado is None else cronologia.dias_por_estado.get(estado, array('l'))
+    res = {}
+    inicio = 0
+    while inicio < len(dias):
+        anyo = date.fromordinal(dias[inicio]).year
+        fin = bisect_left(dias, date(anyo + 1, 1, 1).toordinal(), inicio)
+        res[anyo] = estadisticas_intervalos(dias[inicio:fin])
+        inicio = fin
+    return res
+
+
+def estadisticas_por_estado(cronologia):
+    '''
+    Calcula las estadísticas de los intervalos entre avistamientos consecutivos
+    del mismo estado, para cada estado.
+
+    @param cronologia: cronología de los avistamientos
+    @type cronologia: Cronologia
+    @return: diccionario {estado: estadísticas}
+    @rtype: {str: EstadisticasIntervalos}
+    '''
+    return {estado: estadisticas_intervalos(dias)
+            for estado, dias in cronologia.dias_por_estado.items()}
@@ -0,0 +1,254 @@
+'''
+Módulo mapa_densidad
+Mapa de densidad de avistamientos: histograma espacial sobre una rejilla de
+celdas de tamaño configurable (1°, 0.1°, 0.01°...). La celda de unas coordenadas
+es la de su latitud y longitud redondeadas al múltiplo más cercano del tamaño de
+celda, así que con celdas de 1° coincide con coordenadas.redondear.
+
+Para cada celda se guarda el número de avistamientos y las fechas de esos
+avistamientos, para poder filtrar por rango de fechas con búsqueda binaria.
+Opcionalmente se construye una tabla de sumas acumuladas (summed-area table)
+con la que el número de avistamientos en un rectángulo se calcula en O(1).
+'''
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+from itertools import accumulate, repeat
+from operator import add, truediv
+from coordenadas import Coordenadas
+
+
+class MapaDensidad:
+    '''
+    Mapa de densidad de avistamientos que se puede actualizar de forma incremental.
+
+    Atributos:
+        tam_celda: tamaño de las celdas, en grados
+        cuentas: Counter {(fila, columna): número de avistamientos de la celda}
+    '''
+
+    def __init__(self, avistamientos=(), tam_celda=1):
+        '''
+        @param avistamientos: avistamientos iniciales del mapa
+        @type avistamientos: iterable de Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float)), optional
+        @param tam_celda: tamaño de las celdas, en grados
+        @type tam_celda: float, optional
+        '''
+        self.tam_celda = tam_celda
+        self.cuentas = Counter()
+        # (fila, columna) -> array con los ordinales de las fechas de la celda
+        self._fechas = defaultdict(lambda: array('l'))
+        # Celdas cuyas fechas hay que volver a ordenar antes de consultarlas
+        self._desordenadas = set()
+        self._tabla = None
+        self.agregar_lote(avistamientos)
+
+    def __len__(self):
+        return sum(self.cuentas.values())
+
+    ## Construcción y actualización
+    def agregar(self, avistamiento):
+        '''
+        Añade un avistamiento al mapa.
+
+        @param avistamiento: avistamiento que se añade
+        @type avistamiento: Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+        '''
+        self.agregar_lote([avistamiento])
+
+    def agregar_lote(self, avistamientos):
+        '''
+        Añade varios avistamientos al mapa. Las celdas se calculan de una vez
+        para todo el lote, sin crear tuplas de coordenadas redondeadas.
+
+        @param avistamientos: avistamientos que se añaden
+        @type avistamientos: iterable de Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))
+        @return: número de avistamientos añadidos
+        @rtype: int
+        '''
+        latitudes, longitudes, fechas = array('d'), array('d'), array('l')
+        for a in avistamientos:
+            latitudes.append(a.coordenadas.latitud)
+            longitudes.append(a.coordenadas.longitud)
+            fechas.append(a.fechahora.toordinal())
+        if not fechas:
+            return 0
+        celdas = list(zip(self._indices(latitudes), self._indices(longitudes)))
+        self.cuentas.update(celdas)
+        for celda, fecha in zip(celdas, fechas):
+            self._fechas[celda].append(fecha)
+        self._desordenadas.update(celdas)
+        self._tabla = None
+        return len(fechas)
+
+    def _indices(self, valores):
+        return map(round, map(truediv, valores, repeat(self.tam_celda)))
+
+    ## Celdas
+    def celda(self, coordenadas):
+        '''
+        Devuelve la celda (fila, columna) que contiene las coordenadas.
+
+        @param coordenadas: coordenadas de un punto
+        @type coordenadas: Coordenadas(float, float)
+        @return: fila y columna de la celda
+        @rtype: (int, int)
+        '''
+        return (round(coordenadas.latitud / self.tam_celda),
+                round(coordenadas.longitud / self.tam_celda))
+
+    def centro(self, celda):
+        '''
+        Devuelve las coordenadas del centro de una celda.
+
+        @param celda: fila y columna de la celda
+        @type celda: (int, int)
+        @return: coordenadas del centro de la celda
+        @rtype: Coordenadas(float, float)
+        '''
+        # Se redondea para no arrastrar errores como 0.1 * 3 = 0.30000000000000004
+        return Coordenadas(round(celda[0] * self.tam_celda, 10), round(celda[1] * self.tam_celda, 10))
+
+    def _fechas_ordenadas(self, celda):
+        fechas = self._fechas.get(celda, array('l'))
+        if celda in self._desordenadas:
+            fechas = self._fechas[celda] = array('l', sorted(fechas))
+            self._desordenadas.discard(celda)
+        return fechas
+
+    def numero(self, celda, fecha_inicial=None, fecha_final=None):
+        '''
+        Devuelve el número de avistamientos de una celda, opcionalmente solo
+        los que tuvieron lugar entre fecha_inicial y fecha_final (ambas inclusive).
+
+        @param celda: fila y columna de la celda
+        @type celda: (int, int)
+        @param fecha_inicial: fecha a partir de la cual se cuentan los avistamientos
+        @type fecha_inicial: datetime.date, optional
+        @param fecha_final: fecha hasta la cual se cuentan los avistamientos
+        @type fecha_final: datetime.date, optional
+        @return: número de avistamientos
+        @rtype: int
+        '''
+        if fecha_inicial is None and fecha_final is None:
+            return self.cuentas.get(celda, 0)
+        fechas = self._fechas_ordenadas(celda)
+        desde = 0 if fecha_inicial is None else bisect_left(fechas, fecha_inicial.toordinal())
+        hasta = len(fechas) if fecha_final is None else bisect_right(fechas, fecha_final.toordinal())
+        return max(0, hasta - desde)
+
+    ## Consultas
+    def puntos_calientes(self, k, fecha_inicial=None, fecha_final=None):
+        '''
+        Devuelve las k celdas con más avistamientos, de mayor a menor número
+        de avistamientos (si hay empate, la que recibió antes su primer avistamiento).
+        Con celdas de 1°, la primera es avistamientos.coordenadas_mas_avistamientos.
+        Si hay menos de k celdas con avistamientos se devuelven todas, así que
+        con un mapa vacío (o sin avistamientos entre las fechas) la lista está vacía.
+
+        @param k: número de celdas a devolver
+        @type k: int
+        @param fecha_inicial: fecha a partir de la cual se cuentan los avistamientos
+        @type fecha_inicial: datetime.date, optional
+        @param fecha_final: fecha hasta la cual se cuentan los avistamientos
+        @type fecha_final: datetime.date, optional
+        @return: lista de tuplas (centro de la celda, número de avistamientos), como mucho k
+        @rtype: [(Coordenadas(float, float), int)]
+        '''
+        if fecha_inicial is None and fecha_final is None:
+            cuentas = self.cuentas
+        else:
+            cuentas = Counter({celda: self.numero(celda, fecha_inicial, fecha_final)
+                               for celda in self.cuentas})
+            cuentas = +cuentas
+        return [(self.centro(celda), n) for celda, n in cuentas.most_common(k)]
+
+    def _rango(self, esquina_min, esquina_max):
+        (f0, c0), (f1, c1) = self.celda(esquina_min), self.celda(esquina_max)
+        return min(f0, f1), max(f0, f1), min(c0, c1), max(c0, c1)
+
+    def cuentas_rectangulo(self, esquina_min, esquina_max, fecha_inicial=None, fecha_final=None):
+        '''
+        Devuelve el número de avistamientos de cada celda con avistamientos dentro
+        del rectángulo cuyas esquinas son las celdas de esquina_min y esquina_max
+        (incluidas). No se tiene en cuenta el salto de longitud de -180 a 180.
+
+        @param esquina_min: coordenadas de una esquina del rectángulo
+        @type esquina_min: Coordenadas(float, float)
+        @param esquina_max: coordenadas de la esquina opuesta
+        @type esquina_max: Coordenadas(float, float)
+        @param fecha_inicial: fecha a partir de la cual se cuentan los avistamientos
+        @type fecha_inicial: datetime.date, optional
+        @param fecha_final: fecha hasta la cual se cuentan los avistamientos
+        @type fecha_final: datetime.date, optional
+        @return: diccionario {centro de la celda: número de avistamientos}
+        @rtype: {Coordenadas(float, float): int}
+        '''
+        f0, f1, c0, c1 = self._rango(esquina_min, esquina_max)
+        if (f1 - f0 + 1) * (c1 - c0 + 1) < len(self.cuentas):
+            celdas = ((f, c) for f in range(f0, f1 + 1) for c in range(c0, c1 + 1)
+                      if (f, c) in self.cuentas)
+        else:
+            celdas = (celda for celda in self.cuentas
+                      if f0 <= celda[0] <= f1 and c0 <= celda[1] <= c1)
+        res = {}
+        for celda in celdas:
+            n = self.numero(celda, fecha_inicial, fecha_final)
+            if n:
+                res[self.centro(celda)] = n
+        return res
+
+    def numero_rectangulo(self, esquina_min, esquina_max, fecha_inicial=None, fecha_final=None):
+        '''
+        Devuelve el número total de avistamientos dentro del rectángulo (ver
+        cuentas_rectangulo). Si no se filtra por fechas y se ha construido la
+        tabla de sumas acumuladas, se calcula en O(1).
+
+        @param esquina_min: coordenadas de una esquina del rectángulo
+        @type esquina_min: Coordenadas(float, float)
+        @param esquina_max: coordenadas de la esquina opuesta
+        @type esquina_max: Coordenadas(float, float)
+        @return: número de avistamientos
+        @rtype: int
+        '''
+        if self._tabla is not None and fecha_inicial is None and fecha_final is None:
+            return self._suma_tabla(*self._rango(esquina_min, esquina_max))
+        return sum(self.cuentas_rectangulo(esquina_min, esquina_max,
+                                           fecha_inicial, fecha_final).values())
+
+    ## Tabla de sumas acumuladas
+    def crea_tabla_acumulada(self):
+        '''
+        Construye la tabla de sumas acumuladas sobre el menor rectángulo de
+        celdas que contiene todas las celdas con avistamientos. La tabla tiene una
+        entrada por celda del rectángulo (con celdas de 0.01° sobre Estados Unidos
+        son decenas de millones), y se descarta al añadir avistamientos, así que
+        conviene crearla cuando el mapa ya no va a cambiar.
+        '''
+        if not self.cuentas:
+            self._tabla = (0, 0, 0, 0, array('q', [0]))
+            return
+        filas = [f for f, _ in self.cuentas]
+        columnas = [c for _, c in self.cuentas]
+        f0, c0 = min(filas), min(columnas)
+        alto, ancho = max(filas) - f0 + 1, max(columnas) - c0 + 1
+        # sumas[(i + 1) * (ancho + 1) + j + 1] = avistamientos en las celdas
+        # (f0..f0+i, c0..c0+j); la fila 0 y la columna 0 son ceros
+        w = ancho + 1
+        sumas = array('q', bytes(8 * (alto + 1) * w))
+        for (f, c), n in self.cuentas.items():
+            sumas[(f - f0 + 1) * w + c - c0 + 1] = n
+        # Cada fila es la suma acumulada de sus cuentas más la fila anterior
+        for i in range(w, (alto + 1) * w, w):
+            sumas[i:i + w] = array('q', map(add, accumulate(sumas[i:i + w]), sumas[i - w:i]))
+        self._tabla = (f0, c0, alto, ancho, sumas)
+
+    def _suma_tabla(self, f_desde, f_hasta, c_desde, c_hasta):
+        f0, c0, alto, ancho, sumas = self._tabla
+        # Se recorta el rectángulo a la zona de la tabla
+        i0, i1 = max(f_desde - f0, 0), min(f_hasta - f0 + 1, alto)
+        j0, j1 = max(c_desde - c0, 0), min(c_hasta - c0 + 1, ancho)
+        if i0 >= i1 or j0 >= j1:
+            return 0
+        w = ancho + 1
+        return sumas[i1 * w + j1] - sumas[i0 * w + j1] - sumas[i1 * w + j0] + sumas[i0 * w + j0]
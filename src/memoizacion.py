@@ -0,0 +1,145 @@
+'''
+Módulo memoizacion
+Memoización de los resultados de las consultas de avistamientos.py para
+cuadros de mando que repiten las mismas consultas una y otra vez.
+
+La clave de cada resultado es la función, la versión de los datos y los
+argumentos normalizados: los conjuntos (y listas) de estados se convierten en
+frozenset y las coordenadas se redondean a un número fijo de decimales. Las
+consultas se calculan con los argumentos ya normalizados, así que dos llamadas
+con la misma clave devuelven siempre el mismo resultado. Cuando cambia la
+versión de los datos se descartan todos los resultados guardados.
+'''
+from collections import namedtuple, OrderedDict
+from functools import partial
+import avistamientos as modulo_avistamientos
+from coordenadas import Coordenadas
+
+## Definición de tipos
+EstadisticasMemoria = namedtuple('EstadisticasMemoria',
+                                 'aciertos, fallos, expulsiones, invalidaciones, tamaño, tam_max')
+
+DECIMALES = 4
+TAM_MAX = 1024
+
+
+def normaliza(valor, decimales=DECIMALES):
+    '''
+    Normaliza un argumento de una consulta para usarlo como parte de la clave.
+
+    @param valor: argumento de la consulta
+    @param decimales: decimales a los que se redondean las coordenadas
+    @type decimales: int, optional
+    @return: valor equivalente y hashable: frozenset para conjuntos y listas,
+         coordenadas redondeadas para Coordenadas, y el mismo valor en otro caso
+    '''
+    if isinstance(valor, Coordenadas):
+        return Coordenadas(round(valor.latitud, decimales), round(valor.longitud, decimales))
+    if isinstance(valor, (set, frozenset, list)):
+        return frozenset(valor)
+    return valor
+
+
+def version_datos(datos):
+    '''
+    Devuelve la versión de unos datos: el atributo version si lo tienen (como
+    Catalogo) o, para una lista, su longitud, de forma que añadir avistamientos
+    invalida los resultados. Los cambios que no cambian la longitud de una lista
+    no se detectan; en ese caso hay que llamar a MemoriaConsultas.invalida.
+
+    @param datos: catálogo o lista de avistamientos
+    @return: versión de los datos
+    '''
+    version = getattr(datos, 'version', None)
+    return len(datos) if version is None else version
+
+
+class MemoriaConsultas:
+    '''
+    Memoria de resultados de consultas sobre unos datos, con expulsión del
+    resultado usado hace más tiempo (LRU) cuando se llena.
+
+    Se puede usar con consulta(funcion, *args) o llamando directamente a las
+    funciones de avistamientos.py como métodos, sin el parámetro avistamientos:
+        memoria = MemoriaConsultas(catalogo)
+        memoria.formas_estados({'ca', 'wa'})
+
+    Atributos:
+        datos: catálogo (con atributos avistamientos y version) o lista de avistamientos
+        tam_max: número máximo de resultados guardados
+        decimales: decimales a los que se redondean las coordenadas
+    '''
+
+    def __init__(self, datos, tam_max=TAM_MAX, decimales=DECIMALES):
+        '''
+        @param datos: catálogo (con atributos avistamientos y version) o lista de avistamientos
+        @type datos: Catalogo o [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
+        @param tam_max: número máximo de resultados guardados
+        @type tam_max: int, optional
+        @param decimales: decimales a los que se redondean las coordenadas
+        @type decimales: int, optional
+        '''
+        self.datos = datos
+        self.tam_max = tam_max
+        self.decimales = decimales
+        self._resultados = OrderedDict()
+        self._version = version_datos(datos)
+        self._aciertos = self._fallos = self._expulsiones = self._invalidaciones = 0
+
+    def _avistamientos(self):
+        return getattr(self.datos, 'avistamientos', self.datos)
+
+    def invalida(self):
+        '''Descarta todos los resultados guardados'''
+        if self._resultados:
+            self._invalidaciones += 1
+        self._resultados.clear()
+        self._version = version_datos(self.datos)
+
+    def consulta(self, funcion, *args, **kwargs):
+        '''
+        Devuelve el resultado de funcion(avistamientos, *args, **kwargs), de la
+        memoria si ya se ha calculado con la versión actual de los datos. Los
+        resultados se comparten entre llamadas, así que no se deben modificar.
+
+        @param funcion: función de consulta que recibe los avistamientos como primer parámetro
+        @type funcion: función
+        @return: resultado de la consulta
+        '''
+        if version_datos(self.datos) != self._version:
+            self.invalida()
+        args = tuple(normaliza(a, self.decimales) for a in args)
+        kwargs = {k: normaliza(v, self.decimales) for k, v in kwargs.items()}
+        try:
+            clave = (funcion, args, frozenset(kwargs.items()))
+            res = self._resultados[clave]
+        except KeyError:
+            pass
+        except TypeError:
+            # Argumentos que no se pueden usar como clave: se calcula sin guardar
+            self._fallos += 1
+            return funcion(self._avistamientos(), *args, **kwargs)
+        else:
+            self._aciertos += 1
+            self._resultados.move_to_end(clave)
+            return res
+        self._fallos += 1
+        res = self._resultados[clave] = funcion(self._avistamientos(), *args, **kwargs)
+        if len(self._resultados) > self.tam_max:
+            self._resultados.popitem(last=False)
+            self._expulsiones += 1
+        return res
+
+    def estadisticas(self):
+        '''
+        @return: aciertos, fallos, expulsiones, invalidaciones y tamaño actual de la memoria
+        @rtype: EstadisticasMemoria(int, int, int, int, int, int)
+        '''
+        return EstadisticasMemoria(self._aciertos, self._fallos, self._expulsiones,
+                                   self._invalidaciones, len(self._resultados), self.tam_max)
+
+    def __getattr__(self, nombre):
+        funcion = getattr(modulo_avistamientos, nombre, None)
+        if not callable(funcion) or nombre.startswith('_'):
+            raise AttributeError(nombre)
+        return partial(self.consulta, funcion)
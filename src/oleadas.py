@@ -0,0 +1,251 @@
+'''
+Módulo oleadas
+Detección de oleadas de avistamientos: grupos de avistamientos cercanos a la
+vez en el espacio y en el tiempo, con un algoritmo de tipo DBSCAN.
+
+Dos avistamientos son vecinos si la distancia de haversine entre ellos es menor
+que radio (km) y entre sus fechas y horas pasan como mucho ventana_dias
+periodos de 24 horas (una ventana deslizante, no días del calendario: con
+ventana_dias=1 son vecinos uno del lunes a las 23:00 y otro del martes a las
+22:00, pero no uno del lunes a las 00:00 y otro del martes a las 23:00). Un
+avistamiento con al menos min_avistamientos vecinos (contando él mismo) es
+central; cada oleada está formada por avistamientos centrales conectados a
+través de vecinos y por los vecinos no centrales de estos. Los avistamientos que
+no pertenecen a ninguna oleada son ruido.
+
+Para no comparar todos los pares, los avistamientos se reparten en una rejilla
+de celdas del tamaño del radio, ordenados por tiempo dentro de cada celda. Los
+vecinos de cada avistamiento se buscan solo en las celdas contiguas y, dentro
+de ellas, solo en el tramo que cae en la ventana de tiempo (con bisect),
+calculando las distancias por lotes. La búsqueda de vecinos, que es la parte
+costosa, se reparte entre varios procesos. La rejilla se pasa explícitamente a
+las funciones de búsqueda, así que se pueden hacer varias detecciones a la vez
+desde distintos hilos.
+'''
+from array import array
+from collections import namedtuple, Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from bisect import bisect_left, bisect_right
+from itertools import compress, repeat
+from math import floor, ceil, degrees, asin, atan2, sin, cos, radians
+import os
+from indice_espacial import columnas_entre
+from coordenadas import Coordenadas, RADIO_TIERRA, LoteCoordenadas, distancias_haversine_lote
+from avistamientos_columnar import a_epoca, SEGUNDOS_DIA
+
+## Definición de tipos
+# etiquetas: oleada de cada avistamiento (en el orden recibido), o RUIDO
+# oleadas: resumen de cada oleada, en el orden de sus identificadores (0, 1, 2...)
+Oleadas = namedtuple('Oleadas', 'etiquetas, oleadas')
+# centroide: media de las latitudes y media circular de las longitudes de los
+#     avistamientos de la oleada (para las oleadas que cruzan el antimeridiano)
+# forma: forma más frecuente en la oleada
+ResumenOleada = namedtuple('ResumenOleada', 'id, numero, centroide, inicio, fin, forma')
+# Datos de la búsqueda de vecinos (ver _prepara). celdas: posiciones de los
+# puntos de cada celda (fila, columna), ordenadas por tiempo
+Rejilla = namedtuple('Rejilla', 'latitudes, longitudes, tiempos, lat_rad, lon_rad, cosenos, '
+                                'radio, ventana, tam_celda, columnas, celdas')
+
+RUIDO = -1
+
+# Rejilla de la búsqueda de vecinos en los procesos de trabajo (ver _inicia_proceso).
+# Cada llamada a busca_vecinos crea sus propios procesos, así que no se comparte
+_rejilla_proceso = None
+
+
+## Rejilla espacial
+def _prepara(latitudes, longitudes, tiempos, radio, ventana):
+    '''Construye la rejilla de la búsqueda de vecinos'''
+    tam_celda = degrees(radio / RADIO_TIERRA)
+    columnas = max(1, ceil(360 / tam_celda))
+    celdas = defaultdict(list)
+    for i, (latitud, longitud) in enumerate(zip(latitudes, longitudes)):
+        celdas[(floor((latitud + 90) / tam_celda), floor((longitud + 180) / tam_celda) % columnas)].append(i)
+    # Los avistamientos de cada celda se ordenan por tiempo
+    celdas = {celda: array('l', sorted(posiciones, key=tiempos.__getitem__))
+              for celda, posiciones in celdas.items()}
+    lat_rad = array('d', map(radians, latitudes))
+    lon_rad = array('d', map(radians, longitudes))
+    return Rejilla(latitudes, longitudes, tiempos, lat_rad, lon_rad, array('d', map(cos, lat_rad)),
+                   radio, ventana, tam_celda, columnas, celdas)
+
+
+def _celdas_vecinas(rejilla, celda):
+    '''Genera las celdas de la rejilla que pueden contener vecinos de
+    los avistamientos de la celda'''
+    _, _, _, _, _, _, radio, _, tam_celda, columnas, celdas = rejilla
+    fila, columna = celda
+    # Latitud más alejada del ecuador de la celda y sus vecinas, para
+    # calcular cuántas columnas a cada lado hay que mirar
+    latitud = max(abs((fila - 1) * tam_celda - 90), abs((fila + 2) * tam_celda - 90))
+    angulo = radio / RADIO_TIERRA
+    if latitud >= 90 or sin(angulo) >= cos(radians(latitud)):
+        vecinas = range(columnas)
+    else:
+        dlon = degrees(asin(sin(angulo) / cos(radians(latitud))))
+        oeste = columna * tam_celda - 180
+        este = min(oeste + tam_celda, 180)
+        if este - oeste + 2 * dlon >= 360:
+            vecinas = range(columnas)
+        else:
+            vecinas = set(columnas_entre(oeste - dlon, este + dlon, tam_celda, columnas))
+    for f in (fila - 1, fila, fila + 1):
+        for c in vecinas:
+            vecina = (f, c)
+            if vecina in celdas:
+                yield vecina
+
+
+def _vecinos_celda(rejilla, celda):
+    '''Devuelve las posiciones de los avistamientos de la celda y, para cada
+    uno, un array con las posiciones de sus vecinos'''
+    latitudes, longitudes, tiempos, lat_rad, lon_rad, cosenos, radio, ventana, _, _, celdas = rejilla
+    # Candidatos de todas las celdas vecinas, ordenados por tiempo: los que están
+    # dentro de la ventana de tiempo de cada avistamiento son un tramo contiguo
+    candidatos = array('l')
+    for vecina in _celdas_vecinas(rejilla, celda):
+        candidatos.extend(celdas[vecina])
+    candidatos = array('l', sorted(candidatos, key=tiempos.__getitem__))
+    tiempos_candidatos = array('q', map(tiempos.__getitem__, candidatos))
+    lat_candidatos = array('d', map(lat_rad.__getitem__, candidatos))
+    lon_candidatos = array('d', map(lon_rad.__getitem__, candidatos))
+    cos_candidatos = array('d', map(cosenos.__getitem__, candidatos))
+    res = []
+    for i in celdas[celda]:
+        desde = bisect_left(tiempos_candidatos, tiempos[i] - ventana)
+        hasta = bisect_right(tiempos_candidatos, tiempos[i] + ventana, desde)
+        lote = LoteCoordenadas(lat_candidatos[desde:hasta], lon_candidatos[desde:hasta],
+                               cos_candidatos[desde:hasta])
+        distancias = distancias_haversine_lote(Coordenadas(latitudes[i], longitudes[i]), lote)
+        res.append(array('l', compress(candidatos[desde:hasta], map(radio.__gt__, distancias))))
+    return celdas[celda], res
+
+
+def _vecinos_celdas(rejilla, bloque):
+    return [_vecinos_celda(rejilla, celda) for celda in bloque]
+
+
+def _inicia_proceso(rejilla):
+    global _rejilla_proceso
+    _rejilla_proceso = rejilla
+
+
+def _vecinos_celdas_proceso(bloque):
+    return _vecinos_celdas(_rejilla_proceso, bloque)
+
+
+def busca_vecinos(latitudes, longitudes, tiempos, radio, ventana, procesos=None):
+    '''
+    Devuelve los vecinos de cada punto: los que están a menos de radio km y
+    cuyo tiempo se diferencia como mucho en ventana segundos (incluido él mismo).
+
+    @param latitudes: latitudes de los puntos, en grados
+    @type latitudes: array('d')
+    @param longitudes: longitudes de los puntos, en grados
+    @type longitudes: array('d')
+    @param tiempos: tiempos de los puntos, en segundos
+    @type tiempos: array('q')
+    @param radio: distancia máxima, en kilómetros
+    @type radio: float
+    @param ventana: diferencia de tiempo máxima, en segundos
+    @type ventana: int
+    @param procesos: número de procesos. Si es None, uno por núcleo; si es 1, no se crean procesos
+    @type procesos: int, optional
+    @return: lista con un array de posiciones de vecinos por punto
+    @rtype: [array('l')]
+    '''
+    if radio <= 0 or ventana <= 0:
+        raise ValueError("El radio y la ventana deben ser positivos")
+    rejilla = _prepara(latitudes, longitudes, tiempos, float(radio), ventana)
+    celdas = list(rejilla.celdas)
+    procesos = procesos or os.cpu_count() or 1
+    vecinos = [None] * len(latitudes)
+    if procesos == 1 or len(celdas) < 2:
+        resultados = [_vecinos_celdas(rejilla, celdas)]
+    else:
+        # Bloques pequeños para repartir bien las celdas más pobladas
+        tam_bloque = max(1, len(celdas) // (procesos * 8))
+        bloques = [celdas[i:i + tam_bloque] for i in range(0, len(celdas), tam_bloque)]
+        with ProcessPoolExecutor(procesos, initializer=_inicia_proceso, initargs=(rejilla,)) as ejecutor:
+            resultados = list(ejecutor.map(_vecinos_celdas_proceso, bloques))
+    for resultado in resultados:
+        for posiciones, vecinos_celda in resultado:
+            for i, v in zip(posiciones, vecinos_celda):
+                vecinos[i] = v
+    return vecinos
+
+
+## Agrupamiento
+def _expande(vecinos, min_avistamientos):
+    '''Asigna una oleada a cada punto a partir de sus vecinos (DBSCAN)'''
+    etiquetas = array('l', repeat(RUIDO, len(vecinos)))
+    central = [len(v) >= min_avistamientos for v in vecinos]
+    siguiente = 0
+    for i in range(len(vecinos)):
+        if etiquetas[i] != RUIDO or not central[i]:
+            continue
+        etiquetas[i] = siguiente
+        pendientes = deque([i])
+        while pendientes:
+            j = pendientes.popleft()
+            for k in vecinos[j]:
+                if etiquetas[k] == RUIDO:
+                    etiquetas[k] = siguiente
+                    if central[k]:
+                        pendientes.append(k)
+        siguiente += 1
+    return etiquetas, siguiente
+
+
+def _resume(avistamientos, etiquetas, numero):
+    contadores = [0] * numero
+    # Las longitudes se promedian como ángulos, sumando sus senos y cosenos: la
+    # media de 179.9 y -179.9 es 180, no 0
+    sumas_lat, sumas_sen, sumas_cos = [0.0] * numero, [0.0] * numero, [0.0] * numero
+    inicios, fines = [None] * numero, [None] * numero
+    formas = [Counter() for _ in range(numero)]
+    for a, e in zip(avistamientos, etiquetas):
+        if e == RUIDO:
+            continue
+        contadores[e] += 1
+        sumas_lat[e] += a.coordenadas.latitud
+        longitud = radians(a.coordenadas.longitud)
+        sumas_sen[e] += sin(longitud)
+        sumas_cos[e] += cos(longitud)
+        if inicios[e] is None or a.fechahora < inicios[e]:
+            inicios[e] = a.fechahora
+        if fines[e] is None or a.fechahora > fines[e]:
+            fines[e] = a.fechahora
+        formas[e][a.forma] += 1
+    return [ResumenOleada(e, n, Coordenadas(sumas_lat[e] / n, degrees(atan2(sumas_sen[e], sumas_cos[e]))),
+                          inicios[e], fines[e], formas[e].most_common(1)[0][0])
+            for e, n in enumerate(contadores)]
+
+
+def detecta_oleadas(avistamientos, radio=50, ventana_dias=3, min_avistamientos=5, procesos=None):
+    '''
+    Agrupa los avistamientos en oleadas de avistamientos cercanos en el
+    espacio y en el tiempo.
+
+    @param avistamientos: avistamientos
+    @type avistamientos: [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
+    @param radio: distancia máxima entre vecinos, en kilómetros
+    @type radio: float, optional
+    @param ventana_dias: diferencia máxima entre las fechas y horas de dos vecinos, en periodos
+        de 24 horas (ventana deslizante, no días del calendario)
+    @type ventana_dias: float, optional
+    @param min_avistamientos: número mínimo de vecinos (incluido él mismo) de un avistamiento central
+    @type min_avistamientos: int, optional
+    @param procesos: número de procesos para la búsqueda de vecinos. Si es None, uno por núcleo
+    @type procesos: int, optional
+    @return: oleada de cada avistamiento y resumen de cada oleada
+    @rtype: Oleadas(array('l'), [ResumenOleada(int, int, Coordenadas(float, float), datetime, datetime, str)])
+    '''
+    avistamientos = list(avistamientos)
+    latitudes = array('d', (a.coordenadas.latitud for a in avistamientos))
+    longitudes = array('d', (a.coordenadas.longitud for a in avistamientos))
+    tiempos = array('q', (a_epoca(a.fechahora) for a in avistamientos))
+    vecinos = busca_vecinos(latitudes, longitudes, tiempos, radio,
+                            max(1, round(ventana_dias * SEGUNDOS_DIA)), procesos)
+    etiquetas, numero = _expande(vecinos, min_avistamientos)
+    return Oleadas(etiquetas, _resume(avistamientos, etiquetas, numero))
@@ -2,8 +2,11 @@
 Módulo que contiene funciones para conversión de tipos
 '''
 from datetime import datetime
+from functools import lru_cache
+from instrumentacion import instrumentado
 
 
+@instrumentado(filas='llamada')
 def parse_datetime(cadena, formato = '%d/%m/%Y-%H:%M:%S'):
     '''Función que convierte una cadena con fecha y hora a un objeto datetime
 
@@ -16,3 +19,40 @@ def parse_datetime(cadena, formato = '%d/%m/%Y-%H:%M:%S'):
     '''
     return datetime.strptime(cadena, formato)
 
+
+@instrumentado(filas='llamada')
+def parse_fecha_hora_mdy(cadena):
+    '''Función que convierte una cadena con el formato '%m/%d/%Y %H:%M' a un objeto datetime
+    sin pasar por strptime, troceando la cadena directamente. Si la cadena no tiene
+    exactamente ese formato, se recurre a datetime.strptime, que es quien decide si
+    es válida o no.
+
+    @param cadena: Cadena con la fecha y la hora, por ejemplo '07/04/2011 22:00'
+    @type cadena: str
+    @return: objeto fecha-hora
+    @rtype: datetime.datetime
+    '''
+    try:
+        fecha, hora = cadena.split(' ')
+        mes, dia, año = fecha.split('/')
+        horas, minutos = hora.split(':')
+        if len(año) == 4 and len(mes) <= 2 and len(dia) <= 2 and len(horas) <= 2 \
+                and len(minutos) <= 2 and (mes + dia + año + horas + minutos).isdigit():
+            return datetime(int(año), int(mes), int(dia), int(horas), int(minutos))
+    except ValueError:
+        pass
+    return datetime.strptime(cadena, '%m/%d/%Y %H:%M')
+
+
+@lru_cache(maxsize=1 << 16)
+def parse_fecha_hora_mdy_memo(cadena):
+    '''Igual que parse_fecha_hora_mdy, pero recuerda las cadenas ya convertidas.
+    En los ficheros de avistamientos se repiten mucho las fechas (varios avistamientos
+    en la misma fecha y hora), así que la mayoría de las llamadas no parsean nada.
+
+    @param cadena: Cadena con la fecha y la hora, por ejemplo '07/04/2011 22:00'
+    @type cadena: str
+    @return: objeto fecha-hora
+    @rtype: datetime.datetime
+    '''
+    return parse_fecha_hora_mdy(cadena)
@@ -0,0 +1,387 @@
+'''
+Módulo servicio_avistamientos
+Servicio local (asyncio) que carga los avistamientos una sola vez y responde
+consultas de avistamientos.py, para no pagar el coste de la carga en cada una.
+
+Protocolo: JSON por líneas sobre TCP. Cada petición es una línea con un objeto
+    {"id": 1, "consulta": "avistamientos_fechas",
+     "args": {"fecha_inicial": "2005-05-01", "fecha_final": "2005-05-31"}}
+y cada respuesta es una línea {"id": 1, "resultado": ...} o {"id": 1, "error": "..."}.
+Las peticiones de una misma conexión se atienden a la vez, así que las
+respuestas pueden llegar en otro orden; el id sirve para emparejarlas. La
+consulta "consultas" devuelve las consultas disponibles y sus parámetros.
+
+Las fechas se escriben como "AAAA-MM-DD", las coordenadas como [latitud, longitud]
+y los conjuntos como listas. Las consultas que pueden usar un índice (por fecha,
+espacial, de comentarios o de categorías) o el cubo de avistamientos se
+resuelven con él en un hilo; las que recorren todos los avistamientos se envían
+a un conjunto de procesos, cada uno con su copia de los datos (cargada con la
+caché en disco de cache_avistamientos).
+Los resultados se guardan en una caché, y si llegan a la vez varias peticiones
+iguales se calculan una sola vez.
+
+Se ejecuta como script: python servicio_avistamientos.py fichero [--puerto 8765] [--procesos N]
+'''
+import argparse
+import asyncio
+import json
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+import avistamientos
+import avistamientos_columnar
+import cache_avistamientos
+import cubo_avistamientos
+import indice_categorias
+import indice_comentarios
+import indice_espacial
+import indice_fechas
+from coordenadas import Coordenadas
+
+## Definición de tipos
+# funcion: función de avistamientos.py
+# parametros: diccionario {nombre del parámetro: función que convierte el valor JSON}
+# indice: tipo de índice que acepta la función ('fechas', 'espacial', 'comentarios', 'categorias'
+#     o 'cubo', que se pasa en el parámetro cubo en lugar de indice)
+#     o None si hay que recorrer todos los avistamientos
+Consulta = namedtuple('Consulta', 'funcion, parametros, indice')
+
+PUERTO = 8765
+TAM_CACHE = 256
+
+
+def _fecha(valor):
+    return date.fromisoformat(valor)
+
+
+def _coordenadas(valor):
+    if isinstance(valor, dict):
+        return Coordenadas(float(valor['latitud']), float(valor['longitud']))
+    return Coordenadas(*map(float, valor))
+
+
+CONSULTAS = {
+    'numero_avistamientos_fecha': Consulta(avistamientos.numero_avistamientos_fecha,
+                                           {'fecha': _fecha}, 'fechas'),
+    'avistamientos_fechas': Consulta(avistamientos.avistamientos_fechas,
+                                     {'fecha_inicial': _fecha, 'fecha_final': _fecha}, 'fechas'),
+    'avistamientos_cercanos_ubicacion': Consulta(avistamientos.avistamientos_cercanos_ubicacion,
+                                                 {'ubicacion': _coordenadas, 'radio': float},
+                                                 'espacial'),
+    'avistamiento_cercano_mayor_duracion': Consulta(avistamientos.avistamiento_cercano_mayor_duracion,
+                                                    {'coordenadas': _coordenadas, 'radio': float},
+                                                    'espacial'),
+    'comentario_mas_largo': Consulta(avistamientos.comentario_mas_largo,
+                                     {'anyo': int, 'palabra': str}, 'comentarios'),
+    'formas_estados': Consulta(avistamientos.formas_estados, {'estados': set}, 'categorias'),
+    'duracion_total': Consulta(avistamientos.duracion_total, {'estado': str}, 'categorias'),
+    'avistamiento_mayor_duracion': Consulta(avistamientos.avistamiento_mayor_duracion,
+                                            {'forma': str}, 'categorias'),
+    'año_mas_avistamientos_forma': Consulta(avistamientos.año_mas_avistamientos_forma,
+                                            {'forma': str}, 'categorias'),
+    'media_dias_entre_avistamientos': Consulta(avistamientos.media_dias_entre_avistamientos,
+                                               {'anyo': int}, None),
+    'formas_por_mes': Consulta(avistamientos.formas_por_mes, {}, 'cubo'),
+    'numero_avistamientos_por_año': Consulta(avistamientos.numero_avistamientos_por_año, {}, 'cubo'),
+    'num_avistamientos_por_mes': Consulta(avistamientos.num_avistamientos_por_mes, {}, 'cubo'),
+    'coordenadas_mas_avistamientos': Consulta(avistamientos.coordenadas_mas_avistamientos, {}, None),
+    'hora_mas_avistamientos': Consulta(avistamientos.hora_mas_avistamientos, {}, 'cubo'),
+    'longitud_media_comentarios_por_estado':
+        Consulta(avistamientos.longitud_media_comentarios_por_estado, {}, None),
+    'avistamientos_mayor_duracion_por_estado':
+        Consulta(avistamientos.avistamientos_mayor_duracion_por_estado, {'n': int}, None),
+    'estados_mas_avistamientos': Consulta(avistamientos.estados_mas_avistamientos, {'n': int}, None),
+    'duracion_total_avistamientos_año': Consulta(avistamientos.duracion_total_avistamientos_año,
+                                                 {'estado': str}, 'cubo'),
+    'resumen_avistamientos': Consulta(avistamientos.resumen_avistamientos, {}, None),
+}
+
+
+## Conversión a JSON
+def _clave_json(clave):
+    if isinstance(clave, Coordenadas):
+        return f"{clave.latitud},{clave.longitud}"
+    if isinstance(clave, (date, datetime)):
+        return clave.isoformat()
+    return clave if isinstance(clave, str) else str(clave)
+
+
+def a_json(valor):
+    '''
+    Convierte el resultado de una consulta en un valor que se puede escribir en JSON.
+    Los avistamientos se convierten en objetos con un campo por atributo, las fechas
+    en cadenas ISO, los conjuntos en listas ordenadas y las claves de los
+    diccionarios en cadenas.
+
+    @param valor: resultado de una consulta
+    @return: valor equivalente formado por dict, list, str, int, float, bool y None
+    '''
+    if isinstance(valor, Coordenadas):
+        return [valor.latitud, valor.longitud]
+    if hasattr(valor, '_fields'):
+        return {campo: a_json(v) for campo, v in zip(valor._fields, valor)}
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    if isinstance(valor, dict):
+        return {_clave_json(k): a_json(v) for k, v in valor.items()}
+    if isinstance(valor, (set, frozenset)):
+        try:
+            valor = sorted(valor)
+        except TypeError:
+            valor = list(valor)
+    if isinstance(valor, (list, tuple)):
+        return [a_json(v) for v in valor]
+    return valor
+
+
+## Datos de los procesos
+def carga_datos(fichero):
+    '''
+    Carga los avistamientos del fichero en una lista, usando la caché en disco.
+
+    @param fichero: ruta del fichero csv de avistamientos
+    @type fichero: str
+    @return: lista de avistamientos
+    @rtype: [Avistamiento(datetime, str, str, str, int, str, Coordenadas(float, float))]
+    '''
+    return list(avistamientos_columnar.avistamientos(cache_avistamientos.lee_avistamientos_cacheado(fichero)))
+
+
+_datos_proceso = None
+
+
+def _inicia_proceso(fichero):
+    global _datos_proceso
+    _datos_proceso = carga_datos(fichero)
+
+
+def _ejecuta_en_proceso(nombre, args):
+    return a_json(CONSULTAS[nombre].funcion(_datos_proceso, **args))
+
+
+def convierte_args(nombre, args):
+    '''
+    Comprueba los argumentos JSON de una consulta y los convierte a los tipos de Python.
+
+    @param nombre: nombre de la consulta
+    @type nombre: str
+    @param args: argumentos de la petición
+    @type args: {str: object}
+    @return: argumentos convertidos
+    @rtype: {str: object}
+    @raise ValueError: si la consulta no existe o algún argumento no es válido
+    '''
+    consulta = CONSULTAS.get(nombre)
+    if consulta is None:
+        raise ValueError(f"Consulta desconocida: {nombre}")
+    sobrantes = set(args) - set(consulta.parametros)
+    if sobrantes:
+        raise ValueError(f"Parámetros desconocidos para {nombre}: {sorted(sobrantes)}")
+    try:
+        return {p: consulta.parametros[p](v) for p, v in args.items()}
+    except (TypeError, ValueError, KeyError) as e:
+        raise ValueError(f"Argumentos no válidos para {nombre}: {e}") from None
+
+
+class ServicioAvistamientos:
+    '''
+    Servicio de consultas sobre los avistamientos de un fichero.
+
+    Atributos:
+        fichero: ruta del fichero csv de avistamientos
+        datos: lista de avistamientos cargados
+        indices: diccionario {tipo de índice: índice} construidos sobre datos
+        peticiones: número de peticiones atendidas
+        aciertos_cache: número de peticiones resueltas con la caché
+    '''
+
+    def __init__(self, fichero, procesos=None, tam_cache=TAM_CACHE):
+        '''
+        @param fichero: ruta del fichero csv de avistamientos
+        @type fichero: str
+        @param procesos: número de procesos para las consultas que recorren todos los
+             avistamientos. Si es None, uno por CPU; si es 0, se ejecutan en hilos
+        @type procesos: int, optional
+        @param tam_cache: número máximo de resultados guardados
+        @type tam_cache: int, optional
+        '''
+        self.fichero = fichero
+        self.procesos = procesos
+        self.tam_cache = tam_cache
+        self.datos = carga_datos(fichero)
+        self.indices = {
+            'fechas': indice_fechas.crea_indice_fechas(self.datos),
+            'espacial': indice_espacial.crea_indice_espacial(self.datos),
+            'comentarios': indice_comentarios.crea_indice_comentarios(self.datos),
+            'categorias': indice_categorias.crea_indice_categorias(self.datos),
+            'cubo': cubo_avistamientos.crea_cubo(self.datos),
+        }
+        self.peticiones = 0
+        self.aciertos_cache = 0
+        self._cache = OrderedDict()
+        self._ejecutor = None
+        self._servidor = None
+        self._conexiones = set()
+
+    ## Ejecución de consultas
+    def _ejecutor_procesos(self):
+        if self._ejecutor is None and self.procesos != 0:
+            self._ejecutor = ProcessPoolExecutor(self.procesos, initializer=_inicia_proceso,
+                                                 initargs=(self.fichero,))
+        return self._ejecutor
+
+    def _ejecuta_con_indice(self, nombre, args):
+        consulta = CONSULTAS[nombre]
+        parametro = 'cubo' if consulta.indice == 'cubo' else 'indice'
+        return a_json(consulta.funcion(self.datos, **{parametro: self.indices[consulta.indice]}, **args))
+
+    def _ejecuta_en_hilo(self, nombre, args):
+        return a_json(CONSULTAS[nombre].funcion(self.datos, **args))
+
+    async def _calcula(self, nombre, args):
+        bucle = asyncio.get_running_loop()
+        if CONSULTAS[nombre].indice is not None:
+            return await bucle.run_in_executor(None, self._ejecuta_con_indice, nombre, args)
+        ejecutor = self._ejecutor_procesos()
+        if ejecutor is None:
+            return await bucle.run_in_executor(None, self._ejecuta_en_hilo, nombre, args)
+        return await bucle.run_in_executor(ejecutor, _ejecuta_en_proceso, nombre, args)
+
+    async def ejecuta(self, nombre, args=None):
+        '''
+        Ejecuta una consulta, o devuelve su resultado de la caché.
+
+        @param nombre: nombre de la consulta (ver CONSULTAS)
+        @type nombre: str
+        @param args: argumentos de la consulta en formato JSON
+        @type args: {str: object}, optional
+        @return: resultado de la consulta convertido con a_json
+        @raise ValueError: si la consulta o los argumentos no son válidos
+        '''
+        args = args or {}
+        self.peticiones += 1
+        if nombre == 'consultas':
+            return {n: sorted(c.parametros) for n, c in CONSULTAS.items()}
+        convertidos = convierte_args(nombre, args)
+        clave = (nombre, json.dumps(args, sort_keys=True))
+        futuro = self._cache.get(clave)
+        if futuro is not None:
+            self.aciertos_cache += 1
+            self._cache.move_to_end(clave)
+        else:
+            futuro = asyncio.ensure_future(self._calcula(nombre, convertidos))
+            self._cache[clave] = futuro
+            if len(self._cache) > self.tam_cache:
+                self._cache.popitem(last=False)
+        try:
+            return await asyncio.shield(futuro)
+        except Exception:
+            # Los errores no se guardan en la caché
+            if self._cache.get(clave) is futuro:
+                del self._cache[clave]
+            raise
+
+    ## Servidor
+    async def _atiende_peticion(self, linea, escritor, cerrojo):
+        id_peticion = None
+        try:
+            peticion = json.loads(linea)
+            id_peticion = peticion.get('id')
+            respuesta = {'id': id_peticion,
+                         'resultado': await self.ejecuta(peticion['consulta'], peticion.get('args'))}
+        except Exception as e:
+            respuesta = {'id': id_peticion, 'error': f"{type(e).__name__}: {e}"}
+        async with cerrojo:
+            escritor.write(json.dumps(respuesta, ensure_ascii=False).encode('utf-8') + b'\n')
+            await escritor.drain()
+
+    async def _atiende_conexion(self, lector, escritor):
+        cerrojo = asyncio.Lock()
+        tareas = set()
+        self._conexiones.add(asyncio.current_task())
+        try:
+            while linea := await lector.readline():
+                if linea.strip():
+                    tarea = asyncio.create_task(self._atiende_peticion(linea, escritor, cerrojo))
+                    tareas.add(tarea)
+                    tarea.add_done_callback(tareas.discard)
+            if tareas:
+                await asyncio.gather(*tareas)
+        except (ConnectionError, asyncio.CancelledError):
+            for tarea in tareas:
+                tarea.cancel()
+        finally:
+            self._conexiones.discard(asyncio.current_task())
+            escritor.close()
+
+    async def inicia(self, host='127.0.0.1', puerto=PUERTO):
+        '''
+        Empieza a aceptar conexiones. Con puerto 0 se elige un puerto libre.
+
+        @return: puerto en el que escucha el servicio
+        @rtype: int
+        '''
+        self._ejecutor_procesos()
+        self._servidor = await asyncio.start_server(self._atiende_conexion, host, puerto,
+                                                    limit=1 << 20)
+        return self._servidor.sockets[0].getsockname()[1]
+
+    async def cierra(self):
+        '''Deja de aceptar conexiones y termina los procesos'''
+        if self._servidor is not None:
+            self._servidor.close()
+            for conexion in list(self._conexiones):
+                conexion.cancel()
+            await asyncio.gather(*self._conexiones, return_exceptions=True)
+            await self._servidor.wait_closed()
+        if self._ejecutor is not None:
+            self._ejecutor.shutdown()
+            self._ejecutor = None
+
+
+## Cliente
+async def pide(consulta, args=None, host='127.0.0.1', puerto=PUERTO):
+    '''
+    Envía una petición al servicio y devuelve el resultado.
+
+    @param consulta: nombre de la consulta
+    @type consulta: str
+    @param args: argumentos de la consulta en formato JSON
+    @type args: {str: object}, optional
+    @return: resultado de la consulta
+    @raise RuntimeError: si el servicio responde con un error
+    '''
+    lector, escritor = await asyncio.open_connection(host, puerto, limit=1 << 26)
+    try:
+        escritor.write(json.dumps({'id': 0, 'consulta': consulta, 'args': args or {}}).encode('utf-8')
+                       + b'\n')
+        await escritor.drain()
+        respuesta = json.loads(await lector.readline())
+    finally:
+        escritor.close()
+    if 'error' in respuesta:
+        raise RuntimeError(respuesta['error'])
+    return respuesta['resultado']
+
+
+async def _sirve(fichero, host, puerto, procesos):
+    servicio = ServicioAvistamientos(fichero, procesos)
+    puerto = await servicio.inicia(host, puerto)
+    print(f"Sirviendo {len(servicio.datos)} avistamientos en {host}:{puerto}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await servicio.cierra()
+
+
+if __name__ == "__main__":
+    analizador = argparse.ArgumentParser(description='Servicio de consultas de avistamientos')
+    analizador.add_argument('fichero')
+    analizador.add_argument('--host', default='127.0.0.1')
+    analizador.add_argument('--puerto', type=int, default=PUERTO)
+    analizador.add_argument('--procesos', type=int, default=None)
+    args = analizador.parse_args()
+    try:
+        asyncio.run(_sirve(args.fichero, args.host, args.puerto, args.procesos))
+    except KeyboardInterrupt:
+        pass